@@ -18,7 +18,9 @@ from .resources import (
     Specimen,
 )
 from .ingest import convert_data_to_flat
+from .join import iter_subjects, join_flat
+from .reader import read_flat
 
 # Update this when bumping version in pyproject.toml!
 __version__ = "0.1.0"
-__all__ = ["convert_data_to_flat"]
+__all__ = ["convert_data_to_flat", "iter_subjects", "join_flat", "read_flat"]
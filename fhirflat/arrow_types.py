@@ -0,0 +1,150 @@
+"""
+Arrow types for FHIRflat columns, worked out from the FHIR types of the fields each
+column is flattened from, so that files written from different batches or sites
+store the same column with the same type.
+
+Dates and dateTimes are stored as ISO strings, as they can be partial ("2012-09")
+or date-only, while instants are always complete and are stored as UTC timestamps.
+
+Only columns whose values always have the same shape get a fixed type. Columns
+are left to pyarrow to infer when:
+
+- they hold times
+- they come from a list nested inside another list, which holds a single value or
+  a list depending on the data
+- they are the text of a codeableConcept, a list of displays or a single string,
+  or other `.code` and `.text` columns, which ingestion stores as lists
+- they are `_dense` columns
+"""
+
+from __future__ import annotations
+
+import datetime
+import decimal
+import functools
+
+import pyarrow as pa
+from pydantic.v1.fields import SHAPE_LIST, SHAPE_SINGLETON
+
+from .resources.extension_types import ExtensionUnion
+
+
+def _primitive_type(type_: type) -> pa.DataType | None:
+    "The Arrow type of a primitive FHIR field, or None if it can't be fixed."
+    if not isinstance(type_, type):
+        return None
+    if issubclass(type_, datetime.datetime) and type_.__name__ == "Instant":
+        return pa.timestamp("us", tz="UTC")
+    if issubclass(type_, datetime.date):
+        # dates and dateTimes, which can be partial
+        return pa.string()
+    if issubclass(type_, datetime.time):
+        return None
+    if issubclass(type_, bool) or type_.__name__ == "Boolean":
+        return pa.bool_()
+    if issubclass(type_, int):
+        return pa.int64()
+    if issubclass(type_, (float, decimal.Decimal)):
+        return pa.float64()
+    if issubclass(type_, str):
+        return pa.string()
+    return None
+
+
+@functools.cache
+def _fields(klass) -> dict:
+    return {f.alias: f for f in klass.__fields__.values()}
+
+
+def _model_class(type_):
+    from .util import get_fhirtype
+
+    try:
+        return get_fhirtype(type_.__resource_type__)
+    except AttributeError:
+        return None
+
+
+def _extensions(klass):
+    "The `ExtensionUnion` of the extensions of a model class, if it has one."
+    field = _fields(klass).get("extension")
+    if field is not None and issubclass(field.type_, ExtensionUnion):
+        return field.type_
+    return None
+
+
+def _path_type(klass, parts: list[str], top: bool) -> pa.DataType | None:
+    "The type of the column found by following `parts` from a model class."
+    field = _fields(klass).get(parts[0])
+    if field is None:
+        # the url of an extension, e.g. "_occurrenceDateTime.approximateDate"
+        extensions = _extensions(klass)
+        return _value_type(extensions, parts) if extensions else None
+
+    if field.shape == SHAPE_LIST:
+        # single items of top level lists are flattened, longer lists are _dense
+        if not (top or issubclass(field.type_, ExtensionUnion)):
+            return None
+    elif field.shape != SHAPE_SINGLETON:
+        return None
+    return _value_type(field.type_, parts[1:])
+
+
+def _value_type(type_, rest: list[str]) -> pa.DataType | None:
+    "The type of the column found by following `rest` from a field type."
+    if isinstance(type_, type) and issubclass(type_, ExtensionUnion):
+        if not rest:
+            return None
+        by_url = type_.lookup()[0]
+        if rest[0] not in by_url:
+            return None
+        return _extension_type(_model_class(by_url[rest[0]]), rest[1:])
+
+    resource_type = getattr(type_, "__resource_type__", None)
+    if resource_type is None:
+        return _primitive_type(type_) if not rest else None
+    if resource_type == "Reference":
+        return pa.string() if rest in ([], ["reference"]) else None
+    if resource_type == "CodeableConcept":
+        return pa.list_(pa.string()) if rest == ["code"] else None
+
+    klass = _model_class(type_)
+    if klass is None or not rest:
+        return None
+    if "url" in _fields(klass) and any(a.startswith("value") for a in _fields(klass)):
+        return _extension_type(klass, rest)
+    return _path_type(klass, rest, top=False)
+
+
+def _extension_type(klass, rest: list[str]) -> pa.DataType | None:
+    """
+    The type of an extension column. Simple extensions are flattened without the name
+    of their value[x] field, and complex ones without their `extension` label.
+    """
+    if klass is None:
+        return None
+    fields = _fields(klass)
+    if rest and rest[0] not in fields and _extensions(klass):
+        return _path_type(klass, rest, top=False)
+
+    types = {
+        _value_type(f.type_, rest) for a, f in fields.items() if a.startswith("value")
+    }
+    return types.pop() if len(types) == 1 else None
+
+
+@functools.cache
+def column_type(resource, column: str) -> pa.DataType | None:
+    """
+    The Arrow type of a FHIRflat column of a resource class, or None if it is left
+    to pyarrow to infer from the data.
+    """
+    if column == "resourceType":
+        return pa.string()
+    if column.endswith("_dense"):
+        return None
+    type_ = _path_type(resource, column.split("."), top=True)
+    if type_ == pa.string() and column.endswith((".code", ".text")):
+        # ingestion stores these as lists, like the codes of codeableConcepts
+        return None
+    return type_
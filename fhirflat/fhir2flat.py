@@ -4,6 +4,7 @@ Convert FHIR resources as JSON files to FHIRflat CSV files.
 
 from __future__ import annotations
 
+from collections.abc import Iterable
 from typing import TYPE_CHECKING
 
 import pandas as pd
@@ -12,6 +13,13 @@ if TYPE_CHECKING:
     from .resources.base import FHIRFlatBase  # pragma: no cover
 
 
+class _UnsupportedStructure(Exception):
+    """
+    Raised by `flatten_resource` for structures it doesn't reproduce, which are
+    flattened with `fhir2flat` instead.
+    """
+
+
 def flatten_column(
     data: pd.DataFrame | pd.Series, column_name: str
 ) -> pd.DataFrame | pd.Series:
@@ -302,3 +310,249 @@ def fhir2flat(resource: FHIRFlatBase, lists: list | None = None) -> pd.DataFrame
         df = condenseSystem(df, col)
 
     return df
+
+
+# Flattening a resource straight to a FHIRflat row ---------------------------------
+#
+# The functions below follow the same steps as `fhir2flat`, but work on the
+# dictionary of a single resource instead of a one-row DataFrame.
+
+
+def _normalize(data: dict, prefix: str = "") -> dict:
+    """
+    Flattens nested dictionaries into dotted keys, in the same order as
+    `pd.json_normalize`: top level values first, then the nested dictionaries.
+    """
+
+    def nested(d: dict, key: str, out: dict) -> dict:
+        for k, v in d.items():
+            new_key = f"{key}.{k}" if key else k
+            if isinstance(v, dict):
+                nested(v, new_key, out)
+            else:
+                out[new_key] = v
+        return out
+
+    flat = {prefix + k: v for k, v in data.items() if not isinstance(v, dict)}
+    nested_keys = {k: v for k, v in data.items() if isinstance(v, dict)}
+    for k, v in nested(nested_keys, "", {}).items():
+        flat[prefix + k] = v
+    return flat
+
+
+def _replace_key(row: dict, key: str, new: dict) -> dict:
+    "Replaces `key` in the row with the items of `new`, keeping the column order."
+    result = {}
+    for k, v in row.items():
+        if k == key:
+            result.update(new)
+        else:
+            result[k] = v
+    return result
+
+
+def _explode_and_flatten_row(row: dict, list_cols: list[str]) -> dict:
+    "Dictionary equivalent of `explode_and_flatten`."
+
+    for col in list_cols:
+        if len(row[col]) > 1:
+            row = _replace_key(row, col, {col + "_dense": row[col]})
+        elif not row[col]:
+            # empty lists are exploded to NaN, which isn't reproduced here
+            raise _UnsupportedStructure("Empty list in resource")
+        else:
+            (value,) = row[col]
+            flat = _normalize(value, col + ".") if isinstance(value, dict) else {}
+            row = _replace_key(row, col, flat or {col: value})
+
+    new_list_cols = [
+        k
+        for k, v in row.items()
+        if (
+            isinstance(v, list)
+            and not k.endswith("coding")
+            and not k.endswith("extension")
+            and not k.endswith("_dense")
+        )
+    ]
+    if new_list_cols:
+        row = _explode_and_flatten_row(row, new_list_cols)
+    return row
+
+
+def _is_missing(x) -> bool:
+    return isinstance(x, float) and x != x
+
+
+def _unique(values: list) -> list:
+    "Unique values in order, comparing by equality as values may be unhashable."
+    unique: list = []
+    for v in values:
+        if _is_missing(v):
+            if not any(_is_missing(u) for u in unique):
+                unique.append(v)
+        elif not any(not _is_missing(u) and u == v for u in unique):
+            unique.append(v)
+    return unique
+
+
+def _implode_values(values: list):
+    """
+    Combines the values of one column across the rows of an exploded extension, as
+    `implode` does: a single value if they agree, otherwise a list.
+    """
+    present = [v for v in values if not _is_missing(v)]
+    if len(present) < len(values) and all(
+        isinstance(v, int) and not isinstance(v, bool) for v in present
+    ):
+        # pandas holds integers alongside missing values as floats
+        present = [float(v) for v in present]
+    if any(isinstance(v, list) for v in values):
+        unique = _unique(values)
+        if len(unique) == 1:
+            return unique[0]
+        elif len(_unique(present)) == 1:
+            return present[0]
+        return values
+    return present[0] if len(_unique(present)) == 1 else present
+
+
+def _flatten_extension(extension: str, ext: dict) -> tuple[dict, bool]:
+    """
+    Flattens a single extension from the list held in the `extension` column.
+    Also returns whether nested extensions left the columns sorted, see
+    `_implode_rows`.
+    """
+    name = extension.removesuffix(".extension") + "." + ext["url"]
+
+    if "extension" in ext:
+        return _implode_rows([_flatten_extension(name, e) for e in ext["extension"]])
+
+    value_key = next((key for key in ext if key.startswith("value")), None)
+    if value_key is None:
+        raise _UnsupportedStructure("Extension does not contain a value")
+    value = ext[value_key]
+    if isinstance(value, dict):
+        return _normalize(value, name + ".") or {name: value}, False
+    return {name: value}, False
+
+
+def _implode_rows(rows: list[tuple[dict, bool]]) -> tuple[dict, bool]:
+    """
+    Combines flattened extensions into one set of columns. When the extensions
+    give different columns, pandas sorts the columns of the whole row as it
+    combines them, which is recorded so the row can be sorted in the same way.
+    """
+    keys = list(dict.fromkeys(k for r, _ in rows for k in r))
+    values = {
+        k: _implode_values([r.get(k, float("nan")) for r, _ in rows]) for k in keys
+    }
+    sort = any(s for _, s in rows) or any(list(r) != list(rows[0][0]) for r, _ in rows)
+    return values, sort
+
+
+def _flatten_extensions_row(row: dict, extension: str) -> dict:
+    "Dictionary equivalent of `flattenExtensions`."
+    exts = row[extension]
+    if not isinstance(exts, list) or not exts:
+        raise _UnsupportedStructure("Extensions must be a non-empty list")
+    flat, sort = _implode_rows([_flatten_extension(extension, e) for e in exts])
+    row = {k: v for k, v in row.items() if k != extension}
+    row.update(flat)
+    return dict(sorted(row.items())) if sort else row
+
+
+def _expand_coding_row(row: dict, column_name: str) -> dict:
+    "Dictionary equivalent of `expandCoding`."
+    base = column_name.removesuffix(".coding")
+    codes = []
+    names = []
+    for c in row[column_name]:
+        if c.get("code") and c.get("system"):
+            codes.append(c.get("system") + "|" + c.get("code"))
+        names.append(c.get("display"))
+
+    new = {base + ".code": codes}
+    if base + ".text" not in row:
+        new[base + ".text"] = names
+    return _replace_key(row, column_name, new)
+
+
+def _condense_reference_row(row: dict, reference: str) -> dict:
+    "Dictionary equivalent of `condenseReference`."
+    value = row[reference]
+    if isinstance(value, dict) and value.get("reference") is not None:
+        row[reference] = value["reference"]
+    else:
+        new_name = "".join(reference.rsplit(".reference", 1))
+        row = _replace_key(row, reference, {new_name: value})
+
+    row.pop(reference.removesuffix(".reference") + ".display", None)
+    return row
+
+
+def _condense_system_row(row: dict, col_name: str) -> dict:
+    "Dictionary equivalent of `condenseSystem`."
+    base_name = col_name.removesuffix(".system")
+    row[base_name + ".code"] = row[col_name] + "|" + row[base_name + ".code"]
+    del row[col_name]
+    return row
+
+
+def flatten_resource(data: dict, lists: list | None = None) -> dict:
+    """
+    Converts the dictionary of a single FHIR resource into a FHIRflat row, giving
+    the same result as `fhir2flat` without building a DataFrame.
+
+    Raises `_UnsupportedStructure` for the few structures (such as empty lists) that
+    `fhir2flat` handles through pandas missing values; use `fhir2flat` for those.
+
+    data: dict
+        The resource as returned by ``resource.dict()``
+    lists: list
+        List of columns that are lists of FHIR concepts that need to be expanded.
+    """
+
+    row = _normalize(data)
+
+    if lists:
+        list_cols = [n for n in lists if n in row if n != "extension"]
+        if list_cols:
+            row = _explode_and_flatten_row(row, list_cols)
+
+    for ext in [k for k in row if k.endswith("extension")]:
+        row = _flatten_extensions_row(row, ext)
+
+    for coding in [k for k in row if k.endswith("coding")]:
+        row = _expand_coding_row(row, coding)
+
+    for reference in [k for k in row if k.endswith("reference")]:
+        row = _condense_reference_row(row, reference)
+
+    for col in [k for k in row if k.endswith(".system")]:
+        row = _condense_system_row(row, col)
+
+    return row
+
+
+def fhir2flat_many(
+    resources: Iterable[FHIRFlatBase], lists: list | None = None
+) -> pd.DataFrame:
+    """
+    Converts many FHIR resources of the same type into FHIRflat rows, giving the same
+    result as concatenating `fhir2flat` for each one. Each resource is flattened as a
+    dictionary and the DataFrame is built once at the end, rather than per resource.
+
+    resources: Iterable of fhir.resource.Resource
+    lists: list
+        List of columns that are lists of FHIR concepts that need to be expanded.
+    """
+
+    rows = []
+    for resource in resources:
+        try:
+            rows.append(flatten_resource(resource.dict(), lists=lists))
+        except _UnsupportedStructure:
+            rows.append(fhir2flat(resource, lists=lists).iloc[0].to_dict())
+
+    return pd.DataFrame(rows)
@@ -1,4 +1,6 @@
 # Converts FHIRflat files into FHIR resources
+import functools
+
 from fhir.resources.backbonetype import BackboneType as _BackboneType
 from fhir.resources.codeableconcept import CodeableConcept
 from fhir.resources.datatype import DataType as _DataType
@@ -9,6 +11,7 @@ from fhir.resources.quantity import Quantity
 from pydantic.v1 import BaseModel
 from pydantic.v1.error_wrappers import ValidationError
 
+from .resources.extensions import value_checks
 from .util import (
     get_fhirtype,
     get_local_extension_type,
@@ -111,6 +114,10 @@ def createExtension(exts: dict):
     [{'type': 'approximateDate'}, {'type': 'relativeDay'}, {'type': 'Extension'}]
     and finds the appropriate class for the data provided.
 
+    Where an extension allows several value types, the value field is chosen from the
+    type or format of the value using the checks in `extensions.value_checks`, and
+    only falls back to validating against each option in turn if those can't decide.
+
     Args:
     exts: dict
         e.g. {"relativeDay": 3, "approximateDate": "month 6"}
@@ -118,25 +125,38 @@ def createExtension(exts: dict):
 
     extensions = []
 
-    extension_classes = {e: get_local_extension_type(e) for e in exts.keys()}
-
     for e, v in exts.items():
-        properties = extension_classes[e].schema()["properties"]
-        data_options = [key for key in properties.keys() if key.startswith("value")]
+        klass = get_local_extension_type(e)
+        data_options = _value_options(klass)
         if len(data_options) == 1:
             extensions.append({"url": e, data_options[0]: v})
-        else:
-            for opt in data_options:
-                try:
-                    extension_classes[e](**{opt: v})
-                    extensions.append({"url": e, opt: v})
-                    break
-                except ValidationError:
-                    continue
+            continue
+        checks = value_checks.get(klass, {})
+        for i, opt in enumerate(data_options):
+            fits = checks[opt](v) if opt in checks else None
+            if fits:
+                extensions.append({"url": e, opt: v})
+                break
+            if fits is None:
+                # only validation can tell, so try the remaining options in turn
+                for opt in data_options[i:]:
+                    try:
+                        klass(**{opt: v})
+                        extensions.append({"url": e, opt: v})
+                        break
+                    except ValidationError:
+                        continue
+                break
 
     return extensions
 
 
+@functools.cache
+def _value_options(klass) -> list[str]:
+    "The value[x] fields of an extension class."
+    return [key for key in klass.schema()["properties"] if key.startswith("value")]
+
+
 def set_datatypes(k, v_dict, klass) -> dict:
     if klass == Quantity:
         return createQuantity(v_dict, k)
@@ -152,9 +172,8 @@ def set_datatypes(k, v_dict, klass) -> dict:
         }
     elif issubclass(klass, _DataType) and not issubclass(klass, _BackboneType):
         # not quite
-        prop = klass.schema()["properties"]
-        value_type = [key for key in prop.keys() if key.startswith("value")]
-        if not value_type:
+        value_type, data_class = _value_property(klass)
+        if value_type is None:
             # nested extension
             return {
                 "url": k,
@@ -163,17 +182,32 @@ def set_datatypes(k, v_dict, klass) -> dict:
                 ),
             }
 
-        data_type = prop[value_type[0]]["type"]
-        try:
-            data_class = get_fhirtype(data_type)
-            return {"url": k, f"{value_type[0]}": set_datatypes(k, v_dict, data_class)}
-        except AttributeError:
+        if data_class is None:
             # datatype should be a primitive
-            return {"url": k, f"{value_type[0]}": v_dict[k]}
+            return {"url": k, f"{value_type}": v_dict[k]}
+        return {"url": k, f"{value_type}": set_datatypes(k, v_dict, data_class)}
 
     return {s.split(".", 1)[1]: v_dict[s] for s in v_dict}
 
 
+@functools.cache
+def _value_property(klass) -> tuple[str | None, type | None]:
+    """
+    The name of the value property of a datatype, and its class, which is None for
+    primitive values. The name is None if the datatype has no value property.
+    """
+    prop = klass.schema()["properties"]
+    value_type = [key for key in prop.keys() if key.startswith("value")]
+    if not value_type:
+        return None, None
+
+    data_type = prop[value_type[0]]["type"]
+    try:
+        return value_type[0], get_fhirtype(data_type)
+    except AttributeError:
+        return value_type[0], None
+
+
 def find_data_class(data_class: list[BaseModel] | BaseModel, k: str) -> BaseModel:
     """
     Finds the type class for item k within the data class.
@@ -211,36 +245,53 @@ def find_data_class(data_class: list[BaseModel] | BaseModel, k: str) -> BaseMode
         return get_fhirtype(base_class)
 
 
-def expand_concepts(data: dict[str, str], data_class: type[_DomainResource]) -> dict:
+class GroupPlan:
     """
-    Combines columns containing flattened FHIR concepts back into
-    JSON-like structures.
+    How one group of flattened columns (e.g. "code.code" and "code.text") is
+    combined back into a FHIR concept. Part of a `ConceptPlan`.
     """
-    groups = group_keys(data.keys())
-    group_classes = {}
-
-    for k in groups.keys():
-        group_classes[k] = find_data_class(data_class, k)
-
-    expanded = {}
-    keys_to_replace = []
-    for k, v in groups.items():
-        keys_to_replace += v
-        v_dict = {k: data[k] for k in v}
-        if any(s.count(".") > 1 for s in v):
+
+    __slots__ = ("array", "data_class", "keys", "name", "nested", "value_classes")
+
+    def __init__(self, name: str, keys: list[str], data_class, parent_class):
+        self.name = name
+        self.keys = keys
+        self.data_class = data_class
+        # plan for groups nested within this one, e.g. "admission.origin.code"
+        self.nested = (
+            compile_concepts(data_class, [s.split(".", 1)[1] for s in keys])
+            if any(s.count(".") > 1 for s in keys)
+            else None
+        )
+        self.array = (
+            not isinstance(parent_class, list)
+            and parent_class.schema()["properties"][name].get("type") == "array"
+        )
+        # classes of the items of extensions, found as they are needed
+        self.value_classes: dict[str, BaseModel] = {}
+
+    def value_class(self, k: str) -> BaseModel:
+        if k not in self.value_classes:
+            self.value_classes[k] = find_data_class(self.data_class, k)
+        return self.value_classes[k]
+
+    def expand(self, data: dict):
+        "Combines the columns of the group in a record into a FHIR concept."
+        k = self.name
+        v_dict = {key: data[key] for key in self.keys}
+        if self.nested is not None:
             # strip the outside group name
-            stripped_dict = {s.split(".", 1)[1]: v_dict[s] for s in v}
-            # call recursively
-            new_v_dict = expand_concepts(stripped_dict, data_class=group_classes[k])
+            stripped_dict = {s.split(".", 1)[1]: v_dict[s] for s in self.keys}
+            new_v_dict = self.nested.expand(stripped_dict)
             # add outside group key back on
             v_dict = {f"{k}." + old_k: v for old_k, v in new_v_dict.items()}
 
         if all(isinstance(v, dict) for v in v_dict.values()):
             # coming back out of nested recursion
-            expanded[k] = {s.split(".", 1)[1]: v_dict[s] for s in v_dict}
+            expanded = {s.split(".", 1)[1]: v_dict[s] for s in v_dict}
 
         elif any(isinstance(v, dict) for v in v_dict.values()) and isinstance(
-            group_classes[k], list
+            self.data_class, list
         ):
             # extensions, where some classes are just values and others have codes etc
             non_dict_items = {
@@ -250,31 +301,79 @@ def expand_concepts(data: dict[str, str], data_class: type[_DomainResource]) ->
                 s.split(".", 1)[1]: non_dict_items[s] for s in non_dict_items.keys()
             }
             for k1, v1 in stripped_dict.items():
-                klass = find_data_class(group_classes[k], k1)
+                klass = self.value_class(k1)
                 v_dict[k + "." + k1] = set_datatypes(k1, {k1: v1}, klass)
 
-            expanded[k] = {s.split(".", 1)[1]: v_dict[s] for s in v_dict}
+            expanded = {s.split(".", 1)[1]: v_dict[s] for s in v_dict}
 
         else:
-            expanded[k] = set_datatypes(k, v_dict, group_classes[k])
+            expanded = set_datatypes(k, v_dict, self.data_class)
 
-        if isinstance(data_class, list):
-            continue
-        elif data_class.schema()["properties"][k].get("type") == "array":
+        if self.array:
             if k == "extension":
-                expanded[k] = list(expanded[k].values())
+                expanded = list(expanded.values())
             else:
-                expanded[k] = [expanded[k]]
+                expanded = [expanded]
+        return expanded
+
 
-    dense_cols = {
-        k: k.removesuffix("_dense") for k in data.keys() if k.endswith("_dense")
-    }
-    if dense_cols:
-        for old_k, new_k in dense_cols.items():
+class ConceptPlan:
+    """
+    How the flattened concepts in a set of columns are combined back into
+    JSON-like structures for a data class. The grouping of the columns, the class
+    of each group and whether it holds a list are worked out once, when the plan
+    is compiled by `compile_concepts`, and reused for every record with the same
+    columns.
+    """
+
+    __slots__ = ("dense", "groups")
+
+    def __init__(self, data_class, columns: frozenset[str]):
+        groups = group_keys(columns)
+        group_classes = {k: find_data_class(data_class, k) for k in groups}
+        self.groups = [
+            GroupPlan(k, keys, group_classes[k], data_class)
+            for k, keys in groups.items()
+        ]
+        self.dense = {
+            k: k.removesuffix("_dense") for k in sorted(columns) if k.endswith("_dense")
+        }
+
+    def expand(self, data: dict) -> dict:
+        expanded = {g.name: g.expand(data) for g in self.groups}
+
+        for old_k, new_k in self.dense.items():
             data[new_k] = data[old_k]
             del data[old_k]
 
-    for k in keys_to_replace:
-        data.pop(k)
-    data.update(expanded)
-    return data
+        for g in self.groups:
+            for k in g.keys:
+                data.pop(k)
+        data.update(expanded)
+        return data
+
+
+@functools.cache
+def _compile_concepts(data_class, columns: frozenset[str]) -> ConceptPlan:
+    if isinstance(data_class, tuple):
+        data_class = list(data_class)
+    return ConceptPlan(data_class, columns)
+
+
+def compile_concepts(data_class, columns) -> ConceptPlan:
+    """
+    The plan for expanding records of `data_class` with the given columns, compiled
+    on first use and cached for each data class and set of columns.
+    """
+    if isinstance(data_class, list):
+        # lists of possible classes, e.g. for extensions
+        data_class = tuple(data_class)
+    return _compile_concepts(data_class, frozenset(columns))
+
+
+def expand_concepts(data: dict[str, str], data_class: type[_DomainResource]) -> dict:
+    """
+    Combines columns containing flattened FHIR concepts back into
+    JSON-like structures.
+    """
+    return compile_concepts(data_class, data.keys()).expand(data)
@@ -9,7 +9,10 @@ import os
 import shutil
 import timeit
 import warnings
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from glob import glob
 from math import isnan
 from pathlib import Path
@@ -22,6 +25,7 @@ import pandas as pd
 
 import fhirflat
 from fhirflat.util import get_local_resource, group_keys
+from fhirflat.writer import FlatWriter, ParquetOptions, Partitioning
 
 # 1:1 (single row, single resource) mapping: Patient, Encounter
 # 1:M (single row, multiple resources) mapping: Observation, Condition, Procedure, ...
@@ -32,8 +36,6 @@ TODO
 * cope with 'if' statements - e.g. for date overwriting.
 * deal with how to check if lists are appropriate when adding multiple values to a
     single field - list options.
-* Consider using pandarallel (https://pypi.org/project/pandarallel/) to parallelize
-    the apply function, particularly for one to many mappings.
 """
 
 
@@ -44,64 +46,438 @@ class FlatMetadata(TypedDict):
     checksum_file: str
 
 
-def find_field_value(
-    row, response, fhir_attr, mapp, date_format, timezone, raw_data=None
-):
+class FieldNode:
     """
-    Returns the data for a given field, given the mapping.
-    For one to many resources the raw data is provided to allow for searching for other
-    fields than in the melted data.
+    A single compiled mapping expression, e.g. ``<FIELD>``, ``Patient/+<subjid>`` or
+    ``<FIELD> if not <dates_admdate>``.
+
+    Nodes are built once per mapping string by `compile_field` and evaluated for each
+    cell, so the mapping syntax is only interpreted once per resource.
     """
-    if mapp == "<FIELD>":
-        return_val = response
-    elif "+" in mapp:
-        mapp = mapp.split("+")
-        results = [
-            find_field_value(row, response, "", m, date_format, timezone, raw_data)
-            for m in mapp
-        ]
-        results = [str(x) for x in results if not (isinstance(x, float) and isnan(x))]
-        return_val = " ".join(results) if "/" not in results[0] else "".join(results)
-    elif "if not" in mapp:
-        mapp = mapp.replace(" ", "").split("ifnot")
-        results = [
-            find_field_value(row, response, "", m, date_format, timezone, raw_data)
-            for m in mapp
-        ]
-        x, y = results
-        if isinstance(y, float):
-            return_val = x if isnan(y) else None
-        else:
-            return_val = x if not y else None
-    elif "<" in mapp:
-        col = mapp.lstrip("<").rstrip(">")
+
+    __slots__ = ()
+
+    #: Raw data columns this expression reads, other than the mapped column itself.
+    columns: frozenset[str] = frozenset()
+
+    @property
+    def children(self) -> tuple["FieldNode", ...]:
+        return ()
+
+    def walk(self):
+        "Yields this node and every node nested within it."
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def __call__(self, row, response, raw_data=None):
+        raise NotImplementedError(
+            "Subclasses must implement this method"
+        )  # pragma: no cover
+
+    def evaluate_many(self, data: pd.DataFrame, positions, responses: list) -> list:
+        """
+        Evaluates the expression for a block of rows at once.
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            The data that referenced columns are read from.
+        positions: array-like
+            Row positions within `data` of the cells being mapped.
+        responses: list
+            The values of the mapped column at those positions.
+        """
+        raise NotImplementedError(
+            "Subclasses must implement this method"
+        )  # pragma: no cover
+
+
+class LiteralNode(FieldNode):
+    "A fixed value, e.g. the ``Patient/`` in ``Patient/+<FIELD>``."
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, _row, _response, _raw_data=None):
+        return self.value
+
+    def evaluate_many(self, _data, _positions, responses):
+        return [self.value] * len(responses)
+
+
+class ResponseNode(FieldNode):
+    "The ``<FIELD>`` placeholder, i.e. the value of the mapped column."
+
+    __slots__ = ()
+
+    def __call__(self, _row, response, _raw_data=None):
+        return response
+
+    def evaluate_many(self, _data, _positions, responses):
+        return responses
+
+
+class ColumnNode(FieldNode):
+    "A reference to another column in the data, e.g. ``<dates_admtime>``."
+
+    __slots__ = ("column", "columns")
+
+    def __init__(self, column: str):
+        self.column = column
+        self.columns = frozenset([column])
+
+    def __call__(self, row, _response, raw_data=None):
         try:
-            return_val = row[col]
+            return row[self.column]
         except KeyError as e:
             if raw_data is not None:
                 try:
-                    return_val = raw_data.loc[row["index"], col]
+                    return raw_data.loc[row["index"], self.column]
                 except KeyError:
-                    raise KeyError(f"Column {col} not found in data") from e
+                    raise KeyError(f"Column {self.column} not found in data") from e
             else:
-                raise KeyError(f"Column {col} not found in the filtered data") from e
+                raise KeyError(
+                    f"Column {self.column} not found in the filtered data"
+                ) from e
+
+    def evaluate_many(self, data, positions, _responses):
+        try:
+            values = data[self.column]
+        except KeyError as e:
+            raise KeyError(f"Column {self.column} not found in data") from e
+        return values.iloc[positions].tolist()
+
+
+class ConcatNode(FieldNode):
+    """
+    Joins the results of several expressions (``a+b``). Values are separated by a space
+    unless the first value contains a '/', as in references like ``Patient/1``.
+    """
+
+    __slots__ = ("columns", "parts")
+
+    def __init__(self, parts: list[FieldNode]):
+        self.parts = parts
+        self.columns = frozenset().union(*(p.columns for p in parts))
+
+    @property
+    def children(self):
+        return tuple(self.parts)
+
+    @staticmethod
+    def join(values: list) -> str:
+        results = [str(x) for x in values if not (isinstance(x, float) and isnan(x))]
+        return " ".join(results) if "/" not in results[0] else "".join(results)
+
+    def __call__(self, row, response, raw_data=None):
+        return self.join([p(row, response, raw_data) for p in self.parts])
+
+    def evaluate_many(self, data, positions, responses):
+        parts = [p.evaluate_many(data, positions, responses) for p in self.parts]
+        return [self.join(list(values)) for values in zip(*parts, strict=True)]
+
+
+class IfNotNode(FieldNode):
+    "Returns the value only if the condition is empty (``a if not b``)."
+
+    __slots__ = ("columns", "condition", "value")
+
+    def __init__(self, value: FieldNode, condition: FieldNode):
+        self.value = value
+        self.condition = condition
+        self.columns = value.columns | condition.columns
+
+    @property
+    def children(self):
+        return (self.value, self.condition)
+
+    @staticmethod
+    def choose(x, y):
+        if isinstance(y, float):
+            return x if isnan(y) else None
+        return x if not y else None
+
+    def __call__(self, row, response, raw_data=None):
+        return self.choose(
+            self.value(row, response, raw_data),
+            self.condition(row, response, raw_data),
+        )
+
+    def evaluate_many(self, data, positions, responses):
+        return [
+            self.choose(x, y)
+            for x, y in zip(
+                self.value.evaluate_many(data, positions, responses),
+                self.condition.evaluate_many(data, positions, responses),
+                strict=True,
+            )
+        ]
+
+
+class DateNode(FieldNode):
+    "Formats the result of an expression mapped to a date or period attribute."
+
+    __slots__ = ("columns", "date_format", "node", "timezone")
+
+    def __init__(self, node: FieldNode, date_format: str, timezone: str):
+        self.node = node
+        self.date_format = date_format
+        self.timezone = timezone
+        self.columns = node.columns
+
+    @property
+    def children(self):
+        return (self.node,)
+
+    def __call__(self, row, response, raw_data=None):
+        return format_dates(
+            self.node(row, response, raw_data), self.date_format, self.timezone
+        )
+
+    def evaluate_many(self, data, positions, responses):
+        return format_date_series(
+            self.node.evaluate_many(data, positions, responses),
+            self.date_format,
+            self.timezone,
+        )
+
+
+def is_date_attribute(fhir_attr: str) -> bool:
+    "Whether values mapped to this FHIR attribute should be formatted as dates."
+    return "date" in fhir_attr.lower() or "period" in fhir_attr.lower()
+
+
+@lru_cache(maxsize=4096)
+def compile_field(
+    mapp: str, fhir_attr: str, date_format: str, timezone: str
+) -> FieldNode:
+    """
+    Compiles a single mapping string into a `FieldNode` which can be evaluated
+    against rows of data without re-parsing the mapping.
+    """
+    if mapp == "<FIELD>":
+        node = ResponseNode()
+    elif "+" in mapp:
+        node = ConcatNode(
+            [compile_field(m, "", date_format, timezone) for m in mapp.split("+")]
+        )
+    elif "if not" in mapp:
+        x, y = (
+            compile_field(m, "", date_format, timezone)
+            for m in mapp.replace(" ", "").split("ifnot")
+        )
+        node = IfNotNode(x, y)
+    elif "<" in mapp:
+        node = ColumnNode(mapp.lstrip("<").rstrip(">"))
     else:
-        return_val = mapp
+        node = LiteralNode(mapp)
 
-    if "date" in fhir_attr.lower() or "period" in fhir_attr.lower():
-        return format_dates(return_val, date_format, timezone)
-    return return_val
+    if is_date_attribute(fhir_attr):
+        return DateNode(node, date_format, timezone)
+    return node
 
 
-def format_dates(date_str: str, date_format: str, timezone: str) -> str:
+class SnippetPlan:
     """
-    Converts dates into ISO8601 format with timezone information.
+    The compiled mapping for one (raw_variable, raw_response) pair: the FHIRflat
+    attributes it fills, with fixed values kept as-is and expressions compiled to
+    `FieldNode` objects.
     """
 
-    if date_str is None:
-        return date_str
+    __slots__ = ("fields", "template")
+
+    def __init__(self, mapping: pd.Series, date_format: str, timezone: str):
+        self.template: dict = {}
+        self.fields: dict[str, FieldNode] = {}
+        for k, v in mapping.items():
+            if "<" in str(v):
+                self.fields[k] = compile_field(v, k, date_format, timezone)
+            self.template[k] = v
+
+    @property
+    def columns(self) -> frozenset[str]:
+        return frozenset().union(*(n.columns for n in self.fields.values()))
+
+    def evaluate(self, row, response, raw_data=None) -> dict:
+        "Creates the fhirflat-like snippet for a single response."
+        if not self.fields:
+            return dict(self.template)
+        return {
+            k: (self.fields[k](row, response, raw_data) if k in self.fields else v)
+            for k, v in self.template.items()
+        }
+
+    def evaluate_many(self, data: pd.DataFrame, positions, responses: list) -> list:
+        "Creates the fhirflat-like snippets for a block of responses."
+        if not self.fields:
+            return [dict(self.template) for _ in responses]
+        values = {
+            k: node.evaluate_many(data, positions, responses)
+            for k, node in self.fields.items()
+        }
+        return [
+            {k: (values[k][i] if k in values else v) for k, v in self.template.items()}
+            for i in range(len(responses))
+        ]
+
+
+class ColumnPlan:
+    """
+    The compiled mappings for a single raw_variable. Columns where every
+    raw_response is empty (e.g. free text or dates) use the same mapping for all
+    values, otherwise the mapping is chosen by the coded response.
+    """
+
+    __slots__ = ("default", "responses")
+
+    def __init__(self):
+        self.default: SnippetPlan | None = None
+        self.responses: dict[str, SnippetPlan] = {}
+
+    def lookup(self, response) -> SnippetPlan:
+        "Raises a KeyError if there is no mapping for the response."
+        if self.default is not None:
+            return self.default
+        return self.responses[str(int(response))]
+
+    def snippets(self):
+        if self.default is not None:
+            yield self.default
+        yield from self.responses.values()
 
-    new_tz = ZoneInfo(timezone)
+
+class MappingPlan:
+    """
+    An executable plan for a mapping file, compiled once per resource by
+    `compile_mapping`.
+    """
+
+    def __init__(self, columns: dict[str, ColumnPlan]):
+        self.columns = columns
+
+    def __contains__(self, column) -> bool:
+        return column in self.columns
+
+    def __getitem__(self, column) -> ColumnPlan:
+        return self.columns[column]
+
+    @property
+    def raw_variables(self) -> list[str]:
+        "Columns of the raw data which are mapped to this resource."
+        return list(self.columns)
+
+    @property
+    def referenced_columns(self) -> set[str]:
+        "Columns of the raw data referenced by a mapping, e.g. ``<daily_date>``"
+        return {
+            c
+            for column in self.columns.values()
+            for snippet in column.snippets()
+            for c in snippet.columns
+        }
+
+    @property
+    def used_columns(self) -> set[str]:
+        "All columns of the raw data needed to create this resource."
+        return set(self.raw_variables) | self.referenced_columns
+
+    @property
+    def date_columns(self) -> set[str]:
+        "Columns of the raw data whose values are formatted as dates."
+        dates = set()
+        for variable, column in self.columns.items():
+            for snippet in column.snippets():
+                for node in snippet.fields.values():
+                    if not isinstance(node, DateNode):
+                        continue
+                    for n in node.walk():
+                        if isinstance(n, ResponseNode):
+                            dates.add(variable)
+                        elif isinstance(n, ColumnNode):
+                            dates.add(n.column)
+        return dates
+
+
+def _response_key(response) -> str | float:
+    "Strips the text answers out of a raw_response, e.g. '1, Yes' becomes '1'."
+    if isinstance(response, str):
+        return response.split(",")[0]
+    if pd.isna(response):
+        return np.nan
+    return str(int(response))
+
+
+def compile_mapping(
+    map_df: pd.DataFrame, date_format: str, timezone: str
+) -> MappingPlan:
+    """
+    Compiles a mapping file for a single resource into a `MappingPlan`.
+
+    Parameters
+    ----------
+    map_df: pd.DataFrame
+        The mapping file as read in, with 'raw_variable' and 'raw_response' columns
+        followed by one column for each FHIRflat attribute.
+    date_format: str
+        The format of the dates in the data file. E.g. "%Y-%m-%d"
+    timezone: str
+        The timezone of the dates in the data file. E.g. "Europe/London"
+    """
+
+    # Fills the na input variables with the previous value
+    raw_variables = map_df["raw_variable"].ffill()
+    responses = map_df["raw_response"].apply(_response_key)
+    attributes = map_df.drop(columns=["raw_variable", "raw_response"])
+
+    columns: dict[str, ColumnPlan] = {}
+    for variable in raw_variables.dropna().unique():
+        rows = raw_variables == variable
+        column = ColumnPlan()
+        if responses[rows].isna().all():
+            first = attributes[rows].index[0]
+            column.default = SnippetPlan(
+                attributes.loc[first].dropna(), date_format, timezone
+            )
+        else:
+            for i in attributes[rows].index:
+                if pd.notna(responses[i]) and responses[i] not in column.responses:
+                    column.responses[responses[i]] = SnippetPlan(
+                        attributes.loc[i].dropna(), date_format, timezone
+                    )
+        columns[variable] = column
+
+    return MappingPlan(columns)
+
+
+def find_field_value(
+    row, response, fhir_attr, mapp, date_format, timezone, raw_data=None
+):
+    """
+    Returns the data for a given field, given the mapping.
+    For one to many resources the raw data is provided to allow for searching for other
+    fields than in the melted data.
+    """
+    return compile_field(mapp, fhir_attr, date_format, timezone)(
+        row, response, raw_data
+    )
+
+
+@lru_cache(maxsize=None)
+def _zoneinfo(timezone: str) -> ZoneInfo:
+    return ZoneInfo(timezone)
+
+
+@lru_cache(maxsize=65536)
+def _convert_date(date_str: str, date_format: str, timezone: str) -> str | None:
+    """
+    Converts a single date into ISO8601 format, returning None if it can't be
+    converted. Results are cached, as the same dates recur throughout a dataset.
+    """
+
+    new_tz = _zoneinfo(timezone)
 
     try:
         date_time = datetime.strptime(date_str, date_format)
@@ -117,20 +493,139 @@ def format_dates(date_str: str, date_format: str, timezone: str) -> str:
             date_time = datetime.combine(date, time)
             date_time_aware = date_time.replace(tzinfo=new_tz)
         except ValueError:
-            # Can't convert data, pass to FHIR to create validation error
-            warnings.warn(
-                f"Date {date_str} could not be converted using date format"
-                f" {date_format}",
-                UserWarning,
-                stacklevel=2,
-            )
-            return date_str
+            return None
 
     return date_time_aware.isoformat()
 
 
+def format_dates(date_str: str, date_format: str, timezone: str) -> str:
+    """
+    Converts dates into ISO8601 format with timezone information.
+    """
+
+    if date_str is None:
+        return date_str
+
+    converted = _convert_date(date_str, date_format, timezone)
+    if converted is None:
+        # Can't convert data, pass to FHIR to create validation error
+        warnings.warn(
+            f"Date {date_str} could not be converted using date format {date_format}",
+            UserWarning,
+            stacklevel=2,
+        )
+        return date_str
+
+    return converted
+
+
+def format_date_series(
+    dates: pd.Series | list, date_format: str, timezone: str
+) -> pd.Series | list:
+    """
+    Converts a column of dates into ISO8601 format with timezone information.
+
+    Each distinct date is only parsed once. Dates which can't be converted are
+    passed through unchanged (so FHIR validation reports them), and a single
+    warning lists them.
+
+    Returns a Series if given a Series, otherwise a list.
+    """
+
+    values = dates.tolist() if isinstance(dates, pd.Series) else dates
+
+    converted: dict = {None: None}
+    failed = []
+    for date_str in dict.fromkeys(values):
+        if date_str in converted:
+            continue
+        result = _convert_date(date_str, date_format, timezone)
+        if result is None:
+            failed.append(date_str)
+            result = date_str
+        converted[date_str] = result
+
+    if failed:
+        examples = ", ".join(str(d) for d in failed[:5])
+        warnings.warn(
+            f"{len(failed)} dates could not be converted using date format"
+            f" {date_format}: {examples}{', ...' if len(failed) > 5 else ''}",
+            UserWarning,
+            stacklevel=2,
+        )
+
+    result = [converted[d] for d in values]
+    if isinstance(dates, pd.Series):
+        return pd.Series(result, index=dates.index, dtype=object, name=dates.name)
+    return result
+
+
+def _merge_snippet(result: dict, snippet: dict) -> dict:
+    """
+    Adds a mapped snippet to the fhirflat-like dictionary for a row. Where several
+    columns map to the same FHIR attribute, the values are combined into lists.
+    """
+    duplicate_keys = set(result.keys()).intersection(snippet.keys())
+    if not duplicate_keys:
+        return result | snippet
+
+    # Ignore duplicates if they are the same
+    # stringify lists/lists of numbers to get this to work without value errors
+    if all(str(result[key]) == str(snippet[key]) for key in duplicate_keys):
+        return result
+    # replace placeholders with actual values
+    elif all(result[key] is None for key in duplicate_keys):
+        result.update(snippet)
+        return result
+
+    for key in duplicate_keys:
+        if isinstance(result[key], list):
+            result[key].append(snippet[key])
+        else:
+            result[key] = [result[key], snippet[key]]
+
+    # Keys that were not previously in the result still need to be added
+    remaining_keys = set(snippet.keys()) ^ duplicate_keys
+    if remaining_keys:
+        key_length = max(len(result[k]) for k in duplicate_keys)
+        empty_list = [None] * (key_length - 1)
+        for key in remaining_keys:
+            result[key] = [*empty_list, snippet[key]]
+
+    # Check for existing keys that might need to be extended
+    snippet_keys = list(snippet.keys())
+    result_groups = group_keys(result.keys())
+    for k_list in result_groups.values():
+        if set(snippet_keys).issubset(set(k_list)):
+            relevant_result = {
+                k: ([result[k]] if not isinstance(result[k], list) else result[k])
+                for k in k_list
+            }
+            all_vals_same_length = len(set(map(len, relevant_result.values()))) == 1
+            if not all_vals_same_length:
+                target_length = max(map(len, relevant_result.values()))
+                for k, v in relevant_result.items():
+                    if len(v) < target_length:
+                        result[k] = relevant_result[k] + [None] * (
+                            target_length - len(v)
+                        )
+    return result
+
+
+def _as_plan(
+    map_df: MappingPlan | pd.DataFrame, date_format: str, timezone: str
+) -> MappingPlan:
+    "Accepts either a compiled plan or a mapping dataframe indexed by variable."
+    if isinstance(map_df, MappingPlan):
+        return map_df
+    return compile_mapping(map_df.reset_index(), date_format, timezone)
+
+
 def create_dict_wide(
-    row: pd.Series, map_df: pd.DataFrame, date_format: str, timezone: str
+    row: pd.Series,
+    map_df: MappingPlan | pd.DataFrame,
+    date_format: str,
+    timezone: str,
 ) -> dict:
     """
     Takes a wide-format dataframe and iterates through the columns of the row,
@@ -138,96 +633,35 @@ def create_dict_wide(
     initialize the resource object for each row.
     """
 
+    plan = _as_plan(map_df, date_format, timezone)
+
     result: dict = {}
     for column in row.index:
-        if column in map_df.index.get_level_values(0):
-            response = row[column]
-            if pd.notna(response):  # Ensure there is a response to map
-                try:
-                    # Retrieve the mapping for the given column and response
-                    if pd.isna(map_df.loc[column].index).all():
-                        mapping = map_df.loc[(column, np.nan)].dropna()
-                    else:
-                        mapping = map_df.loc[(column, str(int(response)))].dropna()
-                    snippet = {
-                        k: (
-                            v
-                            if "<" not in str(v)
-                            else find_field_value(
-                                row, response, k, v, date_format, timezone
-                            )
-                        )
-                        for k, v in mapping.items()
-                    }
-                except KeyError:
-                    # No mapping found for this column and response despite presence
-                    # in mapping file
-                    warnings.warn(
-                        f"No mapping for column {column} response {response}",
-                        UserWarning,
-                        stacklevel=2,
-                    )
-                    continue
-            else:
-                continue
-        else:
+        if column not in plan:
             raise ValueError(f"Column {column} not found in mapping file")
-        duplicate_keys = set(result.keys()).intersection(snippet.keys())
-        if not duplicate_keys:
-            result = result | snippet
-        else:
-            # Ignore duplicates if they are the same
-            # stringify lists/lists of numbers to get this to work without value errors
-            if all(str(result[key]) == str(snippet[key]) for key in duplicate_keys):
-                continue
-            # replace placeholders with actual values
-            elif all(result[key] is None for key in duplicate_keys):
-                result.update(snippet)
-            else:
-                for key in duplicate_keys:
-                    if isinstance(result[key], list):
-                        result[key].append(snippet[key])
-                    else:
-                        result[key] = [result[key], snippet[key]]
-
-                # Keys that were not previously in the result still need to be added
-                remaining_keys = set(snippet.keys()) ^ duplicate_keys
-                if remaining_keys:
-                    key_length = max(len(result[k]) for k in duplicate_keys)
-                    empty_list = [None] * (key_length - 1)
-                    for key in remaining_keys:
-                        result[key] = [*empty_list, snippet[key]]
-
-                # Check for existing keys that might need to be extended
-                snippet_keys = list(snippet.keys())
-                result_groups = group_keys(result.keys())
-                for k_list in result_groups.values():
-                    if set(snippet_keys).issubset(set(k_list)):
-                        relevant_result = {
-                            k: (
-                                [result[k]]
-                                if not isinstance(result[k], list)
-                                else result[k]
-                            )
-                            for k in k_list
-                        }
-                        all_vals_same_length = (
-                            len(set(map(len, relevant_result.values()))) == 1
-                        )
-                        if not all_vals_same_length:
-                            target_length = max(map(len, relevant_result.values()))
-                            for k, v in relevant_result.items():
-                                if len(v) < target_length:
-                                    result[k] = relevant_result[k] + [None] * (
-                                        target_length - len(v)
-                                    )
+        response = row[column]
+        if pd.isna(response):  # Ensure there is a response to map
+            continue
+        try:
+            # Retrieve the mapping for the given column and response
+            snippet = plan[column].lookup(response).evaluate(row, response)
+        except KeyError:
+            # No mapping found for this column and response despite presence
+            # in mapping file
+            warnings.warn(
+                f"No mapping for column {column} response {response}",
+                UserWarning,
+                stacklevel=2,
+            )
+            continue
+        result = _merge_snippet(result, snippet)
     return result
 
 
 def create_dict_long(
     row: pd.Series,
     full_df: pd.DataFrame,
-    map_df: pd.DataFrame,
+    map_df: MappingPlan | pd.DataFrame,
     date_format: str,
     timezone: str,
 ) -> dict | None:
@@ -236,26 +670,14 @@ def create_dict_long(
     dictionary for each row in the dataframe.
     """
 
+    plan = _as_plan(map_df, date_format, timezone)
+
     column = row["column"]
     response = row["value"]
     if pd.notna(response):  # Ensure there is a response to map
         try:
             # Retrieve the mapping for the given column and response
-            if pd.isna(map_df.loc[column].index).all():
-                mapping = map_df.loc[(column, np.nan)].dropna()
-            else:
-                mapping = map_df.loc[(column, str(int(response)))].dropna()
-            snippet = {
-                k: (
-                    v
-                    if "<" not in str(v)
-                    else find_field_value(
-                        row, response, k, v, date_format, timezone, raw_data=full_df
-                    )
-                )
-                for k, v in mapping.items()
-            }
-            return snippet
+            return plan[column].lookup(response).evaluate(row, response, full_df)
         except KeyError:
             # No mapping found for this column and response despite presence
             # in mapping file
@@ -268,9 +690,211 @@ def create_dict_long(
     return None
 
 
-def create_dictionary(
+def map_column(
+    data: pd.DataFrame, column: str, column_plan: ColumnPlan
+) -> tuple[np.ndarray, list[dict]]:
+    """
+    Maps every response in a column of the data at once. Coded responses are
+    resolved through the column's lookup table once per distinct value, rather
+    than once per cell.
+
+    Returns the row positions which were mapped, and the snippet for each of them.
+    """
+
+    values = data[column]
+    present = np.flatnonzero(values.notna().to_numpy())
+    if len(present) == 0:
+        return present, []
+
+    responses = values.iloc[present].tolist()
+    if column_plan.default is not None:
+        blocks = {column_plan.default: np.arange(len(present))}
+    else:
+        codes, uniques = pd.factorize(values.iloc[present])
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        blocks = {}
+        for i, response in enumerate(uniques):
+            try:
+                snippet_plan = column_plan.lookup(response)
+            except KeyError:
+                # No mapping found for this column and response despite presence
+                # in mapping file
+                warnings.warn(
+                    f"No mapping for column {column} response {response}",
+                    UserWarning,
+                    stacklevel=2,
+                )
+                continue
+            block = order[bounds[i] : bounds[i + 1]]
+            if snippet_plan in blocks:
+                block = np.concatenate([blocks[snippet_plan], block])
+            blocks[snippet_plan] = block
+
+    snippets: list = [None] * len(present)
+    for snippet_plan, block in blocks.items():
+        block_responses = [responses[i] for i in block]
+        try:
+            block_snippets = snippet_plan.evaluate_many(
+                data, present[block], block_responses
+            )
+        except KeyError:
+            warnings.warn(
+                f"No mapping for column {column} response {block_responses[0]}",
+                UserWarning,
+                stacklevel=2,
+            )
+            continue
+        for i, snippet in zip(block, block_snippets, strict=True):
+            snippets[i] = snippet
+
+    mapped = [i for i, snippet in enumerate(snippets) if snippet is not None]
+    return present[mapped], [snippets[i] for i in mapped]
+
+
+def create_dicts_wide(data: pd.DataFrame, plan: MappingPlan) -> pd.Series:
+    """
+    Column-wise equivalent of applying `create_dict_wide` to every row of a
+    wide-format dataframe. Each column is mapped in a single pass, and the snippets
+    are then combined into one fhirflat-like dictionary per row.
+    """
+
+    for column in data.columns:
+        if column not in plan:
+            raise ValueError(f"Column {column} not found in mapping file")
+
+    results: list[dict] = [{} for _ in range(len(data))]
+    for column in data.columns:
+        positions, snippets = map_column(data, column, plan[column])
+        for i, snippet in zip(positions, snippets, strict=True):
+            results[i] = _merge_snippet(results[i], snippet)
+
+    return pd.Series(results, index=data.index, dtype=object)
+
+
+def create_dicts_long(
+    filtered_data: pd.DataFrame, raw_data: pd.DataFrame, plan: MappingPlan
+) -> pd.Series:
+    """
+    Maps a wide-format dataframe to one fhirflat-like dictionary per non-empty cell,
+    for one-to-many resources.
+
+    Each raw_variable is processed as a block: empty cells are dropped first, the
+    other columns its mapping refers to (e.g. ``<daily_date>``) are taken from the
+    raw data once for the whole block, and the compiled mapping is then applied to
+    the block. Dictionaries are returned column by column, in row order within each
+    column.
+    """
+
+    # responses take the common type of the mapped columns, as they would if the
+    # data were melted into a single column
+    common_dtype = filtered_data.iloc[:0].to_numpy().dtype
+
+    results: list[dict] = []
+    for column in filtered_data.columns:
+        column_plan = plan[column]
+        aux_columns = [
+            c
+            for c in {c for snip in column_plan.snippets() for c in snip.columns}
+            if c in raw_data.columns and c != column
+        ]
+        block = raw_data.loc[filtered_data.index, aux_columns]
+        block[column] = filtered_data[column]
+        if common_dtype.kind != "O":
+            block[column] = block[column].astype(common_dtype)
+
+        _, snippets = map_column(block, column, column_plan)
+        results.extend(snippets)
+
+    return pd.Series(results, dtype=object, name="flat_dict")
+
+
+def load_data(
     data_file: str,
-    map_file: str,
+    plans: Iterable[MappingPlan],
+    subject_id: str = "subjid",
+    chunksize: int | None = None,
+) -> pd.DataFrame | Iterator[pd.DataFrame]:
+    """
+    Reads the raw data file once, so it can be shared by all the resources being
+    converted.
+
+    Only the columns used by the mappings (and the subject ID) are parsed, and
+    columns holding dates are read as strings rather than leaving pandas to guess
+    their type.
+
+    Parameters
+    ----------
+    data_file: str
+        The path to the data file containing the clinical data.
+    plans: Iterable[MappingPlan]
+        The compiled mappings for every resource that will be created from the data.
+    subject_id: str
+        The name of the column containing the subject ID in the data file.
+    chunksize: int | None
+        If given, returns an iterator over chunks of this many rows instead of reading
+        the whole file. Combine with `iter_subject_chunks` to keep the rows of each
+        subject together.
+    """
+
+    columns = {subject_id}
+    date_columns: set[str] = set()
+    for plan in plans:
+        columns |= plan.used_columns
+        date_columns |= plan.date_columns
+
+    return pd.read_csv(
+        data_file,
+        header=0,
+        usecols=lambda c: c in columns,
+        dtype=dict.fromkeys(date_columns, str),
+        chunksize=chunksize,
+    )
+
+
+def iter_subject_chunks(
+    chunks: Iterable[pd.DataFrame], subject_id: str = "subjid"
+) -> Iterator[pd.DataFrame]:
+    """
+    Regroups chunks of raw data so that all the rows for a subject are in the same
+    chunk, as needed to condense one-to-one resources. The rows of the last subject
+    in each chunk are held back and added to the start of the next.
+
+    Raises a ValueError if the rows for a subject are not next to each other in the
+    data, as the subject would then be split across chunks.
+    """
+
+    seen: set = set()
+    carry: pd.DataFrame | None = None
+
+    def check(chunk: pd.DataFrame) -> pd.DataFrame:
+        subjects = set(chunk[subject_id].dropna().unique())
+        repeated = seen & subjects
+        if repeated:
+            raise ValueError(
+                "Data must be sorted by subject to be read in chunks, found rows for"
+                f" subject {next(iter(repeated))} in more than one place"
+            )
+        seen.update(subjects)
+        return chunk
+
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        if chunk.empty:
+            continue
+        last = chunk[subject_id] == chunk[subject_id].iloc[-1]
+        carry = chunk[last]
+        if not last.all():
+            yield check(chunk[~last])
+
+    if carry is not None and not carry.empty:
+        yield check(carry)
+
+
+def create_dictionary(
+    data_file: str | pd.DataFrame,
+    map_file: str | MappingPlan,
     resource: str,
     one_to_one=False,
     subject_id="subjid",
@@ -284,11 +908,12 @@ def create_dictionary(
 
     Parameters
     ----------
-    data: str
-        The path to the data file containing the clinical data.
-    map_file: pd.DataFrame
+    data_file: str | pd.DataFrame
+        The path to the data file containing the clinical data, or the data already
+        read in by `load_data`.
+    map_file: str | MappingPlan
         The path to the mapping file containing the mapping of the clinical data to the
-        FHIR resource.
+        FHIR resource, or the mapping already compiled by `compile_mapping`.
     resource: str
         The name of the resource being mapped.
     one_to_one: bool
@@ -301,11 +926,20 @@ def create_dictionary(
         The timezone of the dates in the data file. E.g. "Europe/London"
     """
 
-    data: pd.DataFrame = pd.read_csv(data_file, header=0)
-    map_df: pd.DataFrame = pd.read_csv(map_file, header=0)
+    if isinstance(data_file, pd.DataFrame):
+        data = data_file
+    else:
+        data = pd.read_csv(data_file, header=0)
+
+    if isinstance(map_file, MappingPlan):
+        plan = map_file
+    else:
+        # compile the mapping once, rather than interpreting it for every cell
+        map_df: pd.DataFrame = pd.read_csv(map_file, header=0)
+        plan = compile_mapping(map_df, date_format, timezone)
 
     # setup the data -----------------------------------------------------------
-    relevant_cols = map_df["raw_variable"].dropna().unique()
+    relevant_cols = plan.raw_variables
     filtered_data = data.loc[:, data.columns.isin(relevant_cols)].copy()
 
     if filtered_data.empty:
@@ -345,34 +979,259 @@ def create_dictionary(
             return None
         filtered_data = filtered_data.groupby(subject_id, as_index=False).agg(condense)
 
-    if not one_to_one:
-        filtered_data = filtered_data.reset_index()
-        melted_data = filtered_data.melt(id_vars="index", var_name="column")
+    # Generate the flat_like dictionary
+    if one_to_one:
+        filtered_data["flat_dict"] = create_dicts_wide(filtered_data, plan)
+        return filtered_data
+    else:
+        return create_dicts_long(filtered_data, data, plan).to_frame()
 
-    # set up the mappings -------------------------------------------------------
 
-    # Fills the na input variables with the previous value
-    map_df["raw_variable"] = map_df["raw_variable"].ffill()
+def _mapped_data(
+    resource,
+    plan: MappingPlan,
+    data: pd.DataFrame,
+    one_to_one: bool,
+    subject_id: str,
+    date_format: str,
+    timezone: str,
+) -> pd.DataFrame | None:
+    "Creates the flat_dict column for a resource, or None if there is no data."
+    df = create_dictionary(
+        data,
+        plan,
+        resource.__name__,
+        one_to_one=one_to_one,
+        subject_id=subject_id,
+        date_format=date_format,
+        timezone=timezone,
+    )
+    if df is not None and not one_to_one:
+        df = df.dropna().reset_index(drop=True)
+    return df
+
 
-    # strips the text answers out of the response column
-    map_df["raw_response"] = map_df["raw_response"].apply(
-        lambda x: x.split(",")[0] if isinstance(x, str) else x
+def convert_resource(
+    resource,
+    plan: MappingPlan,
+    data: pd.DataFrame,
+    one_to_one: bool,
+    folder_name: str,
+    subject_id="subjid",
+    date_format="%Y-%m-%d",
+    timezone="UTC",
+    direct: bool = False,
+    parquet_options: ParquetOptions | None = None,
+    partitioning: Partitioning | None = None,
+    workers: int = 1,
+) -> tuple[int, int | None] | None:
+    """
+    Creates the FHIRflat file for a single resource from the raw data, saving any
+    validation errors alongside it.
+
+    Returns the number of rows converted and the number of validation errors (None if
+    there were none), or None if there was no data for the resource.
+    """
+
+    df = _mapped_data(
+        resource, plan, data, one_to_one, subject_id, date_format, timezone
     )
+    if df is None:
+        return None
 
-    # Set multi-index for easier access
-    map_df.set_index(["raw_variable", "raw_response"], inplace=True)
+    errors = resource.ingest_to_flat(
+        df,
+        os.path.join(folder_name, resource.__name__.lower()),
+        workers=workers,
+        direct=direct,
+        parquet_options=parquet_options,
+        partitioning=partitioning,
+    )
 
-    # Generate the flat_like dictionary
-    if one_to_one:
-        filtered_data["flat_dict"] = filtered_data.apply(
-            create_dict_wide, args=[map_df, date_format, timezone], axis=1
+    if errors is not None:
+        errors.to_csv(
+            os.path.join(folder_name, f"{resource.__name__.lower()}_errors.csv"),
+            index=False,
         )
-        return filtered_data
+        return len(df), len(errors)
+    return len(df), None
+
+
+def ingest_chunk(
+    resource,
+    plan: MappingPlan,
+    data: pd.DataFrame,
+    one_to_one: bool,
+    subject_id="subjid",
+    date_format="%Y-%m-%d",
+    timezone="UTC",
+    direct: bool = False,
+    workers: int = 1,
+) -> tuple[pd.DataFrame, pd.DataFrame | None, int] | None:
+    """
+    Converts one chunk of the raw data for a single resource, without writing it.
+
+    Returns the FHIRflat rows, the validation errors and the number of rows
+    converted, or None if the chunk has no data for the resource.
+    """
+
+    with warnings.catch_warnings():
+        # a chunk without data for a resource is expected, and reported at the end
+        # if none of the chunks had any
+        warnings.filterwarnings("ignore", message="No data found", category=UserWarning)
+        df = _mapped_data(
+            resource, plan, data, one_to_one, subject_id, date_format, timezone
+        )
+    if df is None:
+        return None
+    flat_df, errors = resource.ingest_to_flat_df(df, workers=workers, direct=direct)
+    return flat_df, errors, len(df)
+
+
+def _run_task(task: tuple):
+    """
+    Runs a function in a worker process, timing it and recording any warnings so
+    they can be raised again in the main process.
+    """
+    func, *args = task
+    start_time = timeit.default_timer()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        result = func(*args)
+    total_time = timeit.default_timer() - start_time
+    return result, total_time, [(str(w.message), w.category) for w in caught]
+
+
+def _run_tasks(tasks: list[tuple], executor: ProcessPoolExecutor | None):
+    """
+    Yields the result and time taken for each task, in order. Tasks run in the
+    executor if there is one, otherwise one after another in this process.
+    """
+    if executor is None:
+        for func, *args in tasks:
+            start_time = timeit.default_timer()
+            result = func(*args)
+            yield result, timeit.default_timer() - start_time
     else:
-        melted_data["flat_dict"] = melted_data.apply(
-            create_dict_long, args=[data, map_df, date_format, timezone], axis=1
+        for result, total_time, caught in executor.map(_run_task, tasks):
+            for message, category in caught:
+                warnings.warn(message, category, stacklevel=3)
+            yield result, total_time
+
+
+def _used_data(data: pd.DataFrame, plan: MappingPlan, subject_id: str):
+    "The columns of the data used by a mapping, to limit what is sent to workers."
+    return data[[c for c in data.columns if c == subject_id or c in plan.used_columns]]
+
+
+def _report_resource(resource, result: tuple[int, int | None] | None, total_time):
+    if result is None:
+        return
+    n_rows, error_length = result
+    print(
+        f"{resource.__name__} took {total_time:.2f} seconds to convert {n_rows} rows. "
+    )
+    if error_length is not None:
+        print(
+            f"{error_length} resources not created due to validation errors. "
+            f"Errors saved to {resource.__name__.lower()}_errors.csv"
+        )
+
+
+def _convert_chunks(
+    chunks: Iterable[pd.DataFrame],
+    plans: dict,
+    one_to_one: dict,
+    folder_name: str,
+    executor: ProcessPoolExecutor | None,
+    subject_id: str,
+    date_format: str,
+    timezone: str,
+    direct: bool = False,
+    parquet_options: ParquetOptions | None = None,
+    partitionings: dict | None = None,
+    workers: int = 1,
+):
+    """
+    Converts the raw data one chunk at a time, appending each chunk of every resource
+    to its FHIRflat file as a new row group, or to its partitions as new files.
+    """
+
+    partitionings = partitionings or {}
+    writers = {
+        resource: FlatWriter(
+            os.path.join(
+                folder_name,
+                resource.__name__.lower()
+                + ("" if resource in partitionings else ".parquet"),
+            ),
+            resource,
+            parquet_options,
+            partitionings.get(resource),
+        )
+        for resource in plans
+    }
+    n_rows = dict.fromkeys(plans, 0)
+    n_errors = dict.fromkeys(plans, 0)
+    times = dict.fromkeys(plans, 0.0)
+    has_data = dict.fromkeys(plans, False)
+
+    try:
+        for chunk in chunks:
+            tasks = [
+                (
+                    ingest_chunk,
+                    resource,
+                    plan,
+                    chunk if executor is None else _used_data(chunk, plan, subject_id),
+                    one_to_one[resource],
+                    subject_id,
+                    date_format,
+                    timezone,
+                    direct,
+                    workers,
+                )
+                for resource, plan in plans.items()
+            ]
+            for resource, (result, total_time) in zip(
+                plans, _run_tasks(tasks, executor), strict=True
+            ):
+                times[resource] += total_time
+                if result is None:
+                    continue
+                flat_df, errors, rows = result
+                has_data[resource] = True
+                n_rows[resource] += rows
+                writers[resource].write(flat_df)
+                if errors is not None:
+                    errors.to_csv(
+                        os.path.join(
+                            folder_name, f"{resource.__name__.lower()}_errors.csv"
+                        ),
+                        mode="a" if n_errors[resource] else "w",
+                        header=not n_errors[resource],
+                        index=False,
+                    )
+                    n_errors[resource] += len(errors)
+    except BaseException:
+        for writer in writers.values():
+            writer.discard()
+        raise
+
+    for resource, writer in writers.items():
+        start_time = timeit.default_timer()
+        writer.close()
+        times[resource] += timeit.default_timer() - start_time
+        if not has_data[resource]:
+            warnings.warn(
+                f"No data found for the {resource.__name__} resource.",
+                UserWarning,
+                stacklevel=3,
+            )
+            continue
+        _report_resource(
+            resource, (n_rows[resource], n_errors[resource] or None), times[resource]
         )
-        return melted_data["flat_dict"].to_frame()
 
 
 def checksum(file: str) -> str:
@@ -392,17 +1251,25 @@ def checksum_text(checksums: dict[str, str]) -> str:
 
 
 def generate_metadata(folder_name: str) -> tuple[FlatMetadata, dict[str, str]]:
-    "Generate metadata for a FHIRflat folder"
+    """
+    Generate metadata for a FHIRflat folder. Resources can be single parquet files or
+    hive partitioned folders of them, whose files are listed in the checksums by
+    their path relative to the FHIRflat folder.
+    """
 
     patient_file = os.path.join(folder_name, "patient.parquet")
+    if not os.path.exists(patient_file):
+        # written as a partitioned folder
+        patient_file = os.path.join(folder_name, "patient")
     if not os.path.exists(patient_file):
         N = "NA"
     else:
-        N = len(pd.read_parquet(patient_file).id.unique())
+        N = len(pd.read_parquet(patient_file, columns=["id"]).id.unique())
     if isinstance(N, int):
         assert N > 0, "patient.parquet file is empty"
     checksums = {
-        os.path.basename(f): checksum(f) for f in glob(f"{folder_name}/*.parquet")
+        Path(os.path.relpath(f, folder_name)).as_posix(): checksum(f)
+        for f in glob(f"{folder_name}/**/*.parquet", recursive=True)
     }
     m = hashlib.sha256()
     m.update(checksum_text(checksums).encode("utf-8"))
@@ -420,7 +1287,7 @@ def write_metadata(
     metadata: FlatMetadata, checksums: dict[str, str], metadata_path: Path
 ):
     metadata_text = f"""[metadata]
-N = {metadata['N']}
+N = {metadata['N']!r}
 generator = "{metadata['generator']}"
 checksum = "{metadata['checksum']}"
 checksum_file = "{metadata['checksum_file']}"
@@ -438,6 +1305,12 @@ def convert_data_to_flat(
     sheet_id: str | None = None,
     subject_id="subjid",
     compress_format: None | str = None,
+    jobs: int = 1,
+    chunksize: int | None = None,
+    direct: bool = False,
+    parquet_options: ParquetOptions | None = None,
+    partition_by: dict[str, list[str]] | None = None,
+    workers: int = 1,
 ):
     """
     Takes raw clinical data (currently assumed to be a one-row-per-patient format like
@@ -467,6 +1340,31 @@ def convert_data_to_flat(
         The name of the column containing the subject ID in the data file.
     compress_format: optional str
         If the output folder should be zipped, and if so with what format.
+    jobs: int
+        The number of resources to convert in parallel, each in its own process.
+        Defaults to 1, converting resources one after another; 0 or less uses one
+        process per CPU.
+    chunksize: int | None
+        If given, the data is read and converted this many rows at a time, and each
+        chunk is appended to the FHIRflat files as it is converted, keeping memory use
+        bounded for large files. If any resource is one-to-one, the rows for each
+        subject must be next to each other in the data.
+    direct: bool
+        Flatten the validated resources straight to FHIRflat rows, skipping the
+        DataFrame built for each resource. Gives the same FHIRflat files.
+    parquet_options: ParquetOptions | None
+        Compression, row group size, dictionary encoding and statistics of the
+        FHIRflat files. Defaults to pyarrow's.
+    partition_by: dict[str, list[str]] | None
+        Partition keys for resources too large for a single file, by resource name,
+        e.g. {"Observation": ["site(subject)", "year(effectiveDateTime)"]}. These
+        resources are written as hive partitioned folders, e.g.
+        `observation/site=ABC/year=2024/part-0.parquet`. See `Partitioning` for the
+        keys that can be used.
+    workers: int
+        The number of processes used to validate and flatten the rows of each
+        resource, see `FHIRFlatBase.ingest_to_flat`. Defaults to 1. Combined with
+        `jobs`, each of the resources converted in parallel uses this many processes.
     """
 
     if not mapping_files_types and not sheet_id:
@@ -490,59 +1388,96 @@ def convert_data_to_flat(
             for r, i in sheet_keys.items()
         }
 
-    for resource, map_file in mappings.items():
-        start_time = timeit.default_timer()
+    for resource in mappings:
         t = types[resource.__name__]
-        if t == "one-to-one":
-            df = create_dictionary(
-                data,
-                map_file,
-                resource.__name__,
-                one_to_one=True,
-                subject_id=subject_id,
-                date_format=date_format,
-                timezone=timezone,
-            )
-            if df is None:
-                continue
-        elif t == "one-to-many":
-            df = create_dictionary(
-                data,
-                map_file,
-                resource.__name__,
-                one_to_one=False,
-                subject_id=subject_id,
-                date_format=date_format,
-                timezone=timezone,
-            )
-            if df is None:
-                continue
-            else:
-                df = df.dropna().reset_index(drop=True)
-        else:
+        if t not in ("one-to-one", "one-to-many"):
             raise ValueError(f"Unknown mapping type {t}")
 
-        errors = resource.ingest_to_flat(
-            df,
-            os.path.join(folder_name, resource.__name__.lower()),
+    # read each mapping and the raw data once, and share them between resources
+    plans = {
+        resource: compile_mapping(
+            pd.read_csv(map_file, header=0), date_format, timezone
         )
+        for resource, map_file in mappings.items()
+    }
+    one_to_one = {r: types[r.__name__] == "one-to-one" for r in plans}
 
-        end_time = timeit.default_timer()
-        total_time = end_time - start_time
-        print(
-            f"{resource.__name__} took {total_time:.2f} seconds to convert"
-            f" {len(df)} rows. "
+    partition_by = partition_by or {}
+    unmapped = set(partition_by) - {r.__name__ for r in plans}
+    if unmapped:
+        raise ValueError(
+            f"Can't partition {', '.join(sorted(unmapped))}, which have no mapping"
+        )
+    partitionings = {
+        r: Partitioning(partition_by[r.__name__])
+        for r in plans
+        if r.__name__ in partition_by
+    }
+
+    executor = None
+    if jobs != 1:
+        executor = ProcessPoolExecutor(
+            max_workers=min(jobs if jobs > 0 else os.cpu_count() or 1, len(plans))
         )
-        if errors is not None:
-            errors.to_csv(
-                os.path.join(folder_name, f"{resource.__name__.lower()}_errors.csv"),
-                index=False,
-            )
-            error_length = len(errors)
-            print(
-                f"{error_length} resources not created due to validation errors. "
-                f"Errors saved to {resource.__name__.lower()}_errors.csv"
-            )
+
+    try:
+        if chunksize:
+            with load_data(
+                data, plans.values(), subject_id=subject_id, chunksize=chunksize
+            ) as reader:
+                # only one-to-one resources need all the rows of a subject together
+                chunks = (
+                    iter_subject_chunks(reader, subject_id)
+                    if any(one_to_one.values())
+                    else reader
+                )
+                _convert_chunks(
+                    chunks,
+                    plans,
+                    one_to_one,
+                    folder_name,
+                    executor,
+                    subject_id,
+                    date_format,
+                    timezone,
+                    direct,
+                    parquet_options,
+                    partitionings,
+                    workers,
+                )
+        else:
+            raw_data = load_data(data, plans.values(), subject_id=subject_id)
+            tasks = [
+                (
+                    convert_resource,
+                    resource,
+                    plan,
+                    (
+                        raw_data
+                        if executor is None
+                        else _used_data(raw_data, plan, subject_id)
+                    ),
+                    one_to_one[resource],
+                    folder_name,
+                    subject_id,
+                    date_format,
+                    timezone,
+                    direct,
+                    parquet_options,
+                    partitionings.get(resource),
+                    workers,
+                )
+                for resource, plan in plans.items()
+            ]
+            # results are reported in the order of the mappings, so the output is
+            # the same whether or not resources are converted in parallel
+            for resource, (result, total_time) in zip(
+                plans, _run_tasks(tasks, executor), strict=True
+            ):
+                _report_resource(resource, result, total_time)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     write_metadata(*generate_metadata(folder_name), Path(folder_name) / "fhirflat.toml")
     if compress_format:
@@ -586,8 +1521,85 @@ def main():
         choices=["zip", "tar", "gztar", "bztar", "xztar"],
     )
 
+    parser.add_argument(
+        "--chunksize",
+        help="Convert the data this many rows at a time, keeping memory use bounded",
+        type=int,
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of resources to convert in parallel (0 for one per CPU)",
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of processes validating and flattening the rows of each resource",
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        "--direct",
+        help="Flatten resources straight to rows, without a DataFrame per resource",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--codec",
+        help="Compression codec of the parquet files",
+        choices=["snappy", "gzip", "brotli", "zstd", "lz4", "none"],
+        default="snappy",
+    )
+
+    parser.add_argument(
+        "--compression-level",
+        help="Compression level of the codec, if it has levels",
+        type=int,
+    )
+
+    parser.add_argument(
+        "--row-group-size",
+        help="Maximum number of rows in each row group of the parquet files",
+        type=int,
+    )
+
+    parser.add_argument(
+        "--dictionary-columns",
+        help="Only dictionary encode these columns (all are encoded by default)",
+        nargs="+",
+    )
+
+    parser.add_argument(
+        "--no-statistics",
+        help="Don't write column statistics to the parquet files",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--partition-by",
+        help=(
+            "Write a resource as a partitioned folder, e.g. "
+            "'Observation:site(subject),year(effectiveDateTime)'. Can be repeated"
+        ),
+        action="append",
+        metavar="RESOURCE:KEYS",
+        default=[],
+    )
+
     args = parser.parse_args()
 
+    partition_by = {}
+    for spec in args.partition_by:
+        resource, _, keys = spec.partition(":")
+        if not keys:
+            parser.error(f"--partition-by {spec} has no partition keys")
+        partition_by[resource] = keys.split(",")
+
     convert_data_to_flat(
         args.data,
         args.date_format,
@@ -596,6 +1608,20 @@ def main():
         sheet_id=args.sheet_id,
         subject_id=args.subject_id,
         compress_format=args.compress,
+        jobs=args.jobs,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        direct=args.direct,
+        parquet_options=ParquetOptions(
+            compression=args.codec,
+            compression_level=args.compression_level,
+            row_group_size=args.row_group_size,
+            dictionary_columns=(
+                args.dictionary_columns if args.dictionary_columns else True
+            ),
+            statistics=not args.no_statistics,
+        ),
+        partition_by=partition_by,
     )
 
 
@@ -0,0 +1,263 @@
+"""
+Joining of the resources of a FHIRflat folder on the references between them, such as
+`subject = "Patient/123"` or `encounter = "Encounter/10"`.
+
+References are parsed into (resource type, id) keys once for each distinct reference,
+and matched to the `id` column of the resource they refer to with a hash lookup,
+instead of joining on the reference strings.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from fhirflat.reader import read_flat
+
+# FHIR resource ids are up to 64 letters, digits, "-" and "."
+REFERENCE = r"^(?P<resourceType>[A-Z][A-Za-z]*)/(?P<id>[A-Za-z0-9\-\.]{1,64})$"
+
+
+def _name(resource) -> str:
+    return resource if isinstance(resource, str) else resource.__name__
+
+
+def parse_references(references: pa.Array | pa.ChunkedArray) -> pa.Table:
+    """
+    Parses FHIRflat references into a table of keys, with the resource type of each
+    reference (dictionary encoded) and its id. Values which aren't relative references,
+    e.g. "Patient/123", have null keys.
+    """
+    parsed = pc.extract_regex(references, REFERENCE)
+    return pa.table(
+        {
+            "resourceType": pc.dictionary_encode(
+                pc.struct_field(parsed, "resourceType")
+            ),
+            "id": pc.struct_field(parsed, "id"),
+        }
+    )
+
+
+def _distinct(references: pa.ChunkedArray) -> tuple[pa.Array, list[pa.Array]]:
+    """
+    The distinct values of a column, and for each of its chunks the position of its
+    values in them, so that each value only has to be parsed and looked up once.
+    """
+    if not pa.types.is_string(references.type):
+        references = references.cast(pa.string())
+    encoded = pc.dictionary_encode(references).unify_dictionaries()
+    if encoded.num_chunks == 0:
+        return pa.array([], pa.string()), []
+    return encoded.chunk(0).dictionary, [chunk.indices for chunk in encoded.chunks]
+
+
+def _referenced_type(keys: pa.Table, column: str) -> str | None:
+    "The resource type a reference column refers to, or None if it has no references."
+    types = pc.unique(keys.column("resourceType").cast(pa.string()))
+    types = [t for t in types.to_pylist() if t is not None]
+    if len(types) > 1:
+        raise ValueError(
+            f"Column {column} refers to {len(types)} resource types, expected one"
+        )
+    return types[0] if types else None
+
+
+def join_flat(
+    folder: str,
+    resource,
+    on: str | list[str],
+    columns: list[str] | None = None,
+    referenced_columns: dict[str, list[str]] | None = None,
+    filters: ds.Expression | list | None = None,
+    how: str = "left",
+    to_pandas: bool = True,
+) -> pd.DataFrame | pa.Table:
+    """
+    Joins the FHIRflat rows of a resource to the rows of the resources its references
+    refer to, e.g. observations to their encounters and patients.
+
+    Columns of a referenced resource are added prefixed with the reference column,
+    e.g. joining Observation on "encounter" adds "encounter.actualPeriod.start".
+
+    Parameters
+    ----------
+    folder: str
+        The FHIRflat folder.
+    resource: str or FHIRFlatBase class
+        The resource whose rows are joined, e.g. `Observation`.
+    on: str or list[str]
+        The reference columns to join on, e.g. ["encounter", "subject"]. The resource
+        each refers to is taken from the references. A column without references,
+        e.g. when no rows match the filters, adds null columns for its
+        `referenced_columns`, or no columns if they aren't given.
+    columns: list[str] (optional)
+        The columns of `resource` to read. Defaults to all columns.
+    referenced_columns: dict[str, list[str]] (optional)
+        The columns of the referenced resources to add, by reference column, e.g.
+        {"encounter": ["actualPeriod.start"]}. Defaults to all columns.
+    filters: pyarrow.dataset.Expression or list (optional)
+        Only join rows of `resource` matching the filters, see `read_flat`.
+    how: str
+        "left" keeps rows without a match, with nulls in the added columns, "inner"
+        only keeps rows with a match for every reference column.
+    to_pandas: bool
+        Return a pandas DataFrame (the default), or else an Arrow table.
+
+    Returns
+    -------
+    pd.DataFrame or pa.Table
+    """
+
+    if how not in ("left", "inner"):
+        raise ValueError(f"Unknown join {how}, expected 'left' or 'inner'")
+    on = [on] if isinstance(on, str) else on
+    if not on:
+        raise ValueError("At least one reference column to join on is needed")
+    referenced_columns = referenced_columns or {}
+    if columns is not None:
+        columns = columns + [c for c in on if c not in columns]
+    table = read_flat(folder, resource, columns, filters, to_pandas=False)
+
+    matched = None
+    for column in on:
+        references, positions = _distinct(table.column(column))
+        keys = parse_references(references)
+        referenced = _referenced_type(keys, column)
+        wanted = referenced_columns.get(column)
+        if referenced is None:
+            # e.g. no rows match the filters, so there is nothing to look up
+            for name in wanted or []:
+                table = table.append_column(
+                    f"{column}.{name}", pa.nulls(len(table), pa.null())
+                )
+            found = pa.array(np.zeros(len(table), dtype=bool))
+            matched = found if matched is None else pc.and_(matched, found)
+            continue
+        other = read_flat(
+            folder,
+            referenced,
+            None if wanted is None else ["id", *(c for c in wanted if c != "id")],
+            to_pandas=False,
+        )
+        # rows of the referenced resource, by a hash lookup of the ids
+        ids = pc.if_else(
+            pc.equal(keys.column("resourceType"), referenced), keys.column("id"), None
+        )
+        found_rows = pc.index_in(
+            ids.combine_chunks(), value_set=other.column("id").combine_chunks()
+        )
+        rows = pa.chunked_array(
+            [found_rows.take(p) for p in positions], type=found_rows.type
+        )
+        other = other.take(rows)
+        for name in wanted or other.column_names:
+            table = table.append_column(f"{column}.{name}", other.column(name))
+        found = pc.is_valid(rows)
+        matched = found if matched is None else pc.and_(matched, found)
+
+    if how == "inner":
+        table = table.filter(matched)
+    return table.to_pandas(ignore_metadata=True) if to_pandas else table
+
+
+def _subject_ids(table: pa.Table, resource: str) -> tuple[pa.Array, list[pa.Array]]:
+    """
+    The patient ids of the rows of a resource, which for patients are their own ids,
+    as distinct ids and the positions of each chunk's ids in them (see `_distinct`).
+    """
+    if resource == "Patient":
+        return _distinct(table.column("id"))
+    references, positions = _distinct(table.column("subject"))
+    keys = parse_references(references)
+    ids = pc.if_else(
+        pc.equal(keys.column("resourceType"), "Patient"), keys.column("id"), None
+    )
+    return ids.combine_chunks(), positions
+
+
+def iter_subjects(
+    folder: str,
+    resources: list,
+    columns: dict[str, list[str]] | None = None,
+    batch_size: int = 1000,
+    to_pandas: bool = True,
+) -> Iterator[dict[str, pd.DataFrame | pa.Table]]:
+    """
+    Yields the rows of several resources of a FHIRflat folder for batches of subjects
+    at a time, in order of their patient ids (compared as strings). All the rows of a
+    subject are in the same batch, sorted by subject within each resource, so
+    patient level tables can be built one batch at a time.
+
+    Memory use is not bounded by the batch size: the selected columns of every
+    resource are read into memory in full, and sorted by subject, before the first
+    batch is yielded. Only the columns needed should be given for large resources.
+
+    Parameters
+    ----------
+    folder: str
+        The FHIRflat folder.
+    resources: list
+        The resources to read, e.g. [Patient, Encounter, Observation]. Resources
+        other than Patient are matched to subjects on their `subject` column.
+    columns: dict[str, list[str]] (optional)
+        The columns to read of each resource, by resource name, e.g.
+        {"Observation": ["code.code", "valueQuantity.value"]}. The `subject` column
+        (or `id` for Patient) is always read. Defaults to all columns.
+    batch_size: int
+        The number of subjects in each batch.
+    to_pandas: bool
+        Yield pandas DataFrames (the default), or else Arrow tables.
+
+    Returns
+    -------
+    Iterator[dict[str, pd.DataFrame | pa.Table]]
+        The rows of each resource for a batch of subjects, by resource name.
+    """
+
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    columns = columns or {}
+
+    tables = {}
+    subject_ids = {}
+    for resource in resources:
+        name = _name(resource)
+        key_column = "id" if name == "Patient" else "subject"
+        wanted = columns.get(name)
+        if wanted is not None and key_column not in wanted:
+            wanted = [key_column, *wanted]
+        tables[name] = read_flat(folder, name, wanted, to_pandas=False)
+        subject_ids[name] = _subject_ids(tables[name], name)
+
+    # rows are sorted by the rank of their subject, so only the distinct subjects
+    # are sorted as strings
+    subjects = pc.unique(
+        pa.chunked_array([ids for ids, _ in subject_ids.values()], type=pa.string())
+    ).drop_null()
+    subjects = subjects.take(pc.sort_indices(subjects))
+    ranks = {}
+    for name, table in tables.items():
+        ids, positions = subject_ids[name]
+        id_ranks = pc.index_in(ids, value_set=subjects)
+        row_ranks = pa.chunked_array(
+            [id_ranks.take(p) for p in positions], type=id_ranks.type
+        )
+        # rows without a patient subject aren't in any batch
+        order = pc.sort_indices(row_ranks, null_placement="at_end")
+        n_rows = len(table) - row_ranks.null_count
+        tables[name] = table.take(order[:n_rows])
+        ranks[name] = row_ranks.take(order[:n_rows]).to_numpy()
+
+    for start in range(0, len(subjects), batch_size):
+        batch = {}
+        for name, table in tables.items():
+            lo, hi = np.searchsorted(ranks[name], [start, start + batch_size])
+            rows = table.slice(lo, hi - lo)
+            batch[name] = rows.to_pandas(ignore_metadata=True) if to_pandas else rows
+        yield batch
@@ -0,0 +1,148 @@
+"""
+Reading of FHIRflat folders, reading only the columns and rows that are needed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from fhirflat.ingest import FlatMetadata, checksum, checksum_text
+
+if sys.version_info < (3, 11):  # tomllib was introduced in 3.11
+    import tomli as tomllib  # pragma: no cover
+else:
+    import tomllib
+
+
+def read_metadata(folder: str) -> FlatMetadata:
+    "Reads the metadata of a FHIRflat folder from its fhirflat.toml file."
+    with open(os.path.join(folder, "fhirflat.toml"), "rb") as fp:
+        return tomllib.load(fp)["metadata"]
+
+
+def resource_path(folder: str, resource) -> str:
+    """
+    The path of the FHIRflat file of a resource in a folder, or of the folder of its
+    partitions if it was written partitioned.
+
+    Parameters
+    ----------
+    folder: str
+        The FHIRflat folder.
+    resource: str or FHIRFlatBase class
+        The resource, e.g. `Observation` or "observation".
+    """
+    name = resource if isinstance(resource, str) else resource.__name__
+    path = os.path.join(folder, name.lower())
+    if os.path.isfile(f"{path}.parquet"):
+        return f"{path}.parquet"
+    if os.path.isdir(path):
+        return path
+    raise FileNotFoundError(f"No FHIRflat file for {name} in {folder}")
+
+
+def verify_checksums(folder: str, files: list[str]):
+    """
+    Checks files of a FHIRflat folder against the checksums listed in the checksum
+    file named in its fhirflat.toml, and that file against the metadata checksum.
+    Raises a ValueError if any of them doesn't match.
+    """
+    metadata = read_metadata(folder)
+    checksum_file = os.path.join(folder, metadata["checksum_file"])
+    checksums = {}
+    with open(checksum_file) as fp:
+        for line in fp:
+            digest, _, name = line.rstrip("\n").partition("  ")
+            checksums[name] = digest
+    text = checksum_text(checksums).encode("utf-8")
+    if hashlib.sha256(text).hexdigest() != metadata["checksum"]:
+        raise ValueError(f"Checksum of {checksum_file} doesn't match fhirflat.toml")
+    for file in files:
+        name = Path(os.path.relpath(file, folder)).as_posix()
+        if name not in checksums:
+            raise ValueError(f"{name} is not listed in {metadata['checksum_file']}")
+        if checksum(file) != checksums[name]:
+            raise ValueError(f"Checksum of {name} doesn't match")
+
+
+def flat_dataset(folder: str, resource) -> ds.Dataset:
+    """
+    A pyarrow dataset of the FHIRflat file of a resource, or of its partitions,
+    with the partition keys as columns.
+    """
+    path = resource_path(folder, resource)
+    if os.path.isfile(path):
+        return ds.dataset(path, format="parquet")
+    return ds.dataset(path, format="parquet", partitioning="hive")
+
+
+def _index_columns(schema: pa.Schema) -> list[str]:
+    "The columns storing the pandas index of the DataFrame a file was written from."
+    metadata = (schema.metadata or {}).get(b"pandas")
+    if metadata is None:
+        return []
+    # a RangeIndex is stored in the metadata rather than as a column
+    return [c for c in json.loads(metadata)["index_columns"] if isinstance(c, str)]
+
+
+def read_flat(
+    folder: str,
+    resource,
+    columns: list[str] | None = None,
+    filters: ds.Expression | list | None = None,
+    to_pandas: bool = True,
+    verify: bool = False,
+) -> pd.DataFrame | pa.Table:
+    """
+    Reads FHIRflat rows of a resource from a FHIRflat folder, as written by
+    `convert_data_to_flat`. Only the requested columns are read, and the filters are
+    used to skip the partitions and row groups whose column statistics show they
+    have no matching rows, so reading a few columns for one site or period doesn't
+    read the whole file.
+
+    Parameters
+    ----------
+    folder: str
+        The FHIRflat folder, containing fhirflat.toml and a file or partitioned
+        folder for each resource.
+    resource: str or FHIRFlatBase class
+        The resource to read, e.g. `Observation` or "observation".
+    columns: list[str] (optional)
+        The FHIRflat columns to read, e.g. ["subject", "effectiveDateTime"], which
+        can include partition keys. Defaults to all columns.
+    filters: pyarrow.dataset.Expression or list (optional)
+        Only read rows matching the filters, either as an expression, e.g.
+        `ds.field("year") == 2024`, or in the format of `pandas.read_parquet`, e.g.
+        [("site", "in", ["ABC", "DEF"]), ("status", "==", "final")].
+    to_pandas: bool
+        Return a pandas DataFrame (the default), or else an Arrow table.
+    verify: bool
+        Check the files read against the checksums in the folder before reading
+        them, raising a ValueError if any of them has changed. This reads the files
+        in full.
+
+    Returns
+    -------
+    pd.DataFrame or pa.Table
+    """
+
+    dataset = flat_dataset(folder, resource)
+    if verify:
+        verify_checksums(folder, dataset.files)
+    if filters is not None and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+    # the pandas index stored in single files doesn't apply to a selection of rows
+    index_columns = _index_columns(dataset.schema)
+    if columns is None and index_columns:
+        columns = [c for c in dataset.schema.names if c not in index_columns]
+    table = dataset.to_table(columns=columns, filter=filters)
+    return table.to_pandas(ignore_metadata=True) if to_pandas else table
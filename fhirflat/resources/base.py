@@ -2,21 +2,215 @@
 from __future__ import annotations
 
 import datetime
+import functools
+import re
 import warnings
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import repeat
 from typing import ClassVar, TypeAlias
 
 import numpy as np
 import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from fhir.resources.domainresource import DomainResource as _DomainResource
 from pydantic.v1 import ValidationError
 
-from fhirflat.fhir2flat import fhir2flat
+from fhirflat.arrow_types import column_type
+from fhirflat.fhir2flat import (
+    _UnsupportedStructure,
+    fhir2flat,
+    fhir2flat_many,
+    flatten_resource,
+)
 from fhirflat.flat2fhir import expand_concepts
+from fhirflat.writer import FlatWriter, ParquetOptions, Partitioning, write_flat
 
 JsonString: TypeAlias = str
 
 
+def _ingest_shard(
+    cls: type[FHIRFlatBase], flat_dicts: list[dict], direct: bool = False
+) -> list[tuple[pd.Series | dict | ValidationError, dict | None]]:
+    """
+    Runs `FHIRFlatBase.ingest_rows` in a worker process. Rows which fail validation
+    are returned with their flat_dict, as creating the resource may have modified it.
+    """
+    rows = cls.ingest_rows(flat_dicts, direct=direct)
+    return [
+        (row, flat_dict if isinstance(row, ValidationError) else None)
+        for row, flat_dict in zip(rows, flat_dicts, strict=True)
+    ]
+
+
+class FlatSchema:
+    """
+    The parts of a resource class's schema used when converting to and from
+    FHIRflat, worked out once per class (see `FHIRFlatBase.flat_schema`) rather
+    than from the pydantic fields on every call.
+    """
+
+    __slots__ = (
+        "attr_lists",
+        "defaults",
+        "exclusions",
+        "flat_fields",
+        "flat_lists",
+        "list_fields",
+    )
+
+    def __init__(self, cls: type[FHIRFlatBase]):
+        # attributes which take a list of FHIR types
+        self.attr_lists: tuple[str, ...] = tuple(
+            p.alias
+            for p in cls.element_properties()
+            if "typing.List" in str(p.outer_type_) or "list" in str(p.outer_type_)
+        )
+        self.list_fields: frozenset[str] = frozenset(self.attr_lists)
+        self.exclusions: frozenset[str] = frozenset(cls.flat_exclusions)
+        self.flat_fields: tuple[str, ...] = tuple(
+            x for x in cls.elements_sequence() if x not in self.exclusions
+        )
+        # list attributes which are expanded in the FHIRflat representation
+        self.flat_lists: tuple[str, ...] = tuple(
+            x for x in self.attr_lists if x not in self.exclusions
+        )
+        # patterns matching the columns removed by `flat_defaults`
+        self.defaults: tuple[re.Pattern, ...] = tuple(
+            re.compile(attr) for attr in cls.flat_defaults
+        )
+
+    def drop_defaults(self, columns) -> list[str]:
+        "The columns which are removed by `flat_defaults`."
+        return [c for c in columns if any(p.search(c) for p in self.defaults)]
+
+
+@functools.cache
+def _flat_schema(cls: type[FHIRFlatBase]) -> FlatSchema:
+    return FlatSchema(cls)
+
+
+def _line_ranges(file: str, lines: int) -> Iterator[tuple[int, int]]:
+    """
+    Splits a file on line boundaries into byte ranges of `lines` lines each (the
+    last range may have fewer), reading it in blocks rather than line by line.
+    """
+    start = offset = count = 0
+    with open(file, "rb") as f:
+        while block := f.read(2**20):
+            i = block.find(b"\n")
+            while i != -1:
+                count += 1
+                if count == lines:
+                    yield start, offset + i + 1
+                    start = offset + i + 1
+                    count = 0
+                i = block.find(b"\n", i + 1)
+            offset += len(block)
+    if offset > start:
+        yield start, offset
+
+
+def _import_lines(cls: type[FHIRFlatBase], file: str, start: int, end: int) -> list:
+    "Parses and validates the resources on the lines of a file in a byte range."
+    with open(file, "rb") as f:
+        f.seek(start)
+        return [cls(**orjson.loads(line)) for line in f.read(end - start).splitlines()]
+
+
+def _flatten_lines(
+    cls: type[FHIRFlatBase], file: str, start: int, end: int
+) -> pd.DataFrame:
+    "Parses, validates and flattens the resources on the lines of a file."
+    return cls.flatten_batch(_import_lines(cls, file, start, end))
+
+
+def _map_ordered(
+    executor: Executor, func: Callable, tasks: Iterable[tuple], window: int
+) -> Iterator:
+    """
+    Yields the results of running `func` on each set of arguments in `tasks`, in
+    order. Unlike `Executor.map`, at most `window` tasks are submitted ahead of the
+    results that have been used, so results waiting to be used don't build up.
+    """
+    pending: deque = deque()
+    try:
+        for args in tasks:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _iso_value(value):
+    """
+    Converts the dates and times nested in a FHIRflat value to ISO strings, in the
+    format pandas uses when writing JSON.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+            return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+        return value.strftime("%Y-%m-%dT%H:%M:%S")
+    if isinstance(value, datetime.date):
+        return value.strftime("%Y-%m-%dT00:00:00")
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _iso_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_iso_value(v) for v in value]
+    return value
+
+
+def _has_temporal(t: pa.DataType) -> bool:
+    "Whether an arrow type is, or contains, a date or time."
+    if pa.types.is_struct(t):
+        return any(_has_temporal(t.field(i).type) for i in range(t.num_fields))
+    if pa.types.is_list(t) or pa.types.is_large_list(t):
+        return _has_temporal(t.value_type)
+    return pa.types.is_temporal(t)
+
+
+def _column_values(column: pa.Array | pa.ChunkedArray) -> list:
+    """
+    The values of a FHIRflat column as Python objects, with dates and times as ISO
+    strings. Top level date columns are formatted column-wise.
+    """
+    t = column.type
+    if pa.types.is_timestamp(t) or pa.types.is_date(t):
+        # pandas writes whole seconds, with timezone aware times in UTC
+        tz = "UTC" if pa.types.is_timestamp(t) and t.tz is not None else None
+        column = column.cast(pa.timestamp("s", tz), safe=False)
+        fmt = "%Y-%m-%dT%H:%M:%SZ" if tz else "%Y-%m-%dT%H:%M:%S"
+        return pc.strftime(column, format=fmt).to_pylist()
+    if _has_temporal(t):
+        return [_iso_value(v) for v in column.to_pylist()]
+    return column.to_pylist()
+
+
+def _flat_rows(table: pa.Table | pa.RecordBatch) -> list[dict]:
+    """
+    Converts FHIRflat rows to dictionaries, giving the same values as writing each
+    row to JSON with pandas and reading it back in.
+    """
+    metadata = table.schema.pandas_metadata or {}
+    index_columns = [c for c in metadata.get("index_columns", []) if isinstance(c, str)]
+    names = [n for n in table.column_names if n not in index_columns]
+    columns = [_column_values(table.column(n)) for n in names]
+    return [
+        dict(zip(names, values, strict=True)) for values in zip(*columns, strict=True)
+    ]
+
+
 class FHIRFlatBase(_DomainResource):
     """
     Base class for FHIR resources to add FHIRflat functionality.
@@ -35,19 +229,31 @@ class FHIRFlatBase(_DomainResource):
 
     backbone_elements: ClassVar[dict] = {}
 
+    @classmethod
+    def flat_schema(cls) -> FlatSchema:
+        "The FHIRflat schema information for the class, cached after the first call."
+        return _flat_schema(cls)
+
+    @classmethod
+    def arrow_schema(cls, columns: Iterable[str]) -> pa.Schema:
+        """
+        The Arrow types of those FHIRflat columns whose type is fixed by the FHIR
+        type of the data they hold (see `fhirflat.arrow_types`). Other columns are
+        left out, and stored with the type inferred from the data when written.
+        """
+        return pa.schema(
+            [(c, t) for c in columns if (t := column_type(cls, c)) is not None]
+        )
+
     @classmethod
     def attr_lists(cls) -> list[str]:
         """Attributes which take a list of FHIR types."""
-        return [
-            p.alias
-            for p in cls.element_properties()
-            if "typing.List" in str(p.outer_type_) or "list" in str(p.outer_type_)
-        ]
+        return list(cls.flat_schema().attr_lists)
 
     @classmethod
     def flat_fields(cls) -> list[str]:
         "All fields that are present in the FHIRflat representation"
-        return [x for x in cls.elements_sequence() if x not in cls.flat_exclusions]
+        return list(cls.flat_schema().flat_fields)
 
     @classmethod
     def cleanup(cls, data: dict) -> dict:
@@ -77,7 +283,8 @@ class FHIRFlatBase(_DomainResource):
         data = expand_concepts(data, cls)
 
         # create lists for properties which are lists of FHIR types
-        for field in [x for x in data.keys() if x in cls.attr_lists()]:
+        list_fields = cls.flat_schema().list_fields
+        for field in [x for x in data.keys() if x in list_fields]:
             if not isinstance(data[field], list):
                 data[field] = [data[field]]
 
@@ -101,31 +308,29 @@ class FHIRFlatBase(_DomainResource):
         FHIRFlatBase or list[FHIRFlatBase]
         """
 
-        df = pd.read_parquet(file)
+        table = pq.read_table(file)
 
-        df["fhir"] = df.apply(
-            lambda row: row.to_json(date_format="iso", date_unit="s"), axis=1
-        ).apply(lambda x: cls.create_fhir_resource(x))
+        resources = [cls.create_fhir_resource(row) for row in _flat_rows(table)]
 
-        if len(df) == 1:
-            resource = df["fhir"].iloc[0]
+        if len(resources) == 1:
+            resource = resources[0]
             if isinstance(resource, ValidationError):
                 raise resource
             else:
                 return resource
         else:
-            resources = list(df["fhir"])
             if any(isinstance(r, ValidationError) for r in resources):
-                validation_error_mask = df["fhir"].apply(
-                    lambda x: isinstance(x, ValidationError)
+                validation_error_mask = np.array(
+                    [isinstance(r, ValidationError) for r in resources]
                 )
 
-                errors = df[validation_error_mask].copy()
-                errors.rename(columns={"fhir": "validation_error"}, inplace=True)
+                errors = table.to_pandas()[validation_error_mask]
+                errors["validation_error"] = [
+                    r for r in resources if isinstance(r, ValidationError)
+                ]
                 errors.to_csv(f"{cls.__name__.lower()}_errors.csv", index=False)
 
-                valid_fhir = df[~validation_error_mask]
-                resources = list(valid_fhir["fhir"])
+                resources = [r for r in resources if not isinstance(r, ValidationError)]
 
                 warnings.warn(
                     "Validation errors found in the data."
@@ -135,6 +340,50 @@ class FHIRFlatBase(_DomainResource):
                 )
             return resources
 
+    @classmethod
+    def iter_from_flat(
+        cls,
+        file: str,
+        batch_size: int | None = None,
+        on_error: Callable[[pd.Series, ValidationError], None] | None = None,
+    ) -> Iterator[FHIRFlatBase]:
+        """
+        Takes a FHIRflat parquet file and lazily yields a resource for each row.
+        The file is read one row group (or `batch_size` rows) at a time, so only one
+        batch of rows is held in memory.
+
+        Parameters
+        ----------
+        file: str
+            Path to the parquet FHIRflat file containing clinical data
+        batch_size: int (optional)
+            Number of rows read at a time. Defaults to reading one row group at a time.
+        on_error: callable (optional)
+            Called with the row and the validation error for each row that doesn't
+            form a valid resource; the row is then skipped. If not given, the
+            validation error is raised.
+
+        Returns
+        -------
+        Iterator[FHIRFlatBase]
+        """
+
+        parquet = pq.ParquetFile(file)
+        if batch_size:
+            batches = parquet.iter_batches(batch_size)
+        else:
+            batches = (parquet.read_row_group(i) for i in range(parquet.num_row_groups))
+
+        for batch in batches:
+            for i, row in enumerate(_flat_rows(batch)):
+                resource = cls.create_fhir_resource(row)
+                if not isinstance(resource, ValidationError):
+                    yield resource
+                elif on_error is None:
+                    raise resource
+                else:
+                    on_error(batch.slice(i, 1).to_pandas().iloc[0], resource)
+
     @classmethod
     def ingest_backbone_elements(cls, mapped_data: pd.Series) -> pd.Series:
         """
@@ -186,7 +435,37 @@ class FHIRFlatBase(_DomainResource):
         return condensed_mapped_data
 
     @classmethod
-    def ingest_to_flat(cls, data: pd.DataFrame, filename: str) -> pd.DataFrame | None:
+    def ingest_rows(
+        cls, flat_dicts: list[dict], direct: bool = False
+    ) -> list[pd.Series | dict | ValidationError]:
+        """
+        Creates the FHIR resource for each FHIRflat-like dictionary and flattens it
+        again, returning the FHIRflat row or the validation error for each one.
+
+        If `direct` is True, rows are flattened with `to_flat_dict` and returned as
+        dictionaries, rather than as Series built by `to_flat`.
+        """
+        rows = []
+        for flat_dict in flat_dicts:
+            resource = cls.create_fhir_resource(flat_dict)
+            if isinstance(resource, ValidationError):
+                rows.append(resource)
+            elif direct:
+                rows.append(resource.to_flat_dict())
+            else:
+                rows.append(resource.to_flat())
+        return rows
+
+    @classmethod
+    def ingest_to_flat(
+        cls,
+        data: pd.DataFrame,
+        filename: str,
+        workers: int = 1,
+        direct: bool = False,
+        parquet_options: ParquetOptions | None = None,
+        partitioning: Partitioning | None = None,
+    ) -> pd.DataFrame | None:
         """
         Takes a pandas dataframe and populates the resource with the data.
         Creates a FHIRflat parquet file for the resources.
@@ -197,6 +476,17 @@ class FHIRFlatBase(_DomainResource):
             Pandas dataframe containing the data
         filename: str
             Name of the parquet file to be generated.
+        workers: int
+            Number of processes used to validate and flatten the resources.
+        direct: bool
+            Flatten the validated resources straight to FHIRflat rows, without
+            building a DataFrame for each one. See `to_flat_dict`.
+        parquet_options: ParquetOptions (optional)
+            Compression, row group size, dictionary encoding and statistics of the
+            parquet file. Defaults to pyarrow's.
+        partitioning: Partitioning (optional)
+            Write the resources as a hive partitioned folder named `filename` instead
+            of a single parquet file.
 
         Returns
         -------
@@ -204,19 +494,85 @@ class FHIRFlatBase(_DomainResource):
             A dataframe containing the flat_dict and validation errors.
         """
 
-        data.loc[:, "flat_dict"] = cls.ingest_backbone_elements(data["flat_dict"])
+        flat_df, data_errors = cls.ingest_to_flat_df(
+            data, workers=workers, direct=direct
+        )
+        if not flat_df.empty:
+            write_flat(
+                flat_df,
+                filename if partitioning else f"{filename}.parquet",
+                cls.arrow_schema(flat_df.columns),
+                parquet_options,
+                partitioning,
+            )
+        return data_errors
 
-        # Creates a columns of FHIR resource instances
-        data["fhir"] = data["flat_dict"].apply(lambda x: cls.create_fhir_resource(x))
+    @classmethod
+    def ingest_to_flat_df(
+        cls, data: pd.DataFrame, workers: int = 1, direct: bool = False
+    ) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+        """
+        Populates the resource with the data and flattens the valid resources, without
+        writing them to a file. Used by `ingest_to_flat`, and when ingesting data in
+        chunks.
 
-        validation_error_mask = data["fhir"].apply(
-            lambda x: isinstance(x, ValidationError)
-        )
+        Parameters
+        ----------
+        data: pd.DataFrame
+            Pandas dataframe containing the data
+        workers: int
+            Number of processes used to validate and flatten the resources. Rows are
+            split into contiguous shards, and the results are returned in the original
+            order.
+        direct: bool
+            Flatten the validated resources straight to FHIRflat rows, without
+            building a DataFrame for each one. See `to_flat_dict`.
 
-        valid_fhir = data[~validation_error_mask].copy()
+        Returns
+        -------
+        tuple[pd.DataFrame, pd.DataFrame or None]
+            The FHIRflat rows, and a dataframe containing the flat_dict and validation
+            errors.
+        """
+
+        if data.empty:
+            return pd.DataFrame(), None
+
+        data.loc[:, "flat_dict"] = cls.ingest_backbone_elements(data["flat_dict"])
+
+        # Creates the FHIR resources and flattens them back out
+        flat_dicts = data["flat_dict"].tolist()
+        if workers > 1 and len(flat_dicts) > 1:
+            results = []
+            # several shards per worker to even out the load
+            size = -(-len(flat_dicts) // (workers * 4))
+            starts = range(0, len(flat_dicts), size)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                shards = executor.map(
+                    _ingest_shard,
+                    repeat(cls),
+                    (flat_dicts[i : i + size] for i in starts),
+                    repeat(direct),
+                )
+                for start, shard in zip(starts, shards, strict=True):
+                    for i, (row, flat_dict) in enumerate(shard, start):
+                        if flat_dict is not None:
+                            flat_dicts[i] = flat_dict
+                        results.append(row)
+            data["flat_dict"] = pd.Series(flat_dicts, index=data.index, dtype=object)
+        else:
+            results = cls.ingest_rows(flat_dicts, direct=direct)
 
-        # flattens resources back out
-        flat_df = valid_fhir["fhir"].apply(lambda x: x.to_flat())
+        fhir = pd.Series(results, index=data.index, dtype=object)
+        validation_error_mask = fhir.apply(lambda x: isinstance(x, ValidationError))
+
+        valid_rows = fhir[~validation_error_mask]
+        # a fresh index, so the index isn't stored when writing the rows
+        flat_df = (
+            pd.DataFrame(valid_rows.tolist(), index=pd.RangeIndex(len(valid_rows)))
+            if not valid_rows.empty
+            else pd.DataFrame()
+        )
 
         if not flat_df.empty:
             # create FHIR expected date format
@@ -249,13 +605,14 @@ class FHIRFlatBase(_DomainResource):
                     lambda x: [x] if isinstance(x, str) else x
                 )
 
-            flat_df.to_parquet(f"{filename}.parquet")
         data_errors = data[validation_error_mask].copy()
-        data_errors.rename(columns={"fhir": "validation_error"}, inplace=True)
-        return data_errors if not data_errors.empty else None
+        data_errors["validation_error"] = fhir[validation_error_mask]
+        return flat_df, data_errors if not data_errors.empty else None
 
     @classmethod
-    def fhir_bulk_import(cls, file: str) -> FHIRFlatBase | list[FHIRFlatBase]:
+    def fhir_bulk_import(
+        cls, file: str, workers: int = 1
+    ) -> FHIRFlatBase | list[FHIRFlatBase]:
         """
         Takes a ndjson file containing FHIR resources as json strings and returns a
         list of populated FHIR resources.
@@ -264,17 +621,27 @@ class FHIRFlatBase(_DomainResource):
         ----------
         file: str
             Path to the .ndjson file containing FHIR data
+        workers: int
+            Number of processes used to parse and validate the resources. The file is
+            split into contiguous ranges of lines, and the resources are returned in
+            the order of the file.
 
         Returns
         -------
         FHIRFlatBase or list[FHIRFlatBase]
         """
 
-        resources = []
-        with open(file, "r") as f:
-            for line in f:
-                data = orjson.loads(line)
-                resources.append(cls(**data))
+        batch_size = 10000
+        if workers > 1:
+            # several ranges per worker to even out the load
+            n_lines = sum(1 for _ in _line_ranges(file, 1))
+            batch_size = max(-(-n_lines // (workers * 4)), 1)
+
+        resources = [
+            r
+            for batch in cls.fhir_bulk_import_batches(file, batch_size, workers)
+            for r in batch
+        ]
 
         if len(resources) == 1:
             return resources[0]
@@ -282,10 +649,80 @@ class FHIRFlatBase(_DomainResource):
             return resources
 
     @classmethod
-    def fhir_file_to_flat(cls, source_file: str, output_name: str | None = None):
+    def fhir_bulk_import_batches(
+        cls, file: str, batch_size: int = 10000, workers: int = 1
+    ) -> Iterator[list[FHIRFlatBase]]:
+        """
+        Reads a ndjson file containing FHIR resources as json strings, yielding lists
+        of at most `batch_size` populated FHIR resources, so the whole file is never
+        held in memory.
+
+        Parameters
+        ----------
+        file: str
+            Path to the .ndjson file containing FHIR data
+        batch_size: int
+            The maximum number of resources in each list.
+        workers: int
+            Number of processes used to parse and validate the resources, each
+            working on `batch_size` lines of the file at a time. Batches are yielded
+            in the order of the file.
+        """
+
+        if workers > 1:
+            ranges = _line_ranges(file, batch_size)
+            tasks = ((cls, file, start, end) for start, end in ranges)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                yield from _map_ordered(
+                    executor, _import_lines, tasks, window=workers * 2
+                )
+            return
+
+        batch = []
+        with open(file, "r") as f:
+            for line in f:
+                data = orjson.loads(line)
+                batch.append(cls(**data))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    @classmethod
+    def flatten_batch(cls, resources: list[FHIRFlatBase]) -> pd.DataFrame:
+        """
+        Flattens a list of resources into FHIRflat rows, removing the attributes which
+        aren't used in FHIRflat.
+        """
+
+        schema = cls.flat_schema()
+
+        for resource in resources:
+            for field in schema.exclusions:
+                setattr(resource, field, None)
+
+        df = fhir2flat_many(resources, lists=list(schema.flat_lists))
+
+        # remove required attributes now it's in the flat representation
+        return df.drop(columns=schema.drop_defaults(df.columns))
+
+    @classmethod
+    def fhir_file_to_flat(
+        cls,
+        source_file: str,
+        output_name: str | None = None,
+        batch_size: int = 10000,
+        workers: int = 1,
+        parquet_options: ParquetOptions | None = None,
+    ):
         """
         Converts a .ndjson file of exported FHIR resources to a FHIRflat parquet file.
 
+        The file is read, validated and flattened `batch_size` resources at a time,
+        with each batch written as a row group of the parquet file, so memory use
+        doesn't grow with the size of the export.
+
         Parameters
         ----------
         source_file: str
@@ -293,29 +730,32 @@ class FHIRFlatBase(_DomainResource):
         output_name: str (optional)
             Name of the parquet file to be generated, optional, defaults to
             {resource}.parquet
+        batch_size: int
+            Number of resources converted at a time.
+        workers: int
+            Number of processes used to convert batches of resources. The output is
+            the same as converting them in a single process.
+        parquet_options: ParquetOptions (optional)
+            Compression, row group size, dictionary encoding and statistics of the
+            parquet file. Defaults to pyarrow's; batches larger than the row group
+            size are split into several row groups.
         """
 
         if not output_name:
             output_name = f"{cls.resource_type}.parquet"
 
-        # identify attributes that are lists of FHIR types and not excluded
-        list_resources = [x for x in cls.attr_lists() if x not in cls.flat_exclusions]
-
-        fhir_data = cls.fhir_bulk_import(source_file)
-
-        flat_rows = []
-        for resource in fhir_data:
-            for field in cls.flat_exclusions:
-                setattr(resource, field, None)
-            flat_rows.append(fhir2flat(resource, lists=list_resources))
-
-        df = pd.concat(flat_rows)
-
-        # remove required attributes now it's in the flat representation
-        for attr in cls.flat_defaults:
-            df.drop(list(df.filter(regex=attr)), axis=1, inplace=True)
-
-        df.to_parquet(output_name)
+        with FlatWriter(output_name, cls, parquet_options) as writer:
+            if workers > 1:
+                ranges = _line_ranges(source_file, batch_size)
+                tasks = ((cls, source_file, start, end) for start, end in ranges)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for df in _map_ordered(
+                        executor, _flatten_lines, tasks, window=workers * 2
+                    ):
+                        writer.write(df)
+            else:
+                for batch in cls.fhir_bulk_import_batches(source_file, batch_size):
+                    writer.write(cls.flatten_batch(batch))
 
     def to_flat(self, filename: str | None = None) -> None | pd.Series:
         """
@@ -327,23 +767,39 @@ class FHIRFlatBase(_DomainResource):
             Name of the parquet file to be generated.
         """
 
-        # identify attributes that are lists of FHIR types
-        list_resources = self.attr_lists()
+        schema = self.flat_schema()
 
         # clear data from attributes not used in FHIRflat
-        for field in self.flat_exclusions:
+        for field in schema.exclusions:
             setattr(self, field, None)
-            list_resources.remove(field) if field in list_resources else None
 
-        flat_df = fhir2flat(self, lists=list_resources)
+        flat_df = fhir2flat(self, lists=list(schema.flat_lists))
 
         # remove required attributes now it's in the flat representation
-        for attr in self.flat_defaults:
-            flat_df.drop(list(flat_df.filter(regex=attr)), axis=1, inplace=True)
+        flat_df.drop(columns=schema.drop_defaults(flat_df.columns), inplace=True)
 
         if filename:
-            flat_df.to_parquet(filename)
+            write_flat(flat_df, filename, self.arrow_schema(flat_df.columns))
             return None
         else:
             assert flat_df.shape[0] == 1
             return flat_df.loc[0]
+
+    def to_flat_dict(self) -> dict:
+        """
+        Flattens the resource to a FHIRflat row as a dictionary, working on the
+        resource's data directly instead of a one-row DataFrame. Gives the same row as
+        `to_flat`, and falls back to it for the structures `flatten_resource` doesn't
+        handle.
+        """
+
+        schema = self.flat_schema()
+        data = {k: v for k, v in self.dict().items() if k not in schema.exclusions}
+        try:
+            row = flatten_resource(data, lists=list(schema.flat_lists))
+        except _UnsupportedStructure:
+            return self.to_flat().to_dict()
+
+        # remove required attributes now it's in the flat representation
+        dropped = set(schema.drop_defaults(row))
+        return {k: v for k, v in row.items() if k not in dropped}
@@ -1,13 +1,18 @@
 from __future__ import annotations
 
-from typing import ClassVar, TypeAlias, Union
+from typing import ClassVar, TypeAlias
 
 from fhir.resources import fhirtypes
 from fhir.resources.condition import Condition as _Condition
 from pydantic.v1 import Field, validator
 
 from .base import FHIRFlatBase
-from .extension_types import presenceAbsenceType, prespecifiedQueryType, timingPhaseType
+from .extension_types import (
+    ExtensionUnion,
+    presenceAbsenceType,
+    prespecifiedQueryType,
+    timingPhaseType,
+)
 from .extensions import presenceAbsence, prespecifiedQuery, timingPhase
 
 JsonString: TypeAlias = str
@@ -17,7 +22,7 @@ JsonString: TypeAlias = str
 
 class Condition(_Condition, FHIRFlatBase):
     extension: list[
-        Union[
+        ExtensionUnion[
             presenceAbsenceType,
             prespecifiedQueryType,
             timingPhaseType,
@@ -34,7 +39,6 @@ class Condition(_Condition, FHIRFlatBase):
         ),
         # if property is element of this resource.
         element_property=True,
-        union_mode="smart",
     )
 
     # attributes to exclude from the flat representation
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import ClassVar, TypeAlias, Union
+from typing import ClassVar, TypeAlias
 
 from fhir.resources import fhirtypes
 from fhir.resources.encounter import Encounter as _Encounter
@@ -14,7 +14,7 @@ from fhir.resources.encounter import (
 from pydantic.v1 import Field, validator
 
 from .base import FHIRFlatBase
-from .extension_types import relativePeriodType, timingPhaseType
+from .extension_types import ExtensionUnion, relativePeriodType, timingPhaseType
 from .extensions import relativePeriod, timingPhase
 
 JsonString: TypeAlias = str
@@ -22,7 +22,7 @@ JsonString: TypeAlias = str
 
 class Encounter(_Encounter, FHIRFlatBase):
     extension: list[
-        Union[relativePeriodType, timingPhaseType, fhirtypes.ExtensionType]
+        ExtensionUnion[relativePeriodType, timingPhaseType, fhirtypes.ExtensionType]
     ] = Field(
         None,
         alias="extension",
@@ -35,8 +35,6 @@ class Encounter(_Encounter, FHIRFlatBase):
         ),
         # if property is element of this resource.
         element_property=True,
-        # this trys to match the type of the object to each of the union types
-        union_mode="smart",
     )
 
     # attributes to exclude from the flat representation
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, ClassVar
 
 from fhir.resources.fhirtypes import AbstractType as _AbstractType
+from pydantic.v1.error_wrappers import ErrorWrapper, ValidationError
 
 if TYPE_CHECKING:
     from pydantic.v1.typing import CallableGenerator  # pragma: no cover
@@ -66,3 +67,82 @@ class prespecifiedQueryType(AbstractType):
 
 class dateTimeExtensionType(AbstractType):
     __resource_type__ = "dateTimeExtension"
+
+
+class ExtensionUnion:
+    """
+    A choice of extension types for the items of an `extension` list, e.g.
+    ``list[ExtensionUnion[timingPhaseType, fhirtypes.ExtensionType]]``.
+
+    Unlike a ``Union``, which is validated by trying each type in turn, extensions
+    are validated once against the type matching their ``url``, or the instance's
+    class. Extensions with any other url are validated against the types without a
+    fixed url (e.g. the generic FHIR ``Extension``). Values that can't be matched up
+    this way, such as JSON strings, are still tried against each type in turn.
+    """
+
+    __types__: ClassVar[tuple[type[_AbstractType], ...]] = ()
+    _lookup: ClassVar[tuple[dict, dict, list] | None] = None
+
+    def __class_getitem__(cls, types):
+        if not isinstance(types, tuple):
+            types = (types,)
+        return type(cls.__name__, (cls,), {"__types__": types, "_lookup": None})
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: dict[str, Any]) -> None:
+        field_schema.update(
+            anyOf=[{"type": t.__resource_type__} for t in cls.__types__]
+        )
+
+    @classmethod
+    def __get_validators__(cls) -> "CallableGenerator":
+        yield cls.validate
+
+    @classmethod
+    def lookup(cls) -> tuple[dict, dict, list]:
+        """
+        The types in the union by url and by model class, and the list of types
+        without a fixed url. Built the first time the union is validated.
+        """
+        if cls._lookup is None:
+            from ..util import get_fhirtype
+
+            by_url, by_class, generic = {}, {}, []
+            for t in cls.__types__:
+                model = get_fhirtype(t.__resource_type__)
+                by_class[model] = t
+                url = model.__fields__["url"]
+                if url.field_info.const:
+                    by_url[url.default] = t
+                else:
+                    generic.append(t)
+            cls._lookup = by_url, by_class, generic
+        return cls._lookup
+
+    @classmethod
+    def validate(cls, v):
+        by_url, by_class, generic = cls.lookup()
+        if isinstance(v, dict):
+            match = by_url.get(v.get("url"))
+            options = [match] if match else generic
+        else:
+            match = by_class.get(type(v))
+            options = [match] if match else []
+
+        if len(options) == 1:
+            return _validate_as(options[0], v)
+
+        errors = []
+        for t in options or cls.__types__:
+            try:
+                return _validate_as(t, v)
+            except (ValueError, TypeError, AssertionError) as e:
+                errors.append(ErrorWrapper(e, loc=t.__resource_type__))
+        raise ValidationError(errors, cls)
+
+
+def _validate_as(t: type[_AbstractType], v):
+    for validator in t.__get_validators__():
+        v = validator(v)
+    return v
@@ -53,6 +53,12 @@ if typing.TYPE_CHECKING:
 
 
 class Validators:
+    """
+    Validates values of the ISARIC extension types, resolving each extension class
+    the first time it is needed. A single instance, `validators`, is shared by the
+    validator functions below so the classes are only looked up once per process.
+    """
+
     def __init__(self):
         self.MODEL_CLASSES = {
             "timingPhase": (None, ".extensions"),
@@ -100,6 +106,10 @@ class Validators:
             self.get_fhir_model_class(model_name)
         )
 
+        if type(v) is model_class:
+            # already validated when it was created
+            return v
+
         if isinstance(v, (str, bytes)):
             try:
                 v = model_class.parse_raw(v)
@@ -198,53 +208,56 @@ class Validators:
         return v
 
 
+validators = Validators()
+
+
 def timingphase_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("timingPhase", v)
+    return validators.fhir_model_validator("timingPhase", v)
 
 
 def relativeday_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("relativeDay", v)
+    return validators.fhir_model_validator("relativeDay", v)
 
 
 def relativestart_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("relativeStart", v)
+    return validators.fhir_model_validator("relativeStart", v)
 
 
 def relativeend_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("relativeEnd", v)
+    return validators.fhir_model_validator("relativeEnd", v)
 
 
 def relativeperiod_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("relativePeriod", v)
+    return validators.fhir_model_validator("relativePeriod", v)
 
 
 def approximatedate_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("approximateDate", v)
+    return validators.fhir_model_validator("approximateDate", v)
 
 
 def duration_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("Duration", v)
+    return validators.fhir_model_validator("Duration", v)
 
 
 def age_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("Age", v)
+    return validators.fhir_model_validator("Age", v)
 
 
 def birthsex_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("birthSex", v)
+    return validators.fhir_model_validator("birthSex", v)
 
 
 def race_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("Race", v)
+    return validators.fhir_model_validator("Race", v)
 
 
 def presenceabsence_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("presenceAbsence", v)
+    return validators.fhir_model_validator("presenceAbsence", v)
 
 
 def prespecifiedquery_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("prespecifiedQuery", v)
+    return validators.fhir_model_validator("prespecifiedQuery", v)
 
 
 def datetimeextension_validator(v: Union[StrBytes, dict, Path, FHIRAbstractModel]):
-    return Validators().fhir_model_validator("dateTimeExtension", v)
+    return validators.fhir_model_validator("dateTimeExtension", v)
@@ -7,7 +7,10 @@ Extensions to the base `FHIR resources`_ package that are ISARIC specific.
 
 from __future__ import annotations
 
-from typing import Any, Union
+import calendar
+import datetime
+import re
+from typing import Any, Callable
 
 from fhir.resources import fhirtypes
 from fhir.resources.datatype import DataType as _DataType
@@ -189,15 +192,15 @@ class relativePeriod(_DataType):
 
     url: str = Field("relativePeriod", const=True, alias="url")
 
-    extension: list[Union[et.relativeStartType, et.relativeEndType]] = Field(
-        None,
-        alias="extension",
-        title="List of `Extension` items (represented as `dict` in JSON)",
-        description="Additional content defined by implementations",
-        # if property is element of this resource.
-        element_property=True,
-        # this trys to match the type of the object to each of the union types
-        union_mode="smart",
+    extension: list[et.ExtensionUnion[et.relativeStartType, et.relativeEndType]] = (
+        Field(
+            None,
+            alias="extension",
+            title="List of `Extension` items (represented as `dict` in JSON)",
+            description="Additional content defined by implementations",
+            # if property is element of this resource.
+            element_property=True,
+        )
     )
 
     @validator("extension")
@@ -546,7 +549,9 @@ class dateTimeExtension(_FHIRPrimitiveExtension):
     resource_type: str = Field(default="dateTimeExtension", const=True)
 
     extension: list[
-        Union[et.approximateDateType, et.relativeDayType, fhirtypes.ExtensionType]
+        et.ExtensionUnion[
+            et.approximateDateType, et.relativeDayType, fhirtypes.ExtensionType
+        ]
     ] = Field(
         None,
         alias="extension",
@@ -554,8 +559,6 @@ class dateTimeExtension(_FHIRPrimitiveExtension):
         description="Additional content defined by implementations",
         # if property is element of this resource.
         element_property=True,
-        # this trys to match the type of the object to each of the union types
-        union_mode="smart",
     )
 
     @validator("extension")
@@ -569,3 +572,45 @@ class dateTimeExtension(_FHIRPrimitiveExtension):
             raise ValueError("approximateDate and relativeDay can only appear once.")
 
         return extensions
+
+
+# --------- value types ------------------------------
+
+_DATE_PARTS = re.compile(r"(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?")
+
+
+def _is_date(value) -> bool | None:
+    """
+    Whether a value is a valid `valueDate`: a date, or a string holding a year,
+    year-month or full date. Other strings starting with four digits (e.g. "2012-9-1")
+    are left to validation to decide.
+    """
+    if isinstance(value, datetime.date):
+        return True
+    if not isinstance(value, str):
+        return None
+    m = _DATE_PARTS.fullmatch(value)
+    if m is None:
+        return None if value[:4].isdecimal() else False
+    year, month, day = (int(part) if part else None for part in m.groups())
+    if month is None:
+        return True
+    if day is None:
+        return month <= 12
+    return (
+        year >= 1
+        and 1 <= month <= 12
+        and 1 <= day <= calendar.monthrange(year, month)[1]
+    )
+
+
+def _is_string(value) -> bool | None:
+    "Whether a value is a valid `valueString`, i.e. a non-empty string."
+    return bool(value) if isinstance(value, str) else None
+
+
+# Checks of which value[x] field a value belongs in, for the extensions that allow
+# more than one value type. Each returns None if only validation can tell.
+value_checks: dict[type[_DataType], dict[str, Callable[[Any], bool | None]]] = {
+    approximateDate: {"valueDate": _is_date, "valueString": _is_string},
+}
@@ -1,20 +1,20 @@
 from __future__ import annotations
 
-from typing import ClassVar, TypeAlias, Union
+from typing import ClassVar, TypeAlias
 
 from fhir.resources import fhirtypes
 from fhir.resources.immunization import Immunization as _Immunization
 from pydantic.v1 import Field, validator
 
 from .base import FHIRFlatBase
-from .extension_types import dateTimeExtensionType, timingPhaseType
+from .extension_types import ExtensionUnion, dateTimeExtensionType, timingPhaseType
 from .extensions import timingPhase
 
 JsonString: TypeAlias = str
 
 
 class Immunization(_Immunization, FHIRFlatBase):
-    extension: list[Union[timingPhaseType, fhirtypes.ExtensionType]] = Field(
+    extension: list[ExtensionUnion[timingPhaseType, fhirtypes.ExtensionType]] = Field(
         None,
         alias="extension",
         title="List of `Extension` items (represented as `dict` in JSON)",
@@ -25,8 +25,6 @@ class Immunization(_Immunization, FHIRFlatBase):
         ),
         # if property is element of this resource.
         element_property=True,
-        # this trys to match the type of the object to each of the union types
-        union_mode="smart",
     )
 
     occurrenceDateTime__ext: dateTimeExtensionType = Field(
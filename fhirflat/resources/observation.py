@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import ClassVar, TypeAlias, Union
+from typing import ClassVar, TypeAlias
 
 from fhir.resources import fhirtypes
 from fhir.resources.observation import Observation as _Observation
@@ -8,7 +8,7 @@ from fhir.resources.observation import ObservationComponent as _ObservationCompo
 from pydantic.v1 import Field, validator
 
 from .base import FHIRFlatBase
-from .extension_types import dateTimeExtensionType, timingPhaseType
+from .extension_types import ExtensionUnion, dateTimeExtensionType, timingPhaseType
 from .extensions import timingPhase
 
 JsonString: TypeAlias = str
@@ -27,7 +27,7 @@ class ObservationComponent(_ObservationComponent):
 
 
 class Observation(_Observation, FHIRFlatBase):
-    extension: list[Union[timingPhaseType, fhirtypes.ExtensionType]] = Field(
+    extension: list[ExtensionUnion[timingPhaseType, fhirtypes.ExtensionType]] = Field(
         None,
         alias="extension",
         title="List of `Extension` items (represented as `dict` in JSON)",
@@ -38,8 +38,6 @@ class Observation(_Observation, FHIRFlatBase):
         ),
         # if property is element of this resource.
         element_property=True,
-        # this trys to match the type of the object to each of the union types
-        union_mode="smart",
     )
 
     effectiveDateTime__ext: dateTimeExtensionType = Field(
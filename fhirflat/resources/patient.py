@@ -1,33 +1,32 @@
 from __future__ import annotations
 
-from typing import ClassVar, TypeAlias, Union
+from typing import ClassVar, TypeAlias
 
 from fhir.resources import fhirtypes
 from fhir.resources.patient import Patient as _Patient
 from pydantic.v1 import Field, validator
 
 from .base import FHIRFlatBase
-from .extension_types import ageType, birthSexType, raceType
+from .extension_types import ExtensionUnion, ageType, birthSexType, raceType
 from .extensions import Age, Race, birthSex
 
 JsonString: TypeAlias = str
 
 
 class Patient(_Patient, FHIRFlatBase):
-    extension: list[Union[ageType, birthSexType, raceType, fhirtypes.ExtensionType]] = (
-        Field(
-            None,
-            alias="extension",
-            title="Additional content defined by implementations",
-            description=(
-                """
+    extension: list[
+        ExtensionUnion[ageType, birthSexType, raceType, fhirtypes.ExtensionType]
+    ] = Field(
+        None,
+        alias="extension",
+        title="Additional content defined by implementations",
+        description=(
+            """
             Contains the G.H 'age' and 'birthSex' extensions,
             and allows extensions from other implementations to be included."""
-            ),
-            # if property is element of this resource.
-            element_property=True,
-            union_mode="smart",
-        )
+        ),
+        # if property is element of this resource.
+        element_property=True,
     )
 
     # attributes to exclude from the flat representation
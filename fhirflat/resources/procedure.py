@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import ClassVar, TypeAlias, Union
+from typing import ClassVar, TypeAlias
 
 from fhir.resources import fhirtypes
 from fhir.resources.procedure import Procedure as _Procedure
@@ -8,6 +8,7 @@ from pydantic.v1 import Field, validator
 
 from .base import FHIRFlatBase
 from .extension_types import (
+    ExtensionUnion,
     dateTimeExtensionType,
     durationType,
     relativePeriodType,
@@ -20,7 +21,7 @@ JsonString: TypeAlias = str
 
 class Procedure(_Procedure, FHIRFlatBase):
     extension: list[
-        Union[
+        ExtensionUnion[
             durationType, timingPhaseType, relativePeriodType, fhirtypes.ExtensionType
         ]
     ] = Field(
@@ -34,7 +35,6 @@ class Procedure(_Procedure, FHIRFlatBase):
         ),
         # if property is element of this resource.
         element_property=True,
-        union_mode="smart",
     )
 
     occurrenceDateTime__ext: dateTimeExtensionType = Field(
@@ -28,11 +28,33 @@ def group_keys(data_keys: list[str] | KeysView) -> dict[str, list[str]]:
 def get_fhirtype(t: str | list[str]):
     """
     Finds the relevant class from fhir.resources for a given string.
+
+    Results are cached, including failed lookups, which raise the same
+    AttributeError each time.
     """
 
     if isinstance(t, list):
         return [get_fhirtype(x) for x in t]
 
+    try:
+        result = _fhirtypes[t]
+    except KeyError:
+        try:
+            result = _find_fhirtype(t)
+        except AttributeError as e:
+            result = e
+        _fhirtypes[t] = result
+
+    if isinstance(result, AttributeError):
+        raise result.with_traceback(None)
+    return result
+
+
+# type name -> class, or the AttributeError raised if it couldn't be found
+_fhirtypes: dict[str, type | AttributeError] = {}
+
+
+def _find_fhirtype(t: str):
     if not (hasattr(extensions, t) or hasattr(extensions, t.capitalize())):
         try:
             return getattr(getattr(fhir.resources, t.lower()), t)
@@ -54,6 +76,40 @@ def get_fhirtype(t: str | list[str]):
         return get_local_extension_type(t)
 
 
+def preload_fhirtypes():
+    """
+    Resolves the types of all the properties of the classes in `fhirflat.resources`,
+    and of the types they contain in turn, so later calls to `get_fhirtype` for them
+    are answered from the cache.
+    """
+
+    pending = [getattr(fhirflat.resources, r) for r in fhirflat.resources.__all__]
+    seen = set(pending)
+    while pending:
+        klass = pending.pop()
+        for name in _property_types(klass.schema()["properties"].values()):
+            try:
+                found = get_fhirtype(name)
+            except AttributeError:
+                continue
+            if isinstance(found, type) and found not in seen:
+                seen.add(found)
+                pending.append(found)
+
+
+def _property_types(schemas) -> set[str]:
+    "The type names used in a list of property schemas, including any nested ones."
+    types = set()
+    for schema in schemas:
+        if schema.get("type", "array") != "array":
+            types.add(schema["type"])
+        nested = schema.get("anyOf", [])
+        if "items" in schema:
+            nested = [*nested, schema["items"]]
+        types.update(_property_types(nested))
+    return types
+
+
 def get_local_extension_type(t: str):
     """
     Finds the relevant class from local extensions for a given string.
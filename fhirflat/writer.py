@@ -0,0 +1,528 @@
+"""
+Writing of FHIRflat parquet files, including incrementally for data that is converted
+in chunks.
+"""
+
+import datetime
+import os
+import re
+import shutil
+import tempfile
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def conform_table(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """
+    Casts a table to the given schema, adding any columns it doesn't have as nulls.
+    """
+    return pa.Table.from_arrays(
+        [
+            (
+                table.column(field.name).cast(field.type)
+                if field.name in table.column_names
+                else pa.nulls(len(table), field.type)
+            )
+            for field in schema
+        ],
+        schema=schema,
+    )
+
+
+class ParquetOptions:
+    """
+    Options for writing FHIRflat parquet files. The defaults are pyarrow's.
+
+    Parameters
+    ----------
+    compression: str
+        Compression codec: "snappy", "gzip", "brotli", "zstd", "lz4" or "none".
+    compression_level: int | None
+        Codec specific compression level, or None for the codec's default. Snappy
+        has no levels.
+    row_group_size: int | None
+        Maximum number of rows in each row group, or None for pyarrow's default.
+    dictionary_columns: bool | list[str]
+        Dictionary encode all columns (True), none (False) or only the listed ones.
+        Suits columns repeating a small set of values, e.g. `code.code` or `subject`.
+    statistics: bool
+        Write the minimum, maximum and null count of each column in each row group,
+        which readers use to skip row groups when filtering.
+    """
+
+    def __init__(
+        self,
+        compression: str = "snappy",
+        compression_level: int | None = None,
+        row_group_size: int | None = None,
+        dictionary_columns: bool | list[str] = True,
+        statistics: bool = True,
+    ):
+        try:
+            available = compression.lower() == "none" or pa.Codec.is_available(
+                compression
+            )
+        except ValueError:
+            available = False
+        if not available:
+            raise ValueError(f"Unknown or unavailable compression codec {compression}")
+        if compression_level is not None and (
+            compression.lower() == "none"
+            or not pa.Codec.supports_compression_level(compression)
+        ):
+            raise ValueError(
+                f"Compression codec {compression} doesn't support a compression level"
+            )
+        if row_group_size is not None and row_group_size < 1:
+            raise ValueError("row_group_size must be at least 1")
+        self.compression = compression
+        self.compression_level = compression_level
+        self.row_group_size = row_group_size
+        self.dictionary_columns = dictionary_columns
+        self.statistics = statistics
+
+    def writer_options(self, schema: pa.Schema) -> dict:
+        "Keyword arguments for `pq.ParquetWriter` to write a table with `schema`."
+        use_dictionary = self.dictionary_columns
+        if not isinstance(use_dictionary, bool):
+            # parquet refers to the leaf columns, e.g. "code.code.list.element"
+            use_dictionary = [
+                path
+                for name in use_dictionary
+                if name in schema.names
+                for path in _leaf_paths(name, schema.field(name).type)
+            ]
+        return {
+            "compression": self.compression,
+            "compression_level": self.compression_level,
+            "use_dictionary": use_dictionary,
+            "write_statistics": self.statistics,
+        }
+
+
+def _leaf_paths(name: str, type_: pa.DataType) -> list[str]:
+    if pa.types.is_list(type_) or pa.types.is_large_list(type_):
+        return _leaf_paths(f"{name}.list.element", type_.value_type)
+    if pa.types.is_struct(type_):
+        return [
+            path
+            for field in type_
+            for path in _leaf_paths(f"{name}.{field.name}", field.type)
+        ]
+    return [name]
+
+
+def _year(values: pd.Series) -> pd.Series:
+    "The year of dates, dateTimes or timestamps, e.g. '2024'."
+    return values.astype("string").str.extract(r"^(\d{4})", expand=False)
+
+
+def _month(values: pd.Series) -> pd.Series:
+    "The year and month of dates, dateTimes or timestamps, e.g. '2024-05'."
+    return values.astype("string").str.extract(r"^(\d{4}-\d{2})", expand=False)
+
+
+def _site(values: pd.Series) -> pd.Series:
+    """
+    The site of subject references, the part of the subject ID before the first
+    "-", e.g. 'ABC' for 'Patient/ABC-0012'. Subject IDs without a "-" have no site.
+    """
+    return values.astype("string").str.extract(r"^(?:Patient/)?([^-/]+)-", expand=False)
+
+
+PARTITION_FUNCTIONS = {"year": _year, "month": _month, "site": _site}
+
+_PARTITION_KEY = re.compile(r"^(?:(\w+)=)?(?:(\w+)\((.+)\)|(.+))$")
+
+# directory name used by hive partitioning for rows without a value for a key
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+class Partitioning:
+    """
+    Hive partitioning of a FHIRflat resource, which is written as a folder of parquet
+    files, e.g. `observation/site=ABC/year=2024/part-0.parquet`, instead of a single
+    file. Readers filtering on a key only read the folders that match.
+
+    Keys are given as "[name=]column" or "[name=]function(column)", where column is
+    a FHIRflat column with a single value per row. A plain column is moved out of the
+    files into the folder names. Functions derive the key from the column instead:
+
+    - `year(column)`: the year of a date column, e.g. `year(effectiveDateTime)`
+    - `month(column)`: the year and month, e.g. `month(actualPeriod.start)`
+    - `site(subject)`: the site, taken from the subject ID before the first "-"
+
+    The name defaults to the function or column name, e.g. `site(subject)` writes
+    `site=ABC` folders.
+
+    Parameters
+    ----------
+    keys: list[str]
+        The keys to partition on, outermost first.
+    """
+
+    def __init__(self, keys: list[str]):
+        if not keys:
+            raise ValueError("Partitioning needs at least one key")
+        self.keys: list[tuple[str, str, str | None]] = []
+        for key in keys:
+            match = _PARTITION_KEY.match(key.strip())
+            if match is None:
+                raise ValueError(f"Invalid partition key {key}")
+            name, function, argument, column = match.groups()
+            if function is not None and function not in PARTITION_FUNCTIONS:
+                raise ValueError(
+                    f"Unknown partition function {function}, expected one of "
+                    f"{', '.join(PARTITION_FUNCTIONS)}"
+                )
+            column = column or argument
+            self.keys.append((name or function or column, column, function))
+        names = self.names
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate partition key names in {keys}")
+
+    @property
+    def names(self) -> list[str]:
+        return [name for name, _, _ in self.keys]
+
+    def add_keys(self, table: pa.Table, df: pd.DataFrame) -> pa.Table:
+        """
+        Adds the partition keys of FHIRflat rows to their table as string columns,
+        removing the columns that are partitioned on as they are.
+        """
+        moved = [c for _, c, f in self.keys if f is None and c in table.column_names]
+        table = table.drop_columns(moved)
+        for name in self.names:
+            if name in table.column_names:
+                raise ValueError(f"Partition key {name} is also a FHIRflat column")
+        for name, column, function in self.keys:
+            if column in df.columns:
+                values = df[column].reset_index(drop=True)
+                if function is None:
+                    values = values.astype("string")
+                else:
+                    values = PARTITION_FUNCTIONS[function](values)
+                array = pa.array(values, type=pa.string(), from_pandas=True)
+            else:
+                array = pa.nulls(len(table), pa.string())
+            table = table.append_column(name, array)
+        return table
+
+    def split(self, table: pa.Table):
+        """
+        Yields the folder of each partition of a table with keys added by `add_keys`,
+        relative to the resource folder, and its rows without the key columns.
+        """
+        names = self.names
+        keys = table.select(names).to_pandas()
+        groups = keys.groupby(names, dropna=False, sort=True).indices
+        data = table.drop_columns(names)
+        for values, rows in groups.items():
+            if len(names) == 1:
+                values = (values,)
+            folder = os.path.join(
+                *(
+                    f"{name}={NULL_PARTITION if pd.isna(v) else quote(v, safe='')}"
+                    for name, v in zip(names, values, strict=True)
+                )
+            )
+            yield folder, data.take(rows)
+
+
+def write_partitions(
+    table: pa.Table,
+    path: str,
+    partitioning: Partitioning,
+    options: ParquetOptions,
+    part: int = 0,
+):
+    """
+    Writes a table with partition keys added by `Partitioning.add_keys` to the
+    `part-{part}.parquet` file of each of its partitions in the folder `path`.
+    """
+    for folder, rows in partitioning.split(table):
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+        with pq.ParquetWriter(
+            os.path.join(path, folder, f"part-{part}.parquet"),
+            rows.schema,
+            **options.writer_options(rows.schema),
+        ) as writer:
+            writer.write_table(rows, row_group_size=options.row_group_size)
+
+
+def _iso_date(value):
+    "Dates, dateTimes and times as ISO strings, e.g. '2020-05-01'."
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def flat_table(
+    df: pd.DataFrame, schema: pa.Schema | None = None, preserve_index=None
+) -> pa.Table:
+    """
+    Converts FHIRflat rows to an Arrow table. Columns in `schema` are stored with the
+    type given there, and the rest with the type pyarrow infers from the data.
+    Dates and dateTimes in string columns are written as ISO strings, alongside
+    partial dates, which are already strings.
+
+    Raises a ValueError if a column can't be cast to the type given in `schema`.
+    """
+    schema = schema or pa.schema([])
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # complete dates mixed with partial ones in the same column
+        strings = [
+            f.name
+            for f in schema
+            if f.type == pa.string()
+            and f.name in df.columns
+            and df[f.name].dtype == object
+        ]
+        df = df.assign(**{name: df[name].map(_iso_date) for name in strings})
+        table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+    for field in schema:
+        i = table.schema.get_field_index(field.name)
+        if i == -1 or table.schema.field(i).type == field.type:
+            continue
+        column = table.column(i)
+        if field.type == pa.string() and pa.types.is_temporal(column.type):
+            column = pa.array(
+                [_iso_date(v) for v in column.to_pylist()], type=pa.string()
+            )
+        else:
+            try:
+                column = column.cast(field.type)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise ValueError(
+                    f"Column {field.name} of type {column.type} can't be stored as "
+                    f"{field.type}: {e}"
+                ) from e
+        table = table.set_column(i, field, column)
+    return table
+
+
+def write_flat(
+    df: pd.DataFrame,
+    path: str,
+    schema: pa.Schema | None = None,
+    options: ParquetOptions | None = None,
+    partitioning: Partitioning | None = None,
+):
+    """
+    Writes FHIRflat rows to a parquet file, with column types from `schema`. With a
+    partitioning, `path` is the folder the partitions are written to instead.
+    """
+    options = options or ParquetOptions()
+    if partitioning is not None:
+        table = flat_table(df, schema, preserve_index=False)
+        table = partitioning.add_keys(table.replace_schema_metadata(None), df)
+        _remove_folder(path)
+        write_partitions(table, path, partitioning, options)
+        return
+    table = flat_table(df, schema)
+    with pq.ParquetWriter(
+        path, table.schema, **options.writer_options(table.schema)
+    ) as writer:
+        writer.write_table(table, row_group_size=options.row_group_size)
+
+
+def _remove_folder(path: str):
+    "Removes the partitions of a previous run, so they aren't mixed with new ones."
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+def unify_schemas(schemas: list[pa.Schema]) -> pa.Schema:
+    """
+    Combines the schemas of several chunks into one that all of them can be cast to.
+    Timestamp columns with different time zones in different chunks are stored in
+    UTC, as pyarrow does for a single chunk containing several time zones.
+    """
+    timezones: dict[str, set] = {}
+    for schema in schemas:
+        for field in schema:
+            if pa.types.is_timestamp(field.type):
+                timezones.setdefault(field.name, set()).add(field.type.tz)
+    mixed = {name for name, tz in timezones.items() if len(tz) > 1}
+    if mixed:
+        schemas = [
+            pa.schema(
+                [
+                    (
+                        field.with_type(pa.timestamp(field.type.unit, "UTC"))
+                        if field.name in mixed and pa.types.is_timestamp(field.type)
+                        else field
+                    )
+                    for field in schema
+                ]
+            )
+            for schema in schemas
+        ]
+    return pa.unify_schemas(schemas, promote_options="permissive")
+
+
+def _fits(schema: pa.Schema, target: pa.Schema) -> bool:
+    "If a table with `schema` can be conformed to `target` without changing types."
+    return all(
+        field.name in target.names
+        and (
+            pa.types.is_null(field.type) or field.type == target.field(field.name).type
+        )
+        for field in schema
+    )
+
+
+class FlatWriter:
+    """
+    Writes a FHIRflat parquet file one chunk of rows at a time, with each chunk
+    stored as a separate row group.
+
+    Chunks are written straight to the file as long as they fit the schema of the
+    first chunk, i.e. have no new columns and store each column with the same type.
+    Chunks can however contain different columns (e.g. a column which is empty in one
+    chunk), so from the first chunk that doesn't fit, the chunks are spilled to disk
+    instead. When the writer is closed their schemas are unified and the chunks are
+    appended to the final file one by one, so at most one chunk is held in memory at
+    any time, at the cost of writing the spilled chunks twice.
+
+    If a resource class is given, the columns are stored with the types given by its
+    `arrow_schema`, so chunks store each column with the same type. Chunks larger
+    than the row group size in `options` are split into several row groups.
+
+    With a partitioning, `path` is a folder and each chunk is written to a
+    `part-N.parquet` file in the folder of each partition it has rows for. These
+    chunks are always spilled, so that every part has the same schema.
+
+    Can be used as a context manager, which closes the writer on exit, or discards
+    the chunks written so far if an exception was raised.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        resource=None,
+        options: ParquetOptions | None = None,
+        partitioning: Partitioning | None = None,
+    ):
+        self.path = path
+        self.resource = resource
+        self.options = options or ParquetOptions()
+        self.partitioning = partitioning
+        self.num_rows = 0
+        self._writer: pq.ParquetWriter | None = None
+        self._writer_path: str | None = None
+        self._parts: list[str] = []
+        self._schemas: list[pa.Schema] = []
+        self._spill_dir: str | None = None
+
+    def write(self, df: pd.DataFrame):
+        "Adds a chunk of FHIRflat rows to the file."
+        if df.empty:
+            return
+        schema = self.resource.arrow_schema(df.columns) if self.resource else None
+        table = flat_table(df, schema, preserve_index=False)
+        table = table.replace_schema_metadata(None)
+        self.num_rows += len(table)
+        if self.partitioning is None and self._spill_dir is None:
+            if self._writer is None:
+                self._open(table.schema)
+            if _fits(table.schema, self._writer.schema):
+                self._writer.write_table(
+                    conform_table(table, self._writer.schema),
+                    row_group_size=self.options.row_group_size,
+                )
+                return
+            # the rows written so far become the first spilled chunk
+            self._writer.close()
+            self._spill(self._writer_path, self._writer.schema)
+            self._writer = None
+        if self.partitioning is not None:
+            table = self.partitioning.add_keys(table, df)
+        self._spill(None, table.schema, table)
+
+    def _open(self, schema: pa.Schema):
+        "Starts writing to a file next to `path`, which is renamed when closed."
+        fd, self._writer_path = tempfile.mkstemp(
+            prefix=".fhirflat-",
+            suffix=".parquet",
+            dir=os.path.dirname(self.path) or None,
+        )
+        os.close(fd)
+        self._writer = pq.ParquetWriter(
+            self._writer_path, schema, **self.options.writer_options(schema)
+        )
+
+    def _spill(
+        self, path: str | None, schema: pa.Schema, table: pa.Table | None = None
+    ):
+        "Adds a chunk to the spilled chunks, moving the file `path` or writing `table`."
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(
+                prefix=".fhirflat-", dir=os.path.dirname(self.path) or None
+            )
+        part = os.path.join(self._spill_dir, f"part-{len(self._parts)}.parquet")
+        if path is None:
+            pq.write_table(table, part)
+        else:
+            os.replace(path, part)
+        self._parts.append(part)
+        self._schemas.append(schema)
+
+    def close(self):
+        "Writes the final file. Nothing is written if no rows were added."
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(self._writer_path, self.path)
+            self._writer = None
+            return
+        if self._spill_dir is None:
+            return
+        try:
+            schema = unify_schemas(self._schemas)
+            if self.partitioning is not None:
+                _remove_folder(self.path)
+                for i, part in enumerate(self._parts):
+                    write_partitions(
+                        conform_table(pq.read_table(part), schema),
+                        self.path,
+                        self.partitioning,
+                        self.options,
+                        i,
+                    )
+                return
+            with pq.ParquetWriter(
+                self.path, schema, **self.options.writer_options(schema)
+            ) as writer:
+                for part in self._parts:
+                    writer.write_table(
+                        conform_table(pq.read_table(part), schema),
+                        row_group_size=self.options.row_group_size,
+                    )
+        finally:
+            self.discard()
+
+    def discard(self):
+        "Removes the chunks written so far without writing the file."
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(self._writer_path)
+            self._writer = None
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir)
+        self._spill_dir = None
+        self._parts = []
+        self._schemas = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, _exc, _tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
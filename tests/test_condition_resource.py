@@ -1,7 +1,6 @@
 import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
-import datetime
 from fhirflat.resources.condition import Condition
 import pytest
 from pydantic.v1 import ValidationError
@@ -119,9 +118,9 @@ CONDITION_FLAT = {
     "category.text": [["Problem", None]],
     "bodySite.code": ["http://snomed.info/sct|38266002"],
     "bodySite.text": ["whole body"],
-    "onsetDateTime": [datetime.date(2013, 4, 2)],
+    "onsetDateTime": ["2013-04-02"],
     "abatementString": ["around April 9, 2013"],
-    "recordedDate": [datetime.date(2013, 4, 4)],
+    "recordedDate": ["2013-04-04"],
     "severity.code": ["http://snomed.info/sct|255604002"],
     "severity.text": ["Mild"],
     "code.code": ["http://snomed.info/sct|386661006"],
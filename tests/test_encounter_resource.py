@@ -1,9 +1,10 @@
 import pandas as pd
+import pyarrow as pa
 from pandas.testing import assert_frame_equal
 import os
 from fhirflat.resources.encounter import Encounter
-import datetime
 import pytest
+from pydantic.v1 import ValidationError
 
 ENCOUNTER_DICT_INPUT = {
     "resourceType": "Encounter",
@@ -194,8 +195,8 @@ ENCOUNTER_FLAT = {
     "subject": "Patient/f201",
     "partOf": "Encounter/f203",
     "serviceProvider": "Organization/2",
-    "actualPeriod.start": datetime.date(2013, 3, 11),
-    "actualPeriod.end": datetime.date(2013, 3, 20),
+    "actualPeriod.start": "2013-03-11",
+    "actualPeriod.end": "2013-03-20",
     "diagnosis_dense": [
         [
             {
@@ -371,6 +372,15 @@ def test_encounter_to_flat():
     os.remove("test_encounter.parquet")
 
 
+def test_encounter_to_flat_dict():
+    flat = Encounter(**ENCOUNTER_DICT_INPUT).to_flat_dict()
+
+    assert_frame_equal(
+        pd.DataFrame([flat]),
+        pd.DataFrame([Encounter(**ENCOUNTER_DICT_INPUT).to_flat()]),
+    )
+
+
 def test_encounter_from_flat():
     visit = Encounter(**ENCOUNTER_DICT_OUT)
 
@@ -425,3 +435,67 @@ def test_from_flat_validation_error_multi_resources():
     assert len(errors) == 1
     assert "invalid datetime format" in errors.iloc[0]["validation_error"]
     os.remove("encounter_errors.csv")
+
+
+def test_iter_from_flat():
+    errors = []
+    resources = Encounter.iter_from_flat(
+        "tests/data/multi_row_encounter_flat_errors.parquet",
+        batch_size=2,
+        on_error=lambda row, error: errors.append((row, error)),
+    )
+
+    with pytest.warns(UserWarning, match="Validation errors found in the data."):
+        expected = Encounter.from_flat(
+            "tests/data/multi_row_encounter_flat_errors.parquet"
+        )
+    os.remove("encounter_errors.csv")
+
+    assert list(resources) == expected
+    assert len(errors) == 1
+    assert "invalid datetime format" in str(errors[0][1])
+
+
+def test_iter_from_flat_raises():
+    resources = Encounter.iter_from_flat(
+        "tests/data/multi_row_encounter_flat_errors.parquet"
+    )
+    with pytest.raises(ValidationError, match="invalid datetime format"):
+        list(resources)
+
+
+def test_flat_schema_cached():
+    schema = Encounter.flat_schema()
+    assert Encounter.flat_schema() is schema
+    assert "diagnosis" in schema.flat_lists
+    assert "meta" not in schema.flat_fields
+
+    # the lists returned to callers are copies of the cached ones
+    Encounter.attr_lists().remove("diagnosis")
+    assert "diagnosis" in Encounter.attr_lists()
+
+
+def test_encounter_arrow_schema():
+    columns = [
+        "id",
+        "class.code",
+        "class.text",
+        "actualPeriod.start",
+        "subject",
+        "extension.timingPhase.code",
+        "extension.relativePeriod.relativeStart",
+        "diagnosis_dense",
+        "length.value",
+    ]
+
+    assert Encounter.arrow_schema(columns) == pa.schema(
+        [
+            ("id", pa.string()),
+            ("class.code", pa.list_(pa.string())),
+            ("actualPeriod.start", pa.string()),
+            ("subject", pa.string()),
+            ("extension.timingPhase.code", pa.list_(pa.string())),
+            ("extension.relativePeriod.relativeStart", pa.int64()),
+            ("length.value", pa.float64()),
+        ]
+    )
@@ -15,6 +15,7 @@ from fhirflat.resources.extensions import (
     Duration,
     dateTimeExtension,
 )
+from fhirflat.resources import extension_validators
 from pydantic.v1.error_wrappers import ValidationError
 
 timing_phase_data = {
@@ -132,6 +133,21 @@ def test_dateTimeExtension():
     )
 
 
+def test_dateTimeExtension_matches_url():
+    other = {"url": "http://example.org/other", "valueString": "month 3"}
+    date_time_extension = dateTimeExtension(extension=[other, *dte["extension"]])
+    assert [type(ext) for ext in date_time_extension.extension] == [
+        Extension,
+        approximateDate,
+        relativeDay,
+    ]
+
+    # only validated against the class for its url
+    with pytest.raises(ValidationError) as e:
+        dateTimeExtension(extension=[{"url": "relativeDay", "valueString": "3"}])
+    assert [err["loc"] for err in e.value.errors()] == [("extension", 0, "valueString")]
+
+
 @pytest.mark.parametrize(
     "ext_class, data",
     [
@@ -168,3 +184,18 @@ def test_extension_name_error(ext_class, data):
 def test_extension_validation_error(ext_class, data):
     with pytest.raises(ValidationError):
         ext_class(**data)(**data)
+
+
+def test_extension_validators_shared():
+    approx_date = approximateDate(valueDate="2021-09")
+    registry = extension_validators.validators
+
+    assert extension_validators.approximatedate_validator(approx_date) is approx_date
+    assert registry.MODEL_CLASSES["approximateDate"] == (
+        approximateDate,
+        ".extensions",
+    )
+
+    result = extension_validators.relativeday_validator({"valueInteger": 2})
+    assert isinstance(result, relativeDay)
+    assert registry.MODEL_CLASSES["relativeDay"][0] is relativeDay
@@ -1,5 +1,6 @@
 import pandas as pd
 import fhirflat.fhir2flat as f2f
+from fhirflat.resources.patient import Patient
 import pytest
 
 
@@ -153,3 +154,44 @@ def test_condenseReference(data, expected):
     # Check the result
     expected = pd.DataFrame(expected)
     pd.testing.assert_frame_equal(result, expected)
+
+
+def test_flatten_resource():
+    data = {
+        "id": "example",
+        "code": {
+            "coding": [
+                {"system": "http://snomed.info/sct", "code": "1", "display": "One"}
+            ]
+        },
+        "subject": {"reference": "Patient/example", "display": "Donald Duck"},
+        "identifier": [{"value": "A"}],
+        "note": [{"text": "first"}, {"text": "second"}],
+    }
+
+    result = f2f.flatten_resource(data, lists=["identifier", "note"])
+
+    assert result == {
+        "id": "example",
+        "identifier.value": "A",
+        "note_dense": [{"text": "first"}, {"text": "second"}],
+        "code.code": ["http://snomed.info/sct|1"],
+        "code.text": ["One"],
+        "subject": "Patient/example",
+    }
+
+
+def test_flatten_resource_empty_list():
+    with pytest.raises(f2f._UnsupportedStructure):
+        f2f.flatten_resource({"id": "example", "identifier": []}, lists=["identifier"])
+
+
+def test_fhir2flat_many():
+    patients = Patient.fhir_bulk_import("tests/data/patient.ndjson")
+    lists = [x for x in Patient.attr_lists() if x not in Patient.flat_exclusions]
+
+    expected = pd.concat(
+        [f2f.fhir2flat(p, lists=lists) for p in patients], ignore_index=True
+    )
+
+    pd.testing.assert_frame_equal(f2f.fhir2flat_many(patients, lists=lists), expected)
@@ -1,7 +1,13 @@
+import datetime
+
 import fhirflat.flat2fhir as f2f
+import pandas as pd
+import pyarrow as pa
 import pytest
 from fhir.resources.encounter import Encounter
 
+from fhirflat.resources import base
+
 
 @pytest.mark.parametrize(
     "data_groups, expected",
@@ -169,3 +175,129 @@ def test_expand_concepts(data_class, expected):
     result = f2f.expand_concepts(data, data_class)
 
     assert result == expected
+
+
+def test_compile_concepts_cached():
+    plan = f2f.compile_concepts(Encounter, ["class.code", "class.text", "id"])
+
+    assert f2f.compile_concepts(Encounter, ["id", "class.text", "class.code"]) is plan
+    assert [g.name for g in plan.groups] == ["class"]
+    assert plan.groups[0].array
+
+    for code in ["1234", "5678"]:
+        data = {
+            "id": "1",
+            "class.code": [f"http://loinc.org|{code}"],
+            "class.text": ["Test"],
+        }
+        assert f2f.expand_concepts(data, Encounter) == {
+            "id": "1",
+            "class": [
+                {
+                    "coding": [
+                        {"system": "http://loinc.org", "code": code, "display": "Test"}
+                    ]
+                }
+            ],
+        }
+
+
+@pytest.mark.parametrize(
+    "value, field",
+    [
+        ("2012", "valueDate"),
+        ("2012-09", "valueDate"),
+        ("2012-02-29", "valueDate"),
+        ("2013-02-29", "valueString"),
+        ("2012-13", "valueString"),
+        ("3 months", "valueString"),
+        ("2012-9-1", "valueDate"),
+        (5, "valueDate"),
+    ],
+)
+def test_create_extension_value_type(value, field):
+    result = f2f.createExtension({"approximateDate": value, "relativeDay": 3})
+
+    assert result == [
+        {"url": "approximateDate", field: value},
+        {"url": "relativeDay", "valueInteger": 3},
+    ]
+
+
+def test_create_extension_invalid_value():
+    assert f2f.createExtension({"approximateDate": ""}) == []
+
+
+PLUS_ONE = datetime.timezone(datetime.timedelta(hours=1))
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (datetime.datetime(2020, 1, 1, 0, 30, tzinfo=PLUS_ONE), "2019-12-31T23:30:00Z"),
+        (datetime.datetime(2020, 1, 1, 12, 30, 15), "2020-01-01T12:30:15"),
+        (datetime.date(2020, 1, 1), "2020-01-01T00:00:00"),
+        (datetime.time(7, 5), "07:05:00"),
+        ("2020-01", "2020-01"),
+        (
+            {"start": datetime.date(2020, 1, 1), "end": None},
+            {"start": "2020-01-01T00:00:00", "end": None},
+        ),
+        ([[datetime.date(2020, 1, 2)], None], [["2020-01-02T00:00:00"], None]),
+    ],
+)
+def test_iso_value(value, expected):
+    assert base._iso_value(value) == expected
+
+
+@pytest.mark.parametrize(
+    "column, expected",
+    [
+        (
+            pa.array(
+                [datetime.datetime(2020, 1, 1, 0, 30), None],
+                pa.timestamp("us", tz="+01:00"),
+            ),
+            # values are stored in UTC
+            ["2020-01-01T00:30:00Z", None],
+        ),
+        (
+            pa.array(
+                [datetime.datetime(2020, 1, 1, 12, 30, 15, 500)], pa.timestamp("us")
+            ),
+            ["2020-01-01T12:30:15"],
+        ),
+        (
+            pa.chunked_array([[datetime.date(2020, 1, 1)], [None]], pa.date32()),
+            ["2020-01-01T00:00:00", None],
+        ),
+        (
+            pa.array(
+                [{"start": datetime.date(2020, 1, 1), "text": "a"}],
+                pa.struct([("start", pa.date32()), ("text", pa.string())]),
+            ),
+            [{"start": "2020-01-01T00:00:00", "text": "a"}],
+        ),
+        (
+            pa.array([[datetime.date(2020, 1, 2)], []], pa.list_(pa.date32())),
+            [["2020-01-02T00:00:00"], []],
+        ),
+        (pa.array(["2020-01", None]), ["2020-01", None]),
+    ],
+)
+def test_column_values(column, expected):
+    assert base._column_values(column) == expected
+
+
+def test_flat_rows_drops_index():
+    df = pd.DataFrame(
+        {"id": ["1", "2"], "birthDate": [datetime.date(2020, 1, 1), None]},
+        index=[3, 5],
+    )
+    table = pa.Table.from_pandas(df)
+    assert "__index_level_0__" in table.column_names
+
+    assert base._flat_rows(table) == [
+        {"id": "1", "birthDate": "2020-01-01T00:00:00"},
+        {"id": "2", "birthDate": None},
+    ]
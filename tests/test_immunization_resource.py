@@ -2,7 +2,6 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
 from fhirflat.resources.immunization import Immunization
-import datetime
 import pytest
 
 IMMUNIZATION_DICT_INPUT = {
@@ -106,12 +105,12 @@ IMMUNIZATION_FLAT = {
     "resourceType": "Immunization",
     "extension.timingPhase.code": "http://snomed.info/sct|278307001",
     "extension.timingPhase.text": "on admission",
-    "occurrenceDateTime": datetime.date(2021, 9, 12),
+    "occurrenceDateTime": "2021-09-12",
     "_occurrenceDateTime.relativeDay": 3.0,
     "_occurrenceDateTime.approximateDate": "month 3",
     "reason.reference": "Observation/example",
     "isSubpotent": False,
-    "reaction.date": datetime.date(2021, 9, 12),
+    "reaction.date": "2021-09-12",
     "reaction.reported": False,
     "reaction.manifestation.reference": "Observation/example2",
     "vaccineCode.code": "http://hl7.org/fhir/sid/cvx|175",
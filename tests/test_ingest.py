@@ -1,24 +1,38 @@
 from fhirflat.ingest import (
+    compile_field,
+    compile_mapping,
+    ColumnNode,
+    ConcatNode,
+    DateNode,
+    IfNotNode,
+    LiteralNode,
+    ResponseNode,
     create_dictionary,
     convert_data_to_flat,
     find_field_value,
     format_dates,
+    format_date_series,
     create_dict_wide,
+    create_dicts_wide,
     create_dict_long,
+    create_dicts_long,
+    load_data,
+    iter_subject_chunks,
     generate_metadata,
     write_metadata,
     checksum,
     main,
 )
 from fhirflat.resources.encounter import Encounter
+from fhirflat.writer import ParquetOptions, Partitioning, write_flat
 from fhirflat.resources.observation import Observation
 import pandas as pd
+import pyarrow.parquet as pq
 from pandas.testing import assert_frame_equal
 import os
 import sys
 import shutil
 from pathlib import Path
-from decimal import Decimal
 import numpy as np
 import pytest
 
@@ -161,6 +175,79 @@ def test_format_dates_warning():
         format_dates("2021-04-01", "%m/%d/%Y", "Brazil/East")
 
 
+@pytest.mark.parametrize(
+    "mapp, fhir_attr, node_type, columns",
+    [
+        ("<FIELD>", "id", ResponseNode, set()),
+        ("vital-signs", "category.code", LiteralNode, set()),
+        ("<daily_date>", "valueInteger", ColumnNode, {"daily_date"}),
+        ("Patient/+<subjid>", "subject", ConcatNode, {"subjid"}),
+        ("<FIELD> if not <dates_admdate>", "status", IfNotNode, {"dates_admdate"}),
+        ("<FIELD>+<dates_admtime>", "actualPeriod.start", DateNode, {"dates_admtime"}),
+    ],
+)
+def test_compile_field(mapp, fhir_attr, node_type, columns):
+    node = compile_field(mapp, fhir_attr, "%Y-%m-%d", "Brazil/East")
+    assert isinstance(node, node_type)
+    assert node.columns == columns
+
+
+def test_compile_mapping():
+    plan = compile_mapping(
+        pd.read_csv("tests/dummy_data/encounter_dummy_mapping.csv"),
+        "%Y-%m-%d",
+        "Brazil/East",
+    )
+
+    assert plan.raw_variables[:3] == ["subjid", "visitid", "dates_enrolment"]
+    assert plan.referenced_columns == {"dates_admdate", "dates_admtime"}
+
+    # coded responses are looked up by code, free text uses a single mapping
+    assert set(plan["outco_outcome"].responses) == {"1", "2", "3", "4", "5", "6", "7"}
+    assert plan["outco_outcome"].lookup(4.0).template == {
+        "admission.dischargeDisposition.system": "https://snomed.info/sct",
+        "admission.dischargeDisposition.code": 419099009,
+        "admission.dischargeDisposition.text": "Dead (finding)",
+    }
+    assert plan["outco_secondiag_oth"].lookup("Malaria").evaluate(None, "Malaria") == {
+        "diagnosis.condition.concept.text": "Malaria",
+        "diagnosis.use.system": "https://snomed.info/sct",
+        "diagnosis.use.code": 85097005,
+        "diagnosis.use.text": (
+            "Secondary diagnosis (contextual qualifier) (qualifier value)"
+        ),
+    }
+    with pytest.raises(KeyError):
+        plan["outco_outcome"].lookup(8)
+
+
+def test_format_date_series():
+    dates = pd.Series(
+        ["2021-04-01", None, "2021-04-01 18:00", "2021-04-01"], index=[3, 4, 5, 6]
+    )
+    result = format_date_series(dates, "%Y-%m-%d", "Brazil/East")
+
+    pd.testing.assert_series_equal(
+        result,
+        pd.Series(
+            ["2021-04-01", None, "2021-04-01T18:00:00-03:00", "2021-04-01"],
+            index=[3, 4, 5, 6],
+            dtype=object,
+        ),
+    )
+    assert format_date_series(["2021-04-01"], "%Y-%m-%d", "UTC") == ["2021-04-01"]
+
+
+def test_format_date_series_warning():
+    with pytest.warns(UserWarning, match="2 dates could not be converted") as record:
+        result = format_date_series(
+            ["2021-04-01", "01/04/2021", "fish", "fish"], "%Y-%m-%d", "UTC"
+        )
+    assert len(record) == 1
+    assert "01/04/2021, fish" in str(record[0].message)
+    assert result == ["2021-04-01", "01/04/2021", "fish", "fish"]
+
+
 MAP_DF_MISSING_COLUMNS = pd.DataFrame(
     {
         "raw_variable": ["dates_enrolment", "outco_outcome"],
@@ -227,6 +314,47 @@ def test_create_dict_long_errors():
         )
 
 
+@pytest.mark.parametrize(
+    "file",
+    [
+        "tests/dummy_data/encounter_dummy_data_multi_patient.csv",
+        "tests/dummy_data/data_multirow_encounter_freetext.csv",
+    ],
+)
+def test_create_dicts_wide_matches_row_wise(file):
+    plan = compile_mapping(
+        pd.read_csv("tests/dummy_data/encounter_dummy_mapping.csv"),
+        "%Y-%m-%d",
+        "Brazil/East",
+    )
+    data = pd.read_csv(file)
+    data = data.loc[:, data.columns.isin(plan.raw_variables)]
+    data = data.groupby("subjid", as_index=False).first()
+
+    row_wise = data.apply(
+        create_dict_wide, args=[plan, "%Y-%m-%d", "Brazil/East"], axis=1
+    )
+    assert create_dicts_wide(data, plan).tolist() == row_wise.tolist()
+
+
+def test_create_dicts_wide_errors():
+    map_df = MAP_DF_MISSING_COLUMNS.copy()
+    plan = compile_mapping(map_df, "%Y-%m-%d", "Brazil/East")
+    with pytest.raises(ValueError, match="not found in mapping file"):
+        create_dicts_wide(FIELD_VAL_ROW_WIDE.to_frame().T, plan)
+
+    map_df = pd.DataFrame(
+        {
+            "raw_variable": FIELD_VAL_ROW_WIDE.index,
+            "raw_response": [np.nan, np.nan, np.nan, np.nan, "2, Still hospitalised"],
+            "actualPeriod.start": ["<FIELD>", np.nan, np.nan, np.nan, np.nan],
+        }
+    )
+    plan = compile_mapping(map_df, "%Y-%m-%d", "UTC")
+    with pytest.warns(UserWarning, match="No mapping for column outco_outcome"):
+        create_dicts_wide(FIELD_VAL_ROW_WIDE.to_frame().T, plan)
+
+
 ENCOUNTER_DICT_OUT = {
     "id": 11,
     "subject": "Patient/2",
@@ -859,7 +987,7 @@ OBS_FLAT = {
         "Encounter/10",
         "Encounter/11",
     ],
-    "valueQuantity.value": [Decimal("36.2"), 37.0, 35.5, 120.0, 100.0],
+    "valueQuantity.value": [36.2, 37.0, 35.5, 120.0, 100.0],
     "valueQuantity.unit": [
         "DegreesCelsius",
         "DegreesCelsius",
@@ -909,6 +1037,64 @@ def test_load_data_one_to_many_multi_row():
     os.remove("observation_ingestion.parquet")
 
 
+def test_create_dicts_long_matches_melted():
+    plan = compile_mapping(
+        pd.read_csv("tests/dummy_data/observation_dummy_mapping.csv"),
+        "%Y-%m-%d",
+        "Brazil/East",
+    )
+    data = pd.read_csv("tests/dummy_data/combined_dummy_data.csv")
+    filtered = data.loc[:, data.columns.isin(plan.raw_variables)]
+
+    melted = filtered.reset_index().melt(id_vars="index", var_name="column")
+    row_wise = melted.apply(
+        create_dict_long, args=[data, plan, "%Y-%m-%d", "Brazil/East"], axis=1
+    )
+
+    result = create_dicts_long(filtered, data, plan)
+    assert len(result) == 33
+    assert result.tolist() == row_wise.dropna().tolist()
+
+
+def test_load_data_shared_between_resources():
+    plans = {
+        name: compile_mapping(
+            pd.read_csv(f"tests/dummy_data/{name}_dummy_mapping.csv"),
+            "%Y-%m-%d",
+            "Brazil/East",
+        )
+        for name in ["encounter", "observation"]
+    }
+    assert plans["observation"].date_columns == {"daily_date"}
+
+    data = load_data("tests/dummy_data/combined_dummy_data.csv", plans.values())
+
+    # unmapped columns are never parsed
+    assert "non_encounter_field" not in data.columns
+    assert "outco_not_dengue" not in data.columns
+    assert {"subjid", "dates_admdate", "daily_date", "vital_hr"} <= set(data.columns)
+    assert data["dates_admdate"].dtype == object
+
+    for name, one_to_one in [("encounter", True), ("observation", False)]:
+        shared = create_dictionary(
+            data,
+            plans[name],
+            name.capitalize(),
+            one_to_one=one_to_one,
+            date_format="%Y-%m-%d",
+            timezone="Brazil/East",
+        )
+        separate = create_dictionary(
+            "tests/dummy_data/combined_dummy_data.csv",
+            f"tests/dummy_data/{name}_dummy_mapping.csv",
+            name.capitalize(),
+            one_to_one=one_to_one,
+            date_format="%Y-%m-%d",
+            timezone="Brazil/East",
+        )
+        assert shared["flat_dict"].tolist() == separate["flat_dict"].tolist()
+
+
 def test_convert_data_to_flat_missing_mapping_error():
     with pytest.raises(
         TypeError, match="Either mapping_files_types or sheet_id must be provided"
@@ -1092,6 +1278,58 @@ def test_ingest_to_flat_validation_errors():
     )
 
 
+def test_ingest_to_flat_df_workers():
+    def mapped():
+        # creating the resources modifies the flat_dicts, so each run needs its own
+        return create_dictionary(
+            "tests/dummy_data/combined_dummy_data_error.csv",
+            "tests/dummy_data/encounter_dummy_mapping.csv",
+            "Encounter",
+            one_to_one=True,
+            date_format="%Y-%m-%d",
+            timezone="Brazil/East",
+        )
+
+    with pytest.warns(UserWarning, match="could not be converted"):
+        flat_serial, errors_serial = Encounter.ingest_to_flat_df(mapped())
+        flat_parallel, errors_parallel = Encounter.ingest_to_flat_df(
+            mapped(), workers=2
+        )
+
+    assert_frame_equal(flat_parallel, flat_serial)
+    assert errors_parallel.index.tolist() == errors_serial.index.tolist() == [3]
+    assert errors_parallel["flat_dict"].tolist() == errors_serial["flat_dict"].tolist()
+    assert str(errors_parallel["validation_error"][3]) == str(
+        errors_serial["validation_error"][3]
+    )
+
+
+@pytest.mark.parametrize(
+    "resource, mapping, one_to_one",
+    [
+        (Encounter, "tests/dummy_data/encounter_dummy_mapping.csv", True),
+        (Observation, "tests/dummy_data/observation_dummy_mapping.csv", False),
+    ],
+)
+def test_ingest_to_flat_df_direct(resource, mapping, one_to_one):
+    def mapped():
+        df = create_dictionary(
+            "tests/dummy_data/combined_dummy_data.csv",
+            mapping,
+            resource.__name__,
+            one_to_one=one_to_one,
+            date_format="%Y-%m-%d",
+            timezone="Brazil/East",
+        )
+        return df if one_to_one else df.dropna().reset_index(drop=True)
+
+    flat_df, errors = resource.ingest_to_flat_df(mapped())
+    flat_direct, errors_direct = resource.ingest_to_flat_df(mapped(), direct=True)
+
+    assert errors is None and errors_direct is None
+    assert_frame_equal(flat_direct, flat_df)
+
+
 def test_convert_data_to_flat_local_mapping_errors():
     output_folder = "tests/ingestion_output_errors"
     mappings = {
@@ -1142,3 +1380,255 @@ def test_convert_data_to_flat_local_mapping_errors():
     )
 
     shutil.rmtree(output_folder)
+
+
+def test_convert_data_to_flat_parallel_matches_serial(capsys):
+    mappings = {
+        Encounter: "tests/dummy_data/encounter_dummy_mapping.csv",
+        Observation: "tests/dummy_data/observation_dummy_mapping.csv",
+    }
+    resource_types = {"Encounter": "one-to-one", "Observation": "one-to-many"}
+
+    for folder, jobs, workers in [
+        ("tests/ingestion_serial", 1, 1),
+        ("tests/ingestion_parallel", 2, 1),
+        ("tests/ingestion_workers", 1, 2),
+    ]:
+        with pytest.warns(UserWarning, match="could not be converted"):
+            convert_data_to_flat(
+                "tests/dummy_data/combined_dummy_data_error.csv",
+                folder_name=folder,
+                date_format="%Y-%m-%d",
+                timezone="Brazil/East",
+                mapping_files_types=(mappings, resource_types),
+                jobs=jobs,
+                workers=workers,
+            )
+        output = capsys.readouterr().out
+        assert output.index("Encounter took") < output.index("Observation took")
+
+    for folder in ["tests/ingestion_parallel", "tests/ingestion_workers"]:
+        for file in ["encounter_errors.csv", "sha256sums.txt"]:
+            assert (
+                Path(folder, file).read_text()
+                == Path("tests/ingestion_serial", file).read_text()
+            )
+
+    shutil.rmtree("tests/ingestion_serial")
+    shutil.rmtree("tests/ingestion_parallel")
+    shutil.rmtree("tests/ingestion_workers")
+
+
+def test_iter_subject_chunks():
+    data = pd.DataFrame({"subjid": [1, 1, 2, 3, 3, 3, 4], "value": range(7)})
+    chunks = list(
+        iter_subject_chunks(
+            (data.iloc[i : i + 2] for i in range(0, len(data), 2)), "subjid"
+        )
+    )
+
+    assert [c["subjid"].tolist() for c in chunks] == [[1, 1, 2], [3, 3, 3], [4]]
+    assert pd.concat(chunks)["value"].tolist() == list(range(7))
+
+
+def test_iter_subject_chunks_unsorted():
+    data = pd.DataFrame({"subjid": [1, 2, 1], "value": range(3)})
+    with pytest.raises(ValueError, match="Data must be sorted by subject"):
+        list(iter_subject_chunks([data.iloc[:2], data.iloc[2:]], "subjid"))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_convert_data_to_flat_chunked(jobs):
+    mappings = {
+        Encounter: "tests/dummy_data/encounter_dummy_mapping.csv",
+        Observation: "tests/dummy_data/observation_dummy_mapping.csv",
+    }
+    resource_types = {"Encounter": "one-to-one", "Observation": "one-to-many"}
+
+    for folder, chunksize in [
+        ("tests/ingestion_full", None),
+        ("tests/ingestion_chunked", 1),
+    ]:
+        with pytest.warns(UserWarning, match="could not be converted"):
+            convert_data_to_flat(
+                "tests/dummy_data/combined_dummy_data_error.csv",
+                folder_name=folder,
+                date_format="%Y-%m-%d",
+                timezone="Brazil/East",
+                mapping_files_types=(mappings, resource_types),
+                jobs=jobs,
+                chunksize=chunksize,
+            )
+
+    def rows(df):
+        # one-to-many rows are written chunk by chunk rather than column by column
+        df = df[sorted(df.columns)].astype(str)
+        return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+    for resource in ["encounter", "observation"]:
+        chunked = pd.read_parquet(f"tests/ingestion_chunked/{resource}.parquet")
+        full = pd.read_parquet(f"tests/ingestion_full/{resource}.parquet")
+        assert_frame_equal(rows(chunked), rows(full))
+        # rows dropped for validation errors don't leave an index to be stored
+        assert (
+            pq.read_schema(f"tests/ingestion_full/{resource}.parquet").names
+            == pq.read_schema(f"tests/ingestion_chunked/{resource}.parquet").names
+        )
+
+    # one row group per chunk with observations
+    observations = pq.ParquetFile("tests/ingestion_chunked/observation.parquet")
+    assert observations.num_row_groups == 3
+    assert (
+        Path("tests/ingestion_chunked/encounter_errors.csv").read_text()
+        == Path("tests/ingestion_full/encounter_errors.csv").read_text()
+    )
+
+    shutil.rmtree("tests/ingestion_full")
+    shutil.rmtree("tests/ingestion_chunked")
+
+
+def test_convert_data_to_flat_chunked_unsorted(tmp_path):
+    # only one-to-one resources need the rows of each subject to be together
+    data = pd.read_csv("tests/dummy_data/combined_dummy_data.csv")
+    data.iloc[[0, 1, 2, 3, 0]].to_csv(tmp_path / "unsorted.csv", index=False)
+
+    for folder, chunksize in [("full", None), ("chunked", 1)]:
+        convert_data_to_flat(
+            str(tmp_path / "unsorted.csv"),
+            folder_name=str(tmp_path / folder),
+            date_format="%Y-%m-%d",
+            timezone="Brazil/East",
+            mapping_files_types=(
+                {Observation: "tests/dummy_data/observation_dummy_mapping.csv"},
+                {"Observation": "one-to-many"},
+            ),
+            chunksize=chunksize,
+        )
+
+    chunked = pd.read_parquet(tmp_path / "chunked" / "observation.parquet")
+    full = pd.read_parquet(tmp_path / "full" / "observation.parquet")
+    assert len(chunked) == len(full) > 33
+
+
+@pytest.mark.parametrize("chunksize", [None, 2])
+def test_convert_data_to_flat_parquet_options(chunksize):
+    mappings = {
+        Encounter: "tests/dummy_data/encounter_dummy_mapping.csv",
+        Observation: "tests/dummy_data/observation_dummy_mapping.csv",
+    }
+    resource_types = {"Encounter": "one-to-one", "Observation": "one-to-many"}
+
+    convert_data_to_flat(
+        "tests/dummy_data/combined_dummy_data.csv",
+        folder_name="tests/ingestion_options",
+        date_format="%Y-%m-%d",
+        timezone="Brazil/East",
+        mapping_files_types=(mappings, resource_types),
+        chunksize=chunksize,
+        parquet_options=ParquetOptions(
+            compression="gzip",
+            row_group_size=5,
+            dictionary_columns=["subject"],
+            statistics=False,
+        ),
+    )
+
+    observations = pq.ParquetFile("tests/ingestion_options/observation.parquet")
+    metadata = observations.metadata
+    assert observations.num_row_groups > 1
+    assert all(
+        metadata.row_group(i).num_rows <= 5 for i in range(metadata.num_row_groups)
+    )
+    subject = observations.schema_arrow.get_field_index("subject")
+    column = metadata.row_group(0).column(subject)
+    assert column.compression == "GZIP"
+    assert "RLE_DICTIONARY" in column.encodings
+    assert not column.is_stats_set
+    assert len(pd.read_parquet("tests/ingestion_options/observation.parquet")) == 33
+
+    shutil.rmtree("tests/ingestion_options")
+
+
+@pytest.mark.parametrize("chunksize", [None, 2])
+def test_convert_data_to_flat_partitioned(chunksize):
+    mappings = {
+        Encounter: "tests/dummy_data/encounter_dummy_mapping.csv",
+        Observation: "tests/dummy_data/observation_dummy_mapping.csv",
+    }
+    resource_types = {"Encounter": "one-to-one", "Observation": "one-to-many"}
+
+    for folder, partition_by in [
+        ("tests/ingestion_single", None),
+        ("tests/ingestion_partitioned", {"Observation": ["year(effectiveDateTime)"]}),
+    ]:
+        convert_data_to_flat(
+            "tests/dummy_data/combined_dummy_data.csv",
+            folder_name=folder,
+            date_format="%Y-%m-%d",
+            timezone="Brazil/East",
+            mapping_files_types=(mappings, resource_types),
+            chunksize=chunksize,
+            partition_by=partition_by,
+        )
+
+    folder = Path("tests/ingestion_partitioned")
+    assert sorted(os.listdir(folder / "observation")) == [
+        "year=2020",
+        "year=2021",
+        "year=2022",
+    ]
+    assert not (folder / "observation.parquet").exists()
+
+    def rows(df):
+        df = df[sorted(df.columns)].astype(str)
+        return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+    partitioned = pd.read_parquet(folder / "observation").drop(columns="year")
+    single = pd.read_parquet("tests/ingestion_single/observation.parquet")
+    assert_frame_equal(rows(partitioned), rows(single))
+
+    # every file of the partitions is in the checksums, by its relative path
+    checksums = dict(
+        reversed(line.split("  "))
+        for line in (folder / "sha256sums.txt").read_text().splitlines()
+    )
+    files = sorted(
+        p.relative_to(folder).as_posix() for p in folder.glob("**/*.parquet")
+    )
+    assert sorted(checksums) == files
+    assert "encounter.parquet" in checksums
+    assert "observation/year=2020/part-0.parquet" in checksums
+    assert all(checksum(folder / f) == checksums[f] for f in files)
+
+    shutil.rmtree("tests/ingestion_single")
+    shutil.rmtree("tests/ingestion_partitioned")
+
+
+def test_convert_data_to_flat_partition_unmapped():
+    with pytest.raises(ValueError, match="Can't partition Condition"):
+        convert_data_to_flat(
+            "tests/dummy_data/combined_dummy_data.csv",
+            folder_name="tests/ingestion_unmapped",
+            date_format="%Y-%m-%d",
+            timezone="Brazil/East",
+            mapping_files_types=(
+                {Encounter: "tests/dummy_data/encounter_dummy_mapping.csv"},
+                {"Encounter": "one-to-one"},
+            ),
+            partition_by={"Condition": ["site(subject)"]},
+        )
+    shutil.rmtree("tests/ingestion_unmapped")
+
+
+def test_generate_metadata_partitioned_patient(tmp_path):
+    write_flat(
+        pd.DataFrame({"id": ["ABC-1", "ABC-2", "DEF-1"], "gender": ["male"] * 3}),
+        str(tmp_path / "patient"),
+        partitioning=Partitioning(["site=site(id)"]),
+    )
+    metadata, checksums = generate_metadata(str(tmp_path))
+    assert metadata["N"] == 3
+    assert sorted(checksums) == [
+        "patient/site=ABC/part-0.parquet",
+        "patient/site=DEF/part-0.parquet",
+    ]
@@ -0,0 +1,185 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import fhirflat
+from fhirflat.ingest import convert_data_to_flat
+from fhirflat.join import parse_references
+from fhirflat.resources import Encounter, Observation, Patient
+from fhirflat.writer import write_flat
+
+
+@pytest.fixture(scope="module")
+def folder(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("join") / "fhirflat_output"
+    convert_data_to_flat(
+        "tests/dummy_data/combined_dummy_data.csv",
+        folder_name=str(folder),
+        date_format="%Y-%m-%d",
+        timezone="Brazil/East",
+        mapping_files_types=(
+            {
+                Encounter: "tests/dummy_data/encounter_dummy_mapping.csv",
+                Observation: "tests/dummy_data/observation_dummy_mapping.csv",
+            },
+            {"Encounter": "one-to-one", "Observation": "one-to-many"},
+        ),
+        partition_by={"Observation": ["year(effectiveDateTime)"]},
+    )
+    write_flat(
+        pd.DataFrame(
+            {
+                "resourceType": "Patient",
+                "id": ["1", "2", "3", "4", "5"],
+                "gender": ["female", "male", "female", "male", "female"],
+            }
+        ),
+        str(folder / "patient.parquet"),
+    )
+    return str(folder)
+
+
+def test_parse_references():
+    keys = parse_references(
+        pa.array(["Patient/1", "Encounter/a-b.2", None, "1", "http://x.org/Patient/1"])
+    )
+    assert keys.column("resourceType").to_pylist() == [
+        "Patient",
+        "Encounter",
+        None,
+        None,
+        None,
+    ]
+    assert keys.column("id").to_pylist() == ["1", "a-b.2", None, None, None]
+    assert pa.types.is_dictionary(keys.column("resourceType").type)
+
+
+def test_join_flat(folder):
+    df = fhirflat.join_flat(
+        folder,
+        Observation,
+        on=["encounter", "subject"],
+        columns=["code.code", "valueQuantity.value"],
+        referenced_columns={
+            "encounter": ["actualPeriod.start", "subject"],
+            "subject": ["gender"],
+        },
+    )
+    assert len(df) == 33
+    assert list(df.columns) == [
+        "code.code",
+        "valueQuantity.value",
+        "encounter",
+        "subject",
+        "encounter.actualPeriod.start",
+        "encounter.subject",
+        "subject.gender",
+    ]
+    assert (df["encounter.subject"] == df["subject"]).all()
+    assert df.set_index("subject")["subject.gender"].to_dict() == {
+        "Patient/1": "female",
+        "Patient/2": "male",
+        "Patient/3": "female",
+    }
+
+
+def test_join_flat_inner(folder):
+    # the encounter of patient 4 has no observations, and patient 5 no encounter
+    encounters = fhirflat.join_flat(
+        folder, "Encounter", "subject", referenced_columns={"subject": ["gender"]}
+    )
+    assert len(encounters) == 4
+
+    table = fhirflat.join_flat(
+        folder,
+        "Observation",
+        "encounter",
+        filters=[("year", "==", 2021)],
+        how="inner",
+        to_pandas=False,
+    )
+    assert table.num_rows == 12
+    assert set(table.column("encounter.id").to_pylist()) == {"11"}
+
+
+def test_join_flat_no_references(folder, tmp_path):
+    df = fhirflat.join_flat(
+        folder,
+        Observation,
+        ["encounter", "subject"],
+        columns=["code.code"],
+        referenced_columns={"encounter": ["actualPeriod.start"]},
+        filters=[("subject", "==", "Patient/999")],
+    )
+    assert df.empty
+    assert list(df.columns) == [
+        "code.code",
+        "encounter",
+        "subject",
+        "encounter.actualPeriod.start",
+    ]
+
+    write_flat(
+        pd.DataFrame({"id": ["1", "2"], "encounter": [None, None]}),
+        str(tmp_path / "observation.parquet"),
+    )
+    df = fhirflat.join_flat(
+        str(tmp_path),
+        "Observation",
+        "encounter",
+        referenced_columns={"encounter": ["status"]},
+    )
+    assert df["encounter.status"].isna().all()
+    inner = fhirflat.join_flat(str(tmp_path), "Observation", "encounter", how="inner")
+    assert inner.empty
+
+    pd.DataFrame({"id": ["1"], "subject": ["Patient/1"]}, index=[4]).to_parquet(
+        tmp_path / "encounter.parquet"
+    )
+    pd.DataFrame({"encounter": ["Encounter/1"]}, index=[7]).to_parquet(
+        tmp_path / "observation.parquet"
+    )
+    df = fhirflat.join_flat(str(tmp_path), "Observation", "encounter")
+    assert list(df.columns) == ["encounter", "encounter.id", "encounter.subject"]
+
+
+def test_join_flat_mixed_references(tmp_path):
+    write_flat(
+        pd.DataFrame({"id": ["1"], "subject": ["Patient/1"]}),
+        str(tmp_path / "encounter.parquet"),
+    )
+    write_flat(
+        pd.DataFrame({"subject": ["Patient/1", "Group/1"]}),
+        str(tmp_path / "observation.parquet"),
+    )
+    with pytest.raises(ValueError, match="refers to 2 resource types"):
+        fhirflat.join_flat(str(tmp_path), "Observation", "subject")
+    with pytest.raises(ValueError, match="Unknown join outer"):
+        fhirflat.join_flat(str(tmp_path), "Observation", "subject", how="outer")
+    with pytest.raises(ValueError, match="At least one reference column"):
+        fhirflat.join_flat(str(tmp_path), "Observation", [], how="inner")
+
+
+def test_iter_subjects(folder):
+    batches = list(
+        fhirflat.iter_subjects(
+            folder,
+            [Patient, Encounter, Observation],
+            columns={"Observation": ["code.code"], "Encounter": []},
+            batch_size=2,
+        )
+    )
+    assert len(batches) == 3
+    assert [sorted(b["Patient"].id) for b in batches] == [
+        ["1", "2"],
+        ["3", "4"],
+        ["5"],
+    ]
+    first = batches[0]
+    assert list(first["Encounter"].columns) == ["subject"]
+    assert list(first["Observation"].columns) == ["subject", "code.code"]
+    assert first["Observation"].subject.is_monotonic_increasing
+    assert len(first["Observation"]) == 23
+    assert batches[1]["Encounter"].subject.tolist() == ["Patient/3", "Patient/4"]
+    assert batches[2]["Encounter"].empty
+    assert sum(len(b["Observation"]) for b in batches) == 33
@@ -2,7 +2,6 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
 from fhirflat.resources.medicationadministration import MedicationAdministration
-import datetime
 
 MEDS_DICT_INPUT = {
     "resourceType": "MedicationAdministration",
@@ -89,12 +88,8 @@ MEDS_FLAT = {
     "partOf": "Medication/med0305",
     "subject": "Patient/pat1",
     "encounter": "Encounter/f001",
-    "occurencePeriod.start": datetime.datetime(
-        2015, 1, 15, 4, 30, tzinfo=datetime.timezone(datetime.timedelta(minutes=60))
-    ),
-    "occurencePeriod.end": datetime.datetime(
-        2015, 1, 15, 14, 30, tzinfo=datetime.timezone(datetime.timedelta(minutes=60))
-    ),
+    "occurencePeriod.start": "2015-01-15T04:30:00+01:00",
+    "occurencePeriod.end": "2015-01-15T14:30:00+01:00",
     "request": "MedicationRequest/medrx0302",
     "dosage.text": "Two tablets at once",
     "dosage.route.code": "http://snomed.info/sct|26643006",
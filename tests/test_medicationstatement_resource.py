@@ -2,7 +2,6 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
 from fhirflat.resources.medicationstatement import MedicationStatement
-import datetime
 
 MEDS_DICT_INPUT = {
     "resourceType": "MedicationStatement",
@@ -79,8 +78,8 @@ MEDS_DICT_INPUT = {
 
 MEDS_FLAT = {
     "resourceType": "MedicationStatement",
-    "effectiveDateTime": datetime.date(2014, 1, 23),
-    "dateAsserted": datetime.date(2015, 2, 22),
+    "effectiveDateTime": "2014-01-23",
+    "dateAsserted": "2015-02-22",
     "dosage.text": "one capsule three times daily",
     "dosage.asNeeded": False,
     "dosage.maxDosePerPeriod.numerator.value": 3,
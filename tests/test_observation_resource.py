@@ -2,7 +2,6 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
 from fhirflat.resources.observation import Observation
-import datetime
 
 # TODO: extra observation with a single component for travel.
 
@@ -147,8 +146,8 @@ OBSERVATION_FLAT = {
     "resourceType": "Observation",
     "category.code": "http://terminology.hl7.org/CodeSystem/observation-category|vital-signs",  # noqa: E501
     "category.text": "Vital Signs",
-    "effectiveDateTime": datetime.date(2012, 9, 17),
-    "_effectiveDateTime.relativeDay": 2.0,
+    "effectiveDateTime": "2012-09-17",
+    "_effectiveDateTime.relativeDay": 2,
     "_effectiveDateTime.approximateDate": "2012-09",
     "extension.timingPhase.code": "http://snomed.info/sct|278307001",
     "extension.timingPhase.text": "on admission",
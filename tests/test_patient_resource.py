@@ -1,7 +1,10 @@
+import json
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pandas.testing import assert_frame_equal
 import os
-import datetime
 from fhirflat.resources.patient import Patient
 import pytest
 
@@ -28,9 +31,10 @@ def test_patient_to_flat():
 
     patient.to_flat("test_patient.parquet")
 
+    # dates are now stored as ISO strings
     assert_frame_equal(
         pd.read_parquet("test_patient.parquet"),
-        pd.read_parquet("tests/data/patient_flat.parquet"),
+        pd.read_parquet("tests/data/patient_flat.parquet").astype({"birthDate": str}),
     )
     os.remove("test_patient.parquet")
 
@@ -67,9 +71,9 @@ patient_ndjson_out = {
     ],
     "gender": ["female", "female", "male"],
     "birthDate": [
-        datetime.date(2006, 10, 7),
-        datetime.date(2019, 9, 21),
-        datetime.date(1967, 1, 19),
+        "2006-10-07",
+        "2019-09-21",
+        "1967-01-19",
     ],
     "deceasedBoolean": [False, False, False],
     "maritalStatus.text": ["Single", "Single", "Single"],
@@ -87,6 +91,67 @@ def test_bulk_fhir_to_flat_patient():
     os.remove("multi_patient_output.parquet")
 
 
+def test_bulk_fhir_to_flat_patient_batches():
+    Patient.fhir_file_to_flat(
+        "tests/data/patient.ndjson", "multi_patient_output.parquet", batch_size=2
+    )
+
+    assert pq.ParquetFile("multi_patient_output.parquet").num_row_groups == 2
+    df = pd.read_parquet("multi_patient_output.parquet")
+    assert_frame_equal(pd.DataFrame(patient_ndjson_out), df)
+    os.remove("multi_patient_output.parquet")
+
+
+@pytest.mark.parametrize("batch_size", [1, 3])
+def test_bulk_fhir_to_flat_partial_dates(tmp_path, batch_size):
+    source = tmp_path / "patient.ndjson"
+    source.write_text(
+        "".join(
+            json.dumps({"resourceType": "Patient", "id": str(i), "birthDate": date})
+            + "\n"
+            for i, date in enumerate(["1990", "1990-01-02", "1990-05"])
+        )
+    )
+    output = str(tmp_path / "patient.parquet")
+    Patient.fhir_file_to_flat(str(source), output, batch_size=batch_size)
+
+    assert pq.read_schema(output).field("birthDate").type == pa.string()
+    assert pd.read_parquet(output)["birthDate"].tolist() == [
+        "1990",
+        "1990-01-02",
+        "1990-05",
+    ]
+
+
+def test_bulk_fhir_import_batches_patient():
+    batches = list(
+        Patient.fhir_bulk_import_batches("tests/data/patient.ndjson", batch_size=2)
+    )
+
+    assert [len(b) for b in batches] == [2, 1]
+    assert [p.id for b in batches for p in b] == patient_ndjson_out["id"]
+
+
+def test_bulk_fhir_import_patient_workers():
+    patients = Patient.fhir_bulk_import("tests/data/patient.ndjson", workers=2)
+
+    assert patients == Patient.fhir_bulk_import("tests/data/patient.ndjson")
+
+
+def test_bulk_fhir_to_flat_patient_workers():
+    Patient.fhir_file_to_flat(
+        "tests/data/patient.ndjson",
+        "multi_patient_output.parquet",
+        batch_size=2,
+        workers=2,
+    )
+
+    assert pq.ParquetFile("multi_patient_output.parquet").num_row_groups == 2
+    df = pd.read_parquet("multi_patient_output.parquet")
+    assert_frame_equal(pd.DataFrame(patient_ndjson_out), df)
+    os.remove("multi_patient_output.parquet")
+
+
 PATIENT_EXT_DICT_INPUT = {
     "id": "f001",
     "active": True,
@@ -157,6 +222,15 @@ def test_patient_with_extensions_to_flat():
     os.remove("test_patient_ext.parquet")
 
 
+def test_patient_with_extensions_to_flat_dict():
+    flat = Patient(**PATIENT_EXT_DICT_INPUT).to_flat_dict()
+
+    assert_frame_equal(
+        pd.DataFrame([flat]),
+        pd.DataFrame([Patient(**PATIENT_EXT_DICT_INPUT).to_flat()]),
+    )
+
+
 def test_patient_with_extensions_from_flat():
     patient = Patient(**PATIENT_EXT_DICT_OUT)
 
@@ -2,7 +2,6 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
 from fhirflat.resources.procedure import Procedure
-import datetime
 import pytest
 
 PROCEDURE_DICT_INPUT = {
@@ -86,12 +85,8 @@ PROCEDURE_FLAT = {
     "code.text": "Chemotherapy",
     "subject": "Patient/f201",
     "encounter": "Encounter/f202",
-    "occurrencePeriod.start": datetime.datetime(
-        2013, 1, 28, 13, 31, tzinfo=datetime.timezone(datetime.timedelta(minutes=60))
-    ),
-    "occurrencePeriod.end": datetime.datetime(
-        2013, 1, 28, 14, 27, tzinfo=datetime.timezone(datetime.timedelta(minutes=60))
-    ),
+    "occurrencePeriod.start": "2013-01-28T13:31:00+01:00",
+    "occurrencePeriod.end": "2013-01-28T14:27:00+01:00",
 }
 
 PROCEDURE_DICT_OUT = {
@@ -0,0 +1,110 @@
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+import fhirflat
+from fhirflat.ingest import convert_data_to_flat
+from fhirflat.reader import flat_dataset, read_metadata
+from fhirflat.resources import Encounter, Observation
+from fhirflat.writer import ParquetOptions
+
+
+@pytest.fixture(scope="module")
+def folder(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("reader") / "fhirflat_output"
+    convert_data_to_flat(
+        "tests/dummy_data/combined_dummy_data.csv",
+        folder_name=str(folder),
+        date_format="%Y-%m-%d",
+        timezone="Brazil/East",
+        mapping_files_types=(
+            {
+                Encounter: "tests/dummy_data/encounter_dummy_mapping.csv",
+                Observation: "tests/dummy_data/observation_dummy_mapping.csv",
+            },
+            {"Encounter": "one-to-one", "Observation": "one-to-many"},
+        ),
+        parquet_options=ParquetOptions(row_group_size=1),
+        partition_by={"Observation": ["year(effectiveDateTime)"]},
+    )
+    return str(folder)
+
+
+def test_read_metadata(folder):
+    metadata = read_metadata(folder)
+    # no patient file was written
+    assert metadata["N"] == "NA"
+    assert metadata["checksum_file"] == "sha256sums.txt"
+
+
+def test_read_flat_columns_filters(folder):
+    df = fhirflat.read_flat(
+        folder,
+        Encounter,
+        columns=["subject", "actualPeriod.start"],
+        filters=[("subject", "in", ["Patient/2", "Patient/3"])],
+    )
+    assert list(df.columns) == ["subject", "actualPeriod.start"]
+    assert sorted(df.subject) == ["Patient/2", "Patient/3"]
+    assert df.index.tolist() == [0, 1]
+
+
+def test_read_flat_skips_row_groups(folder):
+    fragment = next(flat_dataset(folder, "encounter").get_fragments())
+    assert fragment.num_row_groups == 4
+    # the statistics of the other row groups show they have no matching rows
+    assert len(fragment.split_by_row_group(ds.field("subject") == "Patient/2")) == 1
+
+
+def test_read_flat_partitioned(folder):
+    table = fhirflat.read_flat(
+        folder,
+        "observation",
+        columns=["subject", "year", "valueQuantity.value"],
+        filters=ds.field("year") == 2021,
+        to_pandas=False,
+    )
+    assert isinstance(table, pa.Table)
+    assert table.num_rows == 12
+    assert set(table.column("subject").to_pylist()) == {"Patient/2"}
+    assert set(table.column("year").to_pylist()) == {2021}
+
+    dataset = flat_dataset(folder, Observation)
+    assert len(dataset.files) == 3
+    assert len(list(dataset.get_fragments(filter=ds.field("year") == 2021))) == 1
+
+
+def test_read_flat_verify(folder, tmp_path):
+    df = fhirflat.read_flat(folder, "Observation", verify=True)
+    assert len(df) == 33
+
+    # a copy of the folder whose encounter file was changed after it was written
+    changed = tmp_path / "changed"
+    changed.mkdir()
+    for name in ["fhirflat.toml", "sha256sums.txt"]:
+        (changed / name).write_bytes((Path(folder) / name).read_bytes())
+    fhirflat.read_flat(folder, "encounter").iloc[:1].to_parquet(
+        changed / "encounter.parquet"
+    )
+    with pytest.raises(ValueError, match=r"Checksum of encounter\.parquet"):
+        fhirflat.read_flat(str(changed), "encounter", verify=True)
+
+
+def test_read_flat_drops_index(tmp_path):
+    # files written from a DataFrame with a non-range index store it as a column
+    pd.DataFrame({"id": ["1", "2"]}, index=[3, 5]).to_parquet(
+        tmp_path / "patient.parquet"
+    )
+    df = fhirflat.read_flat(str(tmp_path), "Patient")
+    assert list(df.columns) == ["id"]
+    assert df.index.tolist() == [0, 1]
+    table = fhirflat.read_flat(str(tmp_path), "Patient", to_pandas=False)
+    assert table.column_names == ["id"]
+
+
+def test_read_flat_missing_resource(folder):
+    with pytest.raises(FileNotFoundError, match="No FHIRflat file for Condition"):
+        fhirflat.read_flat(folder, "Condition")
@@ -2,7 +2,6 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
 from fhirflat.resources.researchsubject import ResearchSubject
-import datetime
 
 SUBJECT_DICT_INPUT = {
     "resourceType": "ResearchSubject",
@@ -45,7 +44,7 @@ SUBJECT_DICT_INPUT = {
 
 SUBJECT_FLAT = {
     "resourceType": "ResearchSubject",
-    "progress.startDate": datetime.date(2022, 6, 10),
+    "progress.startDate": "2022-06-10",
     "progress.type.code": "http://terminology.hl7.org/CodeSystem/research-subject-state-type|Enrollment",  # noqa:E501
     "progress.type.text": "Enrollment status",
     "progress.subjectState.code": "http://terminology.hl7.org/CodeSystem/research-subject-state|on-study",  # noqa:E501
@@ -54,7 +53,7 @@ SUBJECT_FLAT = {
     "progress.reason.text": "Informed consent signed",
     "assignedComparisonGroup": "placebo",
     "actualComparisonGroup": "ap303",
-    "period.start": datetime.date(2022, 6, 10),
+    "period.start": "2022-06-10",
     "study": "ResearchStudy/example-ctgov-study-record",
     "subject": "Patient/cfsb1676546565857",
 }
@@ -2,7 +2,6 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
 from fhirflat.resources.specimen import Specimen
-import datetime
 
 SPECIMEN_DICT_INPUT = {
     "resourceType": "Specimen",
@@ -57,7 +56,7 @@ SPECIMEN_DICT_INPUT = {
 
 SPECIMEN_FLAT = {
     "resourceType": "Specimen",
-    "receivedTime": datetime.datetime(2011, 3, 4, 7, 3),
+    "receivedTime": "2011-03-04T07:03:00+00:00",
     "request": "ServiceRequest/example",
     "container.device": "Device/device-example-specimen-container-green-gel-vacutainer",  # noqa:E501
     "container.specimenQuantity.value": 3,
@@ -66,7 +65,7 @@ SPECIMEN_FLAT = {
     "type.text": "Venous blood specimen",
     "subject": "Patient/example",
     "collection.collector": "Practitioner/example",
-    "collection.collectedDateTime": datetime.datetime(2011, 5, 30, 6, 15),
+    "collection.collectedDateTime": "2011-05-30T06:15:00+00:00",
     "collection.quantity.value": 6,
     "collection.quantity.unit": "mL",
     "collection.method.code": "http://terminology.hl7.org/CodeSystem/v2-0488|LNV",
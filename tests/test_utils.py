@@ -6,6 +6,7 @@ from fhirflat.util import (
     get_fhirtype,
     get_local_extension_type,
     get_local_resource,
+    preload_fhirtypes,
 )
 from fhir.resources.quantity import Quantity
 from fhir.resources.codeableconcept import CodeableConcept
@@ -68,6 +69,19 @@ def test_get_fhirtype_raises():
         get_fhirtype("NotARealType")
 
 
+def test_get_fhirtype_cached(monkeypatch):
+    preload_fhirtypes()
+    assert fhirflat.util._fhirtypes["CodeableConcept"] is CodeableConcept
+
+    def fail(t):
+        raise AssertionError(f"{t} was looked up again")
+
+    monkeypatch.setattr(fhirflat.util, "_find_fhirtype", fail)
+    assert get_fhirtype("Quantity") is Quantity
+    with pytest.raises(AttributeError, match="Could not find string"):
+        get_fhirtype("string")
+
+
 def test_get_local_extension_type_raises():
     with pytest.raises(
         AttributeError, match="Could not find NotARealType in fhirflat extensions"
@@ -0,0 +1,269 @@
+import datetime
+import os
+
+from decimal import Decimal
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+from fhirflat.resources import Patient
+from fhirflat.writer import FlatWriter, ParquetOptions, Partitioning, write_flat
+
+
+def test_flat_writer_unifies_chunks(tmp_path):
+    path = str(tmp_path / "observation.parquet")
+    with FlatWriter(path) as writer:
+        writer.write(pd.DataFrame({"id": ["1", "2"], "valueInteger": [None, None]}))
+        writer.write(pd.DataFrame())
+        writer.write(
+            pd.DataFrame(
+                {"id": ["3"], "valueInteger": [7], "code.code": [["loinc|8867-4"]]}
+            )
+        )
+
+    assert writer.num_rows == 3
+    assert pq.ParquetFile(path).num_row_groups == 2
+    df = pd.read_parquet(path)
+    assert df["id"].tolist() == ["1", "2", "3"]
+    assert df["valueInteger"].tolist()[2] == 7
+    assert df["code.code"].isna().tolist()[:2] == [True, True]
+    # only the final file is left behind
+    assert os.listdir(tmp_path) == ["observation.parquet"]
+
+
+def test_flat_writer_writes_fitting_chunks_directly(tmp_path, monkeypatch):
+    spilled = []
+    monkeypatch.setattr(FlatWriter, "_spill", lambda *args: spilled.append(args))
+    path = str(tmp_path / "observation.parquet")
+    with FlatWriter(path) as writer:
+        writer.write(pd.DataFrame({"id": ["1"], "valueInteger": [5]}))
+        writer.write(pd.DataFrame({"id": ["2"], "valueInteger": [None]}))
+        writer.write(pd.DataFrame({"id": ["3"]}))
+
+    assert spilled == []
+    assert pq.ParquetFile(path).num_row_groups == 3
+    assert pd.read_parquet(path)["valueInteger"].tolist()[0] == 5
+    assert os.listdir(tmp_path) == ["observation.parquet"]
+
+
+def test_flat_writer_mixed_timezones(tmp_path):
+    path = str(tmp_path / "encounter.parquet")
+    with FlatWriter(path) as writer:
+        for tz in [
+            datetime.timezone.utc,
+            datetime.timezone(datetime.timedelta(hours=1)),
+        ]:
+            start = datetime.datetime(2020, 1, 1, 12, tzinfo=tz)
+            writer.write(pd.DataFrame({"actualPeriod.start": [start]}))
+
+    times = pd.read_parquet(path)["actualPeriod.start"]
+    assert str(times.dt.tz) == "UTC"
+    assert times.dt.hour.tolist() == [12, 11]
+
+
+def test_flat_writer_resource_types(tmp_path):
+    path = str(tmp_path / "patient.parquet")
+    with FlatWriter(path, Patient) as writer:
+        writer.write(
+            pd.DataFrame(
+                {
+                    "extension.age.value": [Decimal("16"), Decimal("3.5")],
+                    "extension.birthSex.code": [[], []],
+                    "gender": [None, None],
+                }
+            )
+        )
+        writer.write(
+            pd.DataFrame(
+                {
+                    "extension.age.value": [Decimal("105")],
+                    "extension.birthSex.code": [["http://snomed.info/sct|248152002"]],
+                    "gender": ["female"],
+                }
+            )
+        )
+
+    file = pq.ParquetFile(path)
+    assert file.schema_arrow == pa.schema(
+        [
+            ("extension.age.value", pa.float64()),
+            ("extension.birthSex.code", pa.list_(pa.string())),
+            ("gender", pa.string()),
+        ]
+    )
+    # each chunk is stored with the same types
+    assert file.metadata.row_group(0).column(0).physical_type == "DOUBLE"
+    assert pd.read_parquet(path)["extension.age.value"].tolist() == [16, 3.5, 105]
+
+
+def test_flat_writer_rejects_values_of_another_type(tmp_path):
+    path = str(tmp_path / "patient.parquet")
+    with pytest.raises(ValueError, match="extension.age.value of type string"):
+        with FlatWriter(path, Patient) as writer:
+            writer.write(pd.DataFrame({"extension.age.value": ["old"]}))
+    assert os.listdir(tmp_path) == []
+
+
+def test_flat_writer_parquet_options(tmp_path):
+    path = str(tmp_path / "observation.parquet")
+    options = ParquetOptions(
+        compression="zstd",
+        compression_level=5,
+        row_group_size=2,
+        dictionary_columns=["code.code", "subject"],
+        statistics=False,
+    )
+    df = pd.DataFrame(
+        {
+            "code.code": [["http://loinc.org|8867-4"]] * 3,
+            "subject": ["Patient/1", "Patient/2", "Patient/1"],
+            "valueInteger": [1, 2, 3],
+        }
+    )
+    with FlatWriter(path, options=options) as writer:
+        writer.write(df)
+        writer.write(df.head(1))
+
+    metadata = pq.ParquetFile(path).metadata
+    # the first chunk is split into row groups of at most 2 rows
+    assert [metadata.row_group(i).num_rows for i in range(3)] == [2, 1, 1]
+    columns = metadata.row_group(0)
+    encodings = {
+        columns.column(i).path_in_schema: columns.column(i).encodings
+        for i in range(columns.num_columns)
+    }
+    assert "RLE_DICTIONARY" in encodings["code.code.list.element"]
+    assert "RLE_DICTIONARY" in encodings["subject"]
+    assert "RLE_DICTIONARY" not in encodings["valueInteger"]
+    assert all(columns.column(i).compression == "ZSTD" for i in range(3))
+    assert not any(columns.column(i).is_stats_set for i in range(3))
+    assert pd.read_parquet(path)["valueInteger"].tolist() == [1, 2, 3, 1]
+
+
+def test_parquet_options_unknown_codec():
+    with pytest.raises(ValueError, match="compression codec zip"):
+        ParquetOptions(compression="zip")
+
+
+def test_parquet_options_compression_level():
+    assert ParquetOptions(compression="zstd", compression_level=3)
+    with pytest.raises(ValueError, match="snappy doesn't support a compression"):
+        ParquetOptions(compression_level=3)
+
+
+def test_flat_writer_empty(tmp_path):
+    path = str(tmp_path / "observation.parquet")
+    with FlatWriter(path) as writer:
+        writer.write(pd.DataFrame())
+    assert not os.path.exists(path)
+
+
+def test_flat_writer_discards_on_error(tmp_path):
+    path = str(tmp_path / "observation.parquet")
+    with pytest.raises(RuntimeError):
+        with FlatWriter(path) as writer:
+            writer.write(pd.DataFrame({"id": ["1"]}))
+            raise RuntimeError
+    assert os.listdir(tmp_path) == []
+
+
+def test_partitioning_keys():
+    partitioning = Partitioning(
+        ["site(subject)", "y=year(effectiveDateTime)", "status"]
+    )
+    assert partitioning.keys == [
+        ("site", "subject", "site"),
+        ("y", "effectiveDateTime", "year"),
+        ("status", "status", None),
+    ]
+
+
+@pytest.mark.parametrize(
+    "keys,message",
+    [
+        ([], "at least one key"),
+        (["day(effectiveDateTime)"], "Unknown partition function day"),
+        (["site(subject)", "site=status"], "Duplicate partition key"),
+    ],
+)
+def test_partitioning_invalid(keys, message):
+    with pytest.raises(ValueError, match=message):
+        Partitioning(keys)
+
+
+def test_flat_writer_partitioned(tmp_path):
+    path = str(tmp_path / "observation")
+    os.makedirs(os.path.join(path, "site=OLD"))
+    partitioning = Partitioning(["site(subject)", "year(effectiveDateTime)", "status"])
+    with FlatWriter(path, partitioning=partitioning) as writer:
+        writer.write(
+            pd.DataFrame(
+                {
+                    "subject": ["Patient/ABC-1", "Patient/ABC-2"],
+                    "effectiveDateTime": ["2024-01-02", "2023-05"],
+                    "status": ["final", "final"],
+                }
+            )
+        )
+        writer.write(
+            pd.DataFrame(
+                {
+                    "subject": ["Patient/ABC-1", "Patient/7"],
+                    "effectiveDateTime": ["2024-03-04T10:00:00+00:00", None],
+                    "status": ["final", "entered in error"],
+                    "valueInteger": [3, 4],
+                }
+            )
+        )
+
+    files = sorted(
+        os.path.relpath(os.path.join(root, f), path)
+        for root, _, names in os.walk(path)
+        for f in names
+    )
+    assert files == [
+        "site=ABC/year=2023/status=final/part-0.parquet",
+        "site=ABC/year=2024/status=final/part-0.parquet",
+        "site=ABC/year=2024/status=final/part-1.parquet",
+        "site=__HIVE_DEFAULT_PARTITION__/year=__HIVE_DEFAULT_PARTITION__/"
+        "status=entered%20in%20error/part-1.parquet",
+    ]
+    # the status column is only in the folder names, and all files have one schema
+    schema = pq.read_schema(os.path.join(path, files[0]))
+    assert schema.names == ["subject", "effectiveDateTime", "valueInteger"]
+    assert all(pq.read_schema(os.path.join(path, f)) == schema for f in files)
+
+    table = ds.dataset(path, partitioning="hive").to_table()
+    df = table.to_pandas().sort_values("subject")
+    assert df["subject"].tolist() == [
+        "Patient/7",
+        "Patient/ABC-1",
+        "Patient/ABC-1",
+        "Patient/ABC-2",
+    ]
+    assert df["status"].tolist()[0] == "entered in error"
+    assert df["site"].tolist()[0] is None
+
+
+def test_write_flat_partitioned(tmp_path):
+    df = pd.DataFrame(
+        {
+            "subject": ["Patient/ABC-1", "Patient/DEF-1"],
+            "actualPeriod.start": pd.to_datetime(["2021-04-01", "2021-05-01"]),
+        }
+    )
+    write_flat(
+        df, str(tmp_path / "encounter"), partitioning=Partitioning(["site(subject)"])
+    )
+    assert sorted(os.listdir(tmp_path / "encounter")) == ["site=ABC", "site=DEF"]
+    assert os.listdir(tmp_path / "encounter" / "site=DEF") == ["part-0.parquet"]
+
+    with pytest.raises(ValueError, match="site is also a FHIRflat column"):
+        write_flat(
+            df.assign(site="ABC"),
+            str(tmp_path / "encounter"),
+            partitioning=Partitioning(["site(subject)"]),
+        )